@@ -0,0 +1 @@
+# keeps the repository root on sys.path so templates can import ovc_utils
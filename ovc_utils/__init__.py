@@ -0,0 +1,6 @@
+"""
+Helpers shared by the OpenvCloud templates running in one 0-robot.
+
+Everything here keeps robot-wide state at module level, so all services
+created from these templates in the same robot process share it.
+"""
@@ -0,0 +1,360 @@
+"""
+Throughput benchmark of the template actions against the OpenvCloud simulator.
+
+The benchmark loads the templates of this repository, creates a hierarchy of
+openvcloud/account/vdc/node services (nodes create their disk services on
+install) and drives the standard action sequences: install, get_info and
+monitor and uninstall. Services are run in-process, every scheduled action is timed and
+the OVC API calls are counted by the simulator.
+
+    python -m ovc_utils.benchmark --accounts 2 --vdcs 2 --nodes 10 \\
+        --latency 0.01 --output result.json --compare baseline.json
+
+The result is a JSON document with the latency percentiles per
+`<template>.<action>`, the OVC API calls per endpoint, the number of
+actions per second and the memory held by the services per template. With --compare the result is checked against an earlier
+one and the command fails if an action got slower or makes more OVC calls.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import gevent
+from gevent.lock import Semaphore
+
+from zerorobot import config, template_collection
+from zerorobot.service_collection import ServiceNotFoundError
+
+from ovc_utils.simulator import Simulator
+from ovc_utils.concurrency import bounded_map, DEFAULT_CONCURRENCY
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.inventory import disk_inventory
+from ovc_utils.monitor import listings
+from ovc_utils.footprint import usage
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+TEMPLATES_URL = 'https://github.com/openvcloud/0-templates'
+TEMPLATES = ['openvcloud', 'account', 'vdc', 'node', 'disk', 'sshkey']
+
+PERCENTILES = (50, 90, 99)
+# relative increase of a latency percentile reported as a regression
+THRESHOLD = 0.2
+
+
+def template_name(template_uid):
+    """ Return name of the template from @template_uid """
+    return str(template_uid).rstrip('/').split('/')[-2]
+
+
+class Task:
+    """ Result of an action scheduled on a local service """
+
+    def __init__(self, greenlet):
+        self._greenlet = greenlet
+
+    @property
+    def state(self):
+        if not self._greenlet.ready():
+            return 'running'
+        return 'ok' if self._greenlet.successful() else 'error'
+
+    @property
+    def result(self):
+        return self._greenlet.value
+
+    @property
+    def eco(self):
+        return self._greenlet.exception
+
+    def wait(self, timeout=None, die=False):
+        self._greenlet.join(timeout=timeout)
+        if die and self._greenlet.exception is not None:
+            raise self._greenlet.exception
+        return self
+
+
+class Proxy:
+    """ Handle to a local service, actions of one service run one at a time """
+
+    def __init__(self, robot, service):
+        self._robot = robot
+        self.service = service
+        self.name = service.name
+        self._lock = Semaphore()
+
+    def schedule_action(self, action, args=None):
+        return Task(gevent.spawn(self._execute, action, args or {}))
+
+    def _execute(self, action, args):
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                return getattr(self.service, action)(**args)
+            finally:
+                self._robot.record('%s.%s' % (self.service.template_name, action),
+                                   time.perf_counter() - start)
+
+    def delete(self):
+        self._robot.services.delete(self)
+
+
+class Services:
+    """ Registry of the local services, shaped like `api.services` of the robot """
+
+    def __init__(self, robot):
+        self._robot = robot
+        self._proxies = {}
+
+    def get(self, template_uid, name):
+        try:
+            return self._proxies[(template_name(template_uid), name)]
+        except KeyError:
+            raise ServiceNotFoundError('service "%s" not found' % name)
+
+    def create(self, template_uid, service_name, data=None):
+        kind = template_name(template_uid)
+        service = self._robot.templates[kind](name=service_name, data=data)
+        service.api = self._robot
+        service.validate()
+        proxy = Proxy(self._robot, service)
+        self._proxies[(kind, service_name)] = proxy
+        return proxy
+
+    def find_or_create(self, template_uid, service_name, data=None):
+        try:
+            return self.get(template_uid, service_name)
+        except ServiceNotFoundError:
+            return self.create(template_uid, service_name, data)
+
+    def find(self, template_uid=None, name=None):
+        return [proxy for (kind, service_name), proxy in self._proxies.items()
+                if (template_uid is None or kind == template_name(template_uid))
+                and (name is None or service_name == name)]
+
+    def delete(self, proxy):
+        self._proxies.pop((proxy.service.template_name, proxy.name), None)
+
+
+class Robot:
+    """
+    In-process stand-in of the robot: loads the templates,
+    runs the services and times their actions
+    """
+
+    def __init__(self):
+        self.templates = {
+            name: template_collection._load_template(TEMPLATES_URL, os.path.join(TEMPLATES_DIR, name))
+            for name in TEMPLATES
+        }
+        self.services = Services(self)
+        self.latencies = defaultdict(list)
+
+    def record(self, action, duration):
+        self.latencies[action].append(duration)
+
+    def uid(self, name):
+        return self.templates[name].template_uid
+
+
+def percentile(values, pct):
+    """ Return the nearest-rank @pct percentile of sorted @values """
+    if not values:
+        return None
+    rank = max(int(math.ceil(pct / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def summary(values):
+    """ Return count, mean, max and percentiles of durations @values """
+    values = sorted(values)
+    result = {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'max': values[-1],
+    }
+    for pct in PERCENTILES:
+        result['p%s' % pct] = percentile(values, pct)
+    return result
+
+
+def _run_all(proxies, action, concurrency):
+    """ Schedule @action on all @proxies, raise the first failure """
+    results = bounded_map(
+        lambda proxy: proxy.schedule_action(action).wait(die=True).result,
+        proxies, concurrency)
+    for _, err in results:
+        if err is not None:
+            raise err
+
+
+def reset():
+    """ Start with fresh service data and empty robot-wide caches """
+    config.DATA_DIR = tempfile.mkdtemp(prefix='ovc-benchmark-')
+    resolver.clear()
+    ovc_pool.clear()
+    disk_inventory.clear()
+    listings.clear()
+
+
+def create_services(robot, accounts=1, vdcs=1, nodes=5):
+    """
+    Create the openvcloud and sshkey services and @accounts accounts with
+    @vdcs vdcs of @nodes nodes each, return the proxies of the accounts, vdcs and nodes
+    """
+    services = robot.services
+    ovc = services.create(robot.uid('openvcloud'), 'ovc', {
+        'name': 'ovc', 'address': 'sim', 'location': 'sim-location', 'token': 'sim'})
+    ovc.schedule_action('install').wait(die=True)
+
+    sshkey = services.create(robot.uid('sshkey'), 'sshkey', {'name': 'id_rsa'})
+    sshkey.service.state.set('actions', 'install', 'ok')
+
+    account_proxies = [
+        services.create(robot.uid('account'), 'account%s' % a, {'name': 'account%s' % a, 'openvcloud': 'ovc'})
+        for a in range(accounts)
+    ]
+    vdc_proxies = [
+        services.create(robot.uid('vdc'), 'vdc%s-%s' % (a, v), {'name': 'vdc%s' % v, 'account': 'account%s' % a})
+        for a in range(accounts) for v in range(vdcs)
+    ]
+    node_proxies = [
+        services.create(robot.uid('node'), '%s-node%s' % (vdc.name, n), {
+            'name': 'node%s' % n, 'vdc': vdc.name, 'sshKey': 'sshkey',
+            'bootDiskSize': 10, 'dataDiskSize': 10})
+        for vdc in vdc_proxies for n in range(nodes)
+    ]
+    return account_proxies, vdc_proxies, node_proxies
+
+
+def run(accounts=1, vdcs=1, nodes=5, concurrency=DEFAULT_CONCURRENCY,
+        info_rounds=3, monitor_rounds=3, latency=0, errors=0, seed=None):
+    """
+    Run the benchmark scenario and return the result
+
+    :param accounts: number of account services
+    :param vdcs: number of vdc services per account
+    :param nodes: number of node services per vdc
+    :param concurrency: number of actions of one kind run at the same time
+    :param info_rounds: number of times get_info is called on every service
+    :param monitor_rounds: number of times monitor is called on every service
+    :param latency: seconds every simulated OVC API call takes
+    :param errors: probability of a simulated OVC API call failing with a 500 error
+    :param seed: seed deciding about simulated failures
+    """
+    reset()
+    sim = Simulator(latency={'default': latency}, errors={'default': errors}, seed=seed)
+
+    robot = Robot()
+    services = robot.services
+
+    start = time.perf_counter()
+    with sim.patch():
+        levels = list(create_services(robot, accounts, vdcs, nodes))
+        for proxies in levels:
+            _run_all(proxies, 'install', concurrency)
+
+        disk_proxies = services.find(template_uid=robot.uid('disk'))
+        for _ in range(info_rounds):
+            for proxies in levels + [disk_proxies]:
+                _run_all(proxies, 'get_info', concurrency)
+        for _ in range(monitor_rounds):
+            for proxies in levels + [disk_proxies]:
+                _run_all(proxies, 'monitor', concurrency)
+
+        memory = usage(proxy.service for proxy in services.find())
+        for proxies in reversed(levels):
+            _run_all(proxies, 'uninstall', concurrency)
+    duration = time.perf_counter() - start
+
+    actions = sum(len(values) for values in robot.latencies.values())
+    return {
+        'scenario': {
+            'accounts': accounts,
+            'vdcs': vdcs,
+            'nodes': nodes,
+            'concurrency': concurrency,
+            'info_rounds': info_rounds,
+            'monitor_rounds': monitor_rounds,
+            'latency': latency,
+            'errors': errors,
+        },
+        'duration': duration,
+        'actions': actions,
+        'actions_per_second': actions / duration,
+        'latency': {action: summary(values) for action, values in sorted(robot.latencies.items())},
+        'ovc_calls': dict(sorted(sim.calls.items())),
+        'ovc_calls_total': sum(sim.calls.values()),
+        'memory': memory,
+    }
+
+
+def compare(baseline, result, threshold=THRESHOLD):
+    """
+    Return the regressions of @result compared to @baseline: latency percentiles
+    that increased by more than @threshold and OVC endpoints called more often
+    """
+    regressions = []
+    for action, current in result['latency'].items():
+        previous = baseline['latency'].get(action)
+        if not previous:
+            continue
+        for pct in PERCENTILES:
+            key = 'p%s' % pct
+            if previous[key] and current[key] > previous[key] * (1 + threshold):
+                regressions.append('%s %s: %.4fs -> %.4fs' % (action, key, previous[key], current[key]))
+
+    for endpoint, count in result['ovc_calls'].items():
+        previous = baseline['ovc_calls'].get(endpoint, 0)
+        if count > previous:
+            regressions.append('%s calls: %s -> %s' % (endpoint, previous, count))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=1)
+    parser.add_argument('--vdcs', type=int, default=1, help='vdcs per account')
+    parser.add_argument('--nodes', type=int, default=5, help='nodes per vdc')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--info-rounds', type=int, default=3)
+    parser.add_argument('--monitor-rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0, help='seconds per OVC API call')
+    parser.add_argument('--errors', type=float, default=0, help='failure probability of OVC API calls')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='file to write the JSON result to')
+    parser.add_argument('--compare', help='JSON result of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    result = run(accounts=args.accounts, vdcs=args.vdcs, nodes=args.nodes,
+                 concurrency=args.concurrency, info_rounds=args.info_rounds,
+                 monitor_rounds=args.monitor_rounds,
+                 latency=args.latency, errors=args.errors, seed=args.seed)
+
+    output = json.dumps(result, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.threshold)
+        for regression in regressions:
+            print('regression: %s' % regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
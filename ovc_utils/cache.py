@@ -0,0 +1,36 @@
+"""
+Values cached for a limited time.
+"""
+
+import time
+
+
+class TTLValue:
+    """
+    Holds a value for @ttl seconds after it was set
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0
+
+    @property
+    def expired(self):
+        return time.time() >= self._expires
+
+    def get(self, default=None):
+        """ Return the value, or @default if it expired """
+        if self.expired:
+            # don't hold on to the expired value
+            self._value = None
+            return default
+        return self._value
+
+    def set(self, value):
+        self._value = value
+        self._expires = time.time() + self.ttl
+
+    def clear(self):
+        self._value = None
+        self._expires = 0
@@ -0,0 +1,116 @@
+"""
+Pool of OpenvCloud clients shared by all services of a robot.
+
+Every template used to get its own client from `j.clients.openvcloud`, which
+means one HTTP session and one JWT per service. The pool keeps a single
+client per ovc connection instance, so all services talking to the same
+G8 reuse its keep-alive HTTP session. The number of simultaneous connections
+to one G8 is bounded by the connection pool of that session, whose adapter
+also records every call in `metrics` and keeps the request rate within the
+budget of `ratelimit`.
+"""
+
+import logging
+
+from js9 import j
+from ovc_utils import retry, waiter
+from ovc_utils.cache import TTLValue
+from ovc_utils.metrics import InstrumentedAdapter
+from ovc_utils.ratelimit import scheduler
+
+# maximum number of simultaneous HTTP connections to one ovc endpoint
+MAX_CONNECTIONS = 10
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool:
+    """
+    Shared OpenvCloud clients keyed by name of the ovc connection instance
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._clients = {}
+
+    def get(self, instance):
+        """
+        Return the shared client of connection @instance
+        """
+        client = self._clients.get(instance)
+        if client is None:
+            client = j.clients.openvcloud.get(instance)
+            if not self._bound_session(client):
+                logger.warning('HTTP session of ovc connection "%s" not found, its calls are not '
+                               'bounded, rate limited nor recorded in the metrics', instance)
+            self._clients[instance] = client
+        return client
+
+    def _bound_session(self, client):
+        """
+        Limit the HTTP session of @client to max_connections connections
+
+        Requests exceeding the limit wait for a free connection instead of
+        opening a new one. All requests are recorded in the API call metrics
+        and wait for the request budget of the endpoint.
+
+        :return: False if the client has no HTTP session to mount the adapter on
+        """
+        session = getattr(client.api, '_session', None)
+        if not hasattr(session, 'mount'):
+            return False
+        adapter = InstrumentedAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_connections,
+            pool_block=True,
+            scheduler=scheduler,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return True
+
+    def connect(self, service, instance, caches):
+        """
+        Return the shared client of connection @instance for @service, kept in `service._ovc`
+
+        Remote objects are bound to the client they were got with. If the connection was
+        invalidated since the last call, the attributes of @service named in @caches,
+        which hold objects of the old client, are dropped.
+        """
+        client = self.get(instance)
+        if service._ovc is not None and client is not service._ovc:
+            for name in caches:
+                value = getattr(service, name)
+                if isinstance(value, TTLValue):
+                    value.clear()
+                else:
+                    setattr(service, name, None)
+        service._ovc = client
+        return client
+
+    @staticmethod
+    def cached(service, name):
+        """
+        Return the remote object @service keeps in attribute @name
+
+        The connection of @service is checked first, an object of an invalidated client is dropped.
+        """
+        service.ovc
+        return getattr(service, name)
+
+    def invalidate(self, instance):
+        """
+        Drop client of connection @instance, next get creates a new one
+
+        The circuit breaker and cloudspace watcher of the connection are dropped as well.
+        """
+        self._clients.pop(instance, None)
+        retry.drop(instance)
+        waiter.drop(instance)
+
+    def clear(self):
+        """ Drop all clients """
+        self._clients.clear()
+
+
+pool = ClientPool()
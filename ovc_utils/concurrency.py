@@ -0,0 +1,62 @@
+"""
+Bounded fan-out of work over greenlets.
+
+The greenlets run with the origin of the calling action (see `metrics`), so
+their OVC calls are attributed and prioritized like the action's own calls.
+"""
+
+from gevent.pool import Pool
+
+from ovc_utils.metrics import bind
+
+# default number of greenlets running at once
+DEFAULT_CONCURRENCY = 10
+
+
+def bounded_map(func, items, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Call @func on each of @items, running at most @concurrency calls at once
+
+    Failures don't stop the other calls.
+    Returns a list of (result, error) tuples in the order of @items,
+    where error is None if the call succeeded.
+    """
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as err:
+            return None, err
+
+    return list(Pool(max(1, concurrency)).imap(bind(call), items))
+
+
+def report(names, results, changed=False):
+    """
+    Return the outcome per name of @results of `bounded_map`, called on the items named @names
+
+    The outcome is {'state': 'ok'} or {'state': 'error', 'error': message}. With
+    @changed, the outcome of a successful call has `changed`, the truth of its result.
+    """
+    outcomes = {}
+    for name, (result, err) in zip(names, results):
+        if err is not None:
+            outcomes[name] = {'state': 'error', 'error': str(err)}
+        elif changed:
+            outcomes[name] = {'state': 'ok', 'changed': bool(result)}
+        else:
+            outcomes[name] = {'state': 'ok'}
+    return outcomes
+
+
+def parallel(*funcs):
+    """
+    Call all @funcs at once and return their results in order
+
+    Independent lookups take as long as the slowest one instead of their sum.
+    The first error is raised once all calls finished.
+    """
+    results = bounded_map(lambda func: func(), funcs, len(funcs))
+    for _, err in results:
+        if err is not None:
+            raise err
+    return [result for result, _ in results]
@@ -0,0 +1,45 @@
+"""
+Applying service data to remote entities only when needed.
+
+When a robot restarts, install runs again for all its services. Install
+actions that re-apply the service data (e.g. the limits of an account)
+store a fingerprint of the data they applied in `appliedHash`; as long as
+the data didn't change since, install returns without calling the OVC.
+When data is applied, the remote entity is only saved if it differs.
+"""
+
+from ovc_utils.monitor import fingerprint
+
+
+def digest(data, keys):
+    """ Return fingerprint of the values of @keys in service @data """
+    return fingerprint({key: data[key] for key in keys})
+
+
+def converged(data, keys):
+    """ Return whether the values of @keys in service @data are the ones applied last """
+    return data['appliedHash'] == digest(data, keys)
+
+
+def record(data, keys):
+    """ Remember the values of @keys in service @data as applied """
+    data['appliedHash'] = digest(data, keys)
+
+
+def diff(model, desired):
+    """ Return the values of @desired that differ from remote @model """
+    return {key: value for key, value in desired.items() if key not in model or model[key] != value}
+
+
+def save_changes(entity, desired):
+    """
+    Set the values of @desired that differ on the model of remote @entity (e.g. an account)
+    and save it, the entity isn't saved if nothing differs
+
+    :return: dict of the changed values
+    """
+    changes = diff(entity.model, desired)
+    if changes:
+        entity.model.update(changes)
+        entity.save()
+    return changes
@@ -0,0 +1,70 @@
+"""
+Memory held by the services of the robot.
+
+Remote objects of the OpenvCloud client (accounts, cloudspaces, VMs) carry
+the full model of the entity, and every service holds its own copy. Services
+of which a robot has thousands, nodes and disks, read the names of their vdc,
+account and ovc from the robot-wide resolver, keep the ids in their data, and
+drop the remote objects once they are installed. Nodes keep their space object,
+which every later lookup of the VM needs. `usage` reports the memory held per template:
+
+    from ovc_utils.footprint import usage
+    usage(services)     # {'node': {'services': 5000, 'bytes': ...}, ...}
+"""
+
+import sys
+
+from ovc_utils.cache import TTLValue
+
+# attributes of services holding their own data, the ovc clients are shared by all services (see `clients`)
+CACHES = ('_space', '_account', '_machine', '_users')
+
+
+def sizeof(value, seen=None):
+    """
+    Return approximate number of bytes of @value and the values it holds
+
+    Of remote objects only the object and its model are counted.
+    """
+    if value is None:
+        return 0
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(key, seen) + sizeof(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item, seen) for item in value)
+    elif isinstance(value, TTLValue):
+        size += sizeof(value.get(), seen)
+    elif hasattr(type(value), '__slots__'):
+        size += sum(sizeof(getattr(value, name, None), seen) for name in type(value).__slots__)
+    elif isinstance(getattr(value, 'model', None), dict):
+        size += sizeof(value.model, seen)
+    return size
+
+
+def footprint(service):
+    """ Return approximate number of bytes of the data and cached remote entities of @service """
+    seen = set()
+    size = sizeof(service.data, seen)
+    for name in CACHES:
+        size += sizeof(getattr(service, name, None), seen)
+    return size
+
+
+def usage(services):
+    """
+    Return number of services and approximate bytes they hold, per template name
+    """
+    report = {}
+    for service in services:
+        template = getattr(type(service), 'template_name', type(service).__name__)
+        entry = report.setdefault(template, {'services': 0, 'bytes': 0})
+        entry['services'] += 1
+        entry['bytes'] += footprint(service)
+    return report
@@ -0,0 +1,178 @@
+"""
+Inventory of the disks of OpenvCloud accounts shared by all disk services.
+
+Disk services used to list all disks of their account and scan the list
+for their own id. The inventory keeps one listing per account, indexed by
+disk id, for DISKS_TTL seconds and updates it when disks are created or
+deleted through it. A single disk can also be fetched by id. Disks missing
+from a cached listing, e.g. created by a VM since it was fetched, are fetched
+by id before they are reported as absent.
+
+Port forwards of a cloudspace are indexed by public port in the same way,
+by the vdc service owning the cloudspace.
+"""
+
+from gevent.event import AsyncResult
+
+from ovc_utils.cache import TTLValue
+from ovc_utils.retry import status_code
+
+# seconds a listing of the disks of an account is used
+DISKS_TTL = 60
+# seconds a listing of the port forwards of a cloudspace is used
+PORTFORWARDS_TTL = 60
+
+
+class DiskInventory:
+    """
+    Disks of accounts indexed by disk id, keyed by (ovc client, account id)
+    """
+
+    def __init__(self, ttl=DISKS_TTL):
+        self.ttl = ttl
+        self._accounts = {}
+        self._pending = {}
+
+    def _cached(self, ovc, account):
+        value = self._accounts.get((ovc, account.id))
+        return value.get() if value is not None else None
+
+    def disks(self, ovc, account):
+        """
+        Return dict disk id -> disk of all disks of @account
+
+        The listing is fetched once per DISKS_TTL, concurrent callers share it.
+        """
+        disks = self._cached(ovc, account)
+        if disks is not None:
+            return disks
+
+        key = (ovc, account.id)
+        if key in self._pending:
+            return self._pending[key].get()
+
+        pending = self._pending[key] = AsyncResult()
+        try:
+            disks = {disk['id']: disk for disk in account.disks}
+        except BaseException as err:
+            pending.set_exception(err)
+            raise
+        finally:
+            del self._pending[key]
+
+        value = self._accounts[key] = TTLValue(self.ttl)
+        value.set(disks)
+        pending.set(disks)
+        return disks
+
+    def get(self, ovc, account, disk_id, fetch=False):
+        """
+        Return disk @disk_id of @account or None if it doesn't exist
+
+        A disk that isn't in the listing is fetched by id and added to the listing.
+
+        :param fetch: if no listing of the account is cached, fetch only this
+                      disk by id instead of listing all disks of the account
+        """
+        disks = self._cached(ovc, account)
+        if disks is None and not fetch:
+            disks = self.disks(ovc, account)
+        if disks is not None and disk_id in disks:
+            return disks[disk_id]
+
+        try:
+            disk = ovc.api.cloudapi.disks.get(diskId=disk_id)
+        except Exception as err:
+            if status_code(err) == 404:
+                return None
+            raise
+
+        if disk.get('accountId', account.id) != account.id:
+            return None
+        self.add(ovc, account, disk)
+        return disk
+
+    def add(self, ovc, account, disk):
+        """ Add @disk to the cached listing of @account """
+        disks = self._cached(ovc, account)
+        if disks is not None:
+            disks[disk['id']] = disk
+
+    def remove(self, ovc, account, disk_id):
+        """ Remove disk @disk_id from the cached listing of @account """
+        disks = self._cached(ovc, account)
+        if disks is not None:
+            disks.pop(disk_id, None)
+
+    def clear(self):
+        """ Drop all listings """
+        self._accounts.clear()
+
+
+disk_inventory = DiskInventory()
+
+
+class PortforwardIndex:
+    """
+    Port forwards of one cloudspace keyed by (public port, protocol)
+
+    Ports are kept as strings, the way the API lists them.
+    """
+
+    def __init__(self, ttl=PORTFORWARDS_TTL):
+        self._forwards = TTLValue(ttl)
+
+    def forwards(self, ovc, cloudspace_id):
+        """
+        Return dict (public port, protocol) -> port forward of cloudspace @cloudspace_id
+
+        The listing is fetched once per PORTFORWARDS_TTL.
+        """
+        forwards = self._forwards.get()
+        if forwards is None:
+            forwards = {(forward['publicPort'], forward['protocol']): forward
+                        for forward in ovc.api.cloudapi.portforwarding.list(cloudspaceId=cloudspace_id)}
+            self._forwards.set(forwards)
+        return forwards
+
+    def machine(self, ovc, cloudspace_id, machine_id):
+        """ Return port forwards of machine @machine_id """
+        return [forward for forward in self.forwards(ovc, cloudspace_id).values()
+                if forward['machineId'] == machine_id]
+
+    def conflict(self, ovc, cloudspace_id, public_port, protocol, machine_id, local_port):
+        """
+        Return the port forward using @public_port for another destination than
+        @local_port of machine @machine_id, None if the port is free or already
+        forwarded to that destination
+        """
+        forward = self.forwards(ovc, cloudspace_id).get((str(public_port), protocol))
+        if forward is None:
+            return None
+        if forward['machineId'] == machine_id and forward['localPort'] == str(local_port):
+            return None
+        return forward
+
+    def add(self, forward):
+        """
+        Add @forward to the index. Forwards created without a known id
+        can't be deleted through the index, the listing is dropped instead.
+        """
+        forwards = self._forwards.get()
+        if forwards is None:
+            return
+        if not isinstance(forward.get('id'), int) or isinstance(forward.get('id'), bool):
+            self._forwards.clear()
+            return
+        forward = dict(forward, publicPort=str(forward['publicPort']), localPort=str(forward['localPort']))
+        forwards[(forward['publicPort'], forward['protocol'])] = forward
+
+    def remove(self, public_port, protocol):
+        """ Remove the forward of @public_port from the index """
+        forwards = self._forwards.get()
+        if forwards is not None:
+            forwards.pop((str(public_port), protocol), None)
+
+    def clear(self):
+        """ Drop the listing """
+        self._forwards.clear()
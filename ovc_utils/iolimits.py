@@ -0,0 +1,49 @@
+"""
+IO limits of disks, shared by the disk template and the services applying
+limits to many disks at once.
+
+Limits are named after the fields of the disk service data.
+"""
+
+# limit -> argument of limitIO, as kept in `iotune` of the disk
+IOTUNE = {
+    'maxIops': 'iops',
+    'totalBytesSec': 'total_bytes_sec',
+    'readBytesSec': 'read_bytes_sec',
+    'writeBytesSec': 'write_bytes_sec',
+    'totalIopsSec': 'total_iops_sec',
+    'readIopsSec': 'read_iops_sec',
+    'writeIopsSec': 'write_iops_sec',
+    'totalBytesSecMax': 'total_bytes_sec_max',
+    'readBytesSecMax': 'read_bytes_sec_max',
+    'writeBytesSecMax': 'write_bytes_sec_max',
+    'totalIopsSecMax': 'total_iops_sec_max',
+    'readIopsSecMax': 'read_iops_sec_max',
+    'writeIopsSecMax': 'write_iops_sec_max',
+    'sizeIopsSec': 'size_iops_sec',
+}
+
+
+def validate(limits):
+    """
+    Validate @limits, a mapping of limit -> value where missing limits are unset
+    """
+    unknown = set(limits) - set(IOTUNE)
+    if unknown:
+        raise ValueError('unknown IO limits: %s' % ', '.join(sorted(unknown)))
+
+    def get(key):
+        return limits.get(key) or 0
+
+    # ensure that limits are given correctly
+    if (get('maxIops') or get('totalIopsSec')) and (get('readIopsSec') or get('writeIopsSec')):
+        raise RuntimeError("total and read/write of iops_sec cannot be set at the same time")
+
+    if get('totalBytesSec') and (get('readBytesSec') or get('writeBytesSec')):
+        raise RuntimeError("total and read/write of bytes_sec cannot be set at the same time")
+
+    if get('totalBytesSecMax') and (get('readBytesSecMax') or get('writeBytesSecMax')):
+        raise RuntimeError("total and read/write of bytes_sec_max cannot be set at the same time")
+
+    if get('totalIopsSecMax') and (get('readIopsSecMax') or get('writeIopsSecMax')):
+        raise RuntimeError("total and read/write of iops_sec_max cannot be set at the same time")
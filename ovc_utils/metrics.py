@@ -0,0 +1,276 @@
+"""
+Instrumentation of the OVC API calls made by the templates.
+
+The HTTP sessions of the shared OpenvCloud clients (see `clients`) get an
+adapter that records every request: the endpoint, the latency, the size of
+request and response and the service/action it originates from. Templates
+decorated with `instrument` record the action they run for their greenlet,
+the outermost action wins, so helpers and properties called from an action
+are attributed to that action. Greenlets spawned by the helpers of
+`concurrency` inherit the origin of the greenlet spawning them. The retry
+counts of the actions (see `retry`) are exported along with the calls.
+
+    from ovc_utils.metrics import metrics, serve
+    print(metrics.export())     # Prometheus text exposition format
+    serve(9102)                 # or let Prometheus scrape http://<robot>:9102/metrics
+"""
+
+import functools
+import inspect
+import time
+import weakref
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import gevent
+from gevent.pywsgi import WSGIServer
+from requests.adapters import HTTPAdapter
+from ovc_utils import retry
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# origin of calls made outside of a template action
+UNKNOWN = ('', '', '')
+
+# (metric name, help text, counter of `retry.stats`) of the retry counts
+RETRY_FAMILIES = (
+    ('ovc_action_retries_total', 'Attempts of template actions retried after a transient error.', 'retries'),
+    ('ovc_action_gave_up_total', 'Template actions failing after their last attempt.', 'gave_up'),
+    ('ovc_action_permanent_errors_total', 'Template actions failing with an error not worth a retry.',
+     'permanent'),
+)
+
+# path prefix of the OVC portal API
+API_PREFIX = '/restmachine/'
+
+
+def endpoint(url):
+    """
+    Return endpoint name of @url, e.g. `cloudapi.portforwarding.create`
+    """
+    path = urlparse(url).path
+    if path.startswith(API_PREFIX):
+        path = path[len(API_PREFIX):]
+    return path.strip('/').replace('/', '.')
+
+
+# (template, service, action) per greenlet running a template action
+_origins = weakref.WeakKeyDictionary()
+
+
+def current_origin():
+    """
+    Return (template, service, action) of the template action running
+    in the current greenlet, UNKNOWN if there is none
+    """
+    return _origins.get(gevent.getcurrent(), UNKNOWN)
+
+
+@contextmanager
+def attributed(value):
+    """
+    Attribute the calls of the current greenlet to @value, unless it already runs an action
+    """
+    current = gevent.getcurrent()
+    if current in _origins:
+        yield
+        return
+
+    _origins[current] = value
+    try:
+        yield
+    finally:
+        _origins.pop(current, None)
+
+
+def bind(func):
+    """ Return @func running with the origin of the current greenlet, for use in other greenlets """
+    value = current_origin()
+    if value is UNKNOWN:
+        return func
+
+    @functools.wraps(func)
+    def bound(*args, **kwargs):
+        with attributed(value):
+            return func(*args, **kwargs)
+    return bound
+
+
+def instrument(cls):
+    """
+    Class decorator of templates: calls made by the public methods of @cls are
+    attributed to the outermost one running in the greenlet
+    """
+    for name, func in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(func):
+            setattr(cls, name, _action(func, cls.template_name, name))
+    return cls
+
+
+def _action(func, template, name):
+    @functools.wraps(func)
+    def action(self, *args, **kwargs):
+        with attributed((template, self.name, name)):
+            return func(self, *args, **kwargs)
+    return action
+
+
+class Series:
+    """ Counters of calls to one endpoint from one service action """
+
+    __slots__ = ('count', 'errors', 'duration', 'buckets', 'request_bytes', 'response_bytes')
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(buckets)
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class Metrics:
+    """
+    Per endpoint and per originating service/action counters of OVC API calls
+
+    If @retries is given, the retry counters of the actions kept in it
+    (shaped like `retry.stats`) are exported as well.
+    """
+
+    def __init__(self, buckets=BUCKETS, retries=None):
+        self.buckets = tuple(buckets)
+        self.retries = retries
+        self._series = {}
+
+    def observe(self, endpoint, duration, request_bytes=0, response_bytes=0, error=False, origin=UNKNOWN):
+        """
+        Record one call to @endpoint
+        """
+        key = (endpoint,) + tuple(origin)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = Series(self.buckets)
+
+        series.count += 1
+        series.errors += bool(error)
+        series.duration += duration
+        series.request_bytes += request_bytes
+        series.response_bytes += response_bytes
+        for index, bound in enumerate(self.buckets):
+            if duration <= bound:
+                series.buckets[index] += 1
+
+    def count(self, endpoint=None, template=None, action=None):
+        """ Return number of recorded calls matching the given labels """
+        return sum(series.count for (ep, tmpl, _, act), series in self._series.items()
+                   if endpoint in (None, ep) and template in (None, tmpl) and action in (None, act))
+
+    def export(self):
+        """
+        Return the metrics in the Prometheus text exposition format
+        """
+        items = sorted(self._series.items())
+        lines = []
+
+        def family(name, kind, help_text, value):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for key, series in items:
+                lines.append('%s{%s} %s' % (name, _labels(key), value(series)))
+
+        family('ovc_api_requests_total', 'counter', 'OVC API calls.', lambda s: s.count)
+        family('ovc_api_errors_total', 'counter', 'OVC API calls that failed.', lambda s: s.errors)
+        family('ovc_api_request_bytes_total', 'counter', 'Bytes sent to the OVC API.',
+               lambda s: s.request_bytes)
+        family('ovc_api_response_bytes_total', 'counter', 'Bytes received from the OVC API.',
+               lambda s: s.response_bytes)
+
+        name = 'ovc_api_request_duration_seconds'
+        lines.append('# HELP %s Latency of OVC API calls.' % name)
+        lines.append('# TYPE %s histogram' % name)
+        for key, series in items:
+            labels = _labels(key)
+            for bound, count in zip(self.buckets, series.buckets):
+                lines.append('%s_bucket{%s,le="%s"} %s' % (name, labels, bound, count))
+            lines.append('%s_bucket{%s,le="+Inf"} %s' % (name, labels, series.count))
+            lines.append('%s_sum{%s} %s' % (name, labels, series.duration))
+            lines.append('%s_count{%s} %s' % (name, labels, series.count))
+
+        if self.retries is not None:
+            for name, help_text, counter in RETRY_FAMILIES:
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s counter' % name)
+                for key, count in sorted(self.retries[counter].items()):
+                    template, _, action = key.partition('.')
+                    lines.append('%s{template="%s",action="%s"} %s' % (name, template, action, count))
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """ Drop all recorded calls """
+        self._series.clear()
+
+
+def _labels(key):
+    values = [str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in key]
+    return ','.join('%s="%s"' % pair for pair in zip(('endpoint', 'template', 'service', 'action'), values))
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """
+    HTTP adapter recording every request it sends in @recorder,
+    the module metrics by default
+
+    If a @scheduler is given (see `ratelimit`), requests wait for it before they are sent.
+    """
+
+    def __init__(self, recorder=None, scheduler=None, **kwargs):
+        self.metrics = recorder or metrics
+        self.scheduler = scheduler
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        origin = current_origin()
+        name = endpoint(request.url)
+        if self.scheduler is not None:
+            self.scheduler.acquire(request.url, name, origin[2])
+        body = request.body or b''
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            self.metrics.observe(name, time.perf_counter() - start, len(body), 0, True, origin)
+            raise
+
+        size = response.headers.get('Content-Length')
+        if size is None and not kwargs.get('stream'):
+            size = len(response.content)
+        self.metrics.observe(name, time.perf_counter() - start, len(body), int(size or 0),
+                             response.status_code >= 400, origin)
+        return response
+
+
+metrics = Metrics(retries=retry.stats)
+
+_server = None
+
+
+def serve(port, host=''):
+    """
+    Serve the metrics on http://@host:@port/metrics, only the first call starts a server
+    """
+    global _server
+    if _server is not None:
+        return _server
+
+    def application(environ, start_response):
+        if environ.get('PATH_INFO') != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'not found\n']
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4')])
+        return [metrics.export().encode()]
+
+    _server = WSGIServer((host, port), application, log=None)
+    _server.start()
+    return _server
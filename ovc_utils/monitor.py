@@ -0,0 +1,179 @@
+"""
+Drift detection for the `monitor` actions of the templates.
+
+A monitor action compares the remote entity of a service (account,
+cloudspace, VM or disk) with the service data. To stay cheap when run
+every minute on thousands of services:
+
+- listings are shared by all services of the robot: one call per ovc for
+  accounts and cloudspaces, one per cloudspace for VMs and one per account
+  for disks, reused for LISTING_TTL seconds. An entity missing from a
+  listing, e.g. created since it was fetched, is looked up by id before it
+  is reported as gone;
+- every service keeps a fingerprint of its remote entity, the service data
+  is only compared and updated when the fingerprint changed.
+"""
+
+import hashlib
+import json
+
+from gevent.event import AsyncResult
+
+from ovc_utils.cache import TTLValue
+from ovc_utils.retry import status_code
+
+# seconds a listing is shared by the monitor actions
+LISTING_TTL = 30
+
+
+def fingerprint(value):
+    """ Return a hash of JSON serializable @value """
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Listings:
+    """
+    Listings of remote entities indexed by id, shared by all services
+    """
+
+    def __init__(self, ttl=LISTING_TTL):
+        self.ttl = ttl
+        self._listings = {}
+        self._pending = {}
+
+    def get(self, key, fetch):
+        """
+        Return dict id -> entity of the listing @key, calling @fetch if it isn't cached
+
+        Concurrent callers share one call of @fetch.
+        """
+        value = self._listings.get(key)
+        entities = value.get() if value is not None else None
+        if entities is not None:
+            return entities
+
+        if key in self._pending:
+            return self._pending[key].get()
+
+        pending = self._pending[key] = AsyncResult()
+        try:
+            entities = {entity['id']: entity for entity in fetch()}
+        except BaseException as err:
+            pending.set_exception(err)
+            raise
+        finally:
+            del self._pending[key]
+
+        value = self._listings[key] = TTLValue(self.ttl)
+        value.set(entities)
+        pending.set(entities)
+        return entities
+
+    def find(self, key, fetch, entity_id, get):
+        """
+        Return entity @entity_id of the listing @key, None if it doesn't exist
+
+        An entity that isn't in the listing is looked up with @get and added to the listing.
+        """
+        entities = self.get(key, fetch)
+        entity = entities.get(entity_id)
+        if entity is not None:
+            return entity
+
+        try:
+            entity = get(entity_id)
+        except Exception as err:
+            if status_code(err) == 404:
+                return None
+            raise
+
+        entities[entity_id] = entity
+        return entity
+
+    def accounts(self, ovc):
+        return self.get((ovc, 'accounts'), ovc.api.cloudapi.accounts.list)
+
+    def cloudspaces(self, ovc):
+        return self.get((ovc, 'cloudspaces'), ovc.api.cloudapi.cloudspaces.list)
+
+    def machines(self, ovc, cloudspace_id):
+        return self.get((ovc, 'machines', cloudspace_id),
+                        lambda: ovc.api.cloudapi.machines.list(cloudspaceId=cloudspace_id))
+
+    def disks(self, ovc, account_id):
+        return self.get((ovc, 'disks', account_id),
+                        lambda: ovc.api.cloudapi.disks.list(accountId=account_id))
+
+    def account(self, ovc, account_id):
+        """ Return account @account_id, None if it doesn't exist """
+        return self.find((ovc, 'accounts'), ovc.api.cloudapi.accounts.list, account_id,
+                         lambda entity_id: ovc.api.cloudapi.accounts.get(accountId=entity_id))
+
+    def cloudspace(self, ovc, cloudspace_id):
+        """ Return cloudspace @cloudspace_id, None if it doesn't exist """
+        return self.find((ovc, 'cloudspaces'), ovc.api.cloudapi.cloudspaces.list, cloudspace_id,
+                         lambda entity_id: ovc.api.cloudapi.cloudspaces.get(cloudspaceId=entity_id))
+
+    def machine(self, ovc, cloudspace_id, machine_id):
+        """ Return VM @machine_id of cloudspace @cloudspace_id, None if it doesn't exist """
+        return self.find((ovc, 'machines', cloudspace_id),
+                         lambda: ovc.api.cloudapi.machines.list(cloudspaceId=cloudspace_id), machine_id,
+                         lambda entity_id: ovc.api.cloudapi.machines.get(machineId=entity_id))
+
+    def disk(self, ovc, account_id, disk_id):
+        """ Return disk @disk_id of account @account_id, None if it doesn't exist """
+        return self.find((ovc, 'disks', account_id),
+                         lambda: ovc.api.cloudapi.disks.list(accountId=account_id), disk_id,
+                         lambda entity_id: ovc.api.cloudapi.disks.get(diskId=entity_id))
+
+    def clear(self):
+        """ Drop all listings """
+        self._listings.clear()
+
+
+listings = Listings()
+
+
+def users(acl):
+    """ Return users of access control list @acl in the form of service data """
+    return [{'name': ace['userGroupId'], 'accesstype': ace['right']} for ace in acl]
+
+
+class Monitor:
+    """
+    Change detection of the remote entity of one service
+    """
+
+    def __init__(self):
+        self._fingerprint = None
+        self._drift = {}
+
+    def observe(self, data, entity, fields):
+        """
+        Compare remote @entity with service @data
+
+        :param fields: function returning (mirrored, desired) for @entity: dicts of
+                       data key -> remote value. Mirrored values are copied to @data,
+                       desired values are reported as drift when they differ.
+                       Only called if @entity changed since the last observation.
+        :return: dict with `changed`, the data keys `updated` and the `drift`
+        """
+        value = fingerprint(entity)
+        if value == self._fingerprint:
+            return {'changed': False, 'updated': {}, 'drift': self._drift}
+        self._fingerprint = value
+
+        mirrored, desired = fields(entity)
+        updated = {}
+        for key, remote in mirrored.items():
+            if data[key] != remote:
+                data[key] = remote
+                updated[key] = remote
+
+        self._drift = {key: {'expected': data[key], 'actual': remote}
+                       for key, remote in desired.items() if data[key] != remote}
+        return {'changed': True, 'updated': updated, 'drift': self._drift}
+
+    def reset(self):
+        self._fingerprint = None
+        self._drift = {}
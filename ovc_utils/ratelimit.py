@@ -0,0 +1,164 @@
+"""
+Rate limits of calls to the OVC, shared by all services of the robot.
+
+Every request of the shared OpenvCloud clients (see `clients`) passes the
+`scheduler`, which keeps a budget of requests per API endpoint of an ovc.
+Requests exceeding the budget are queued instead of sent, so a robot
+(re)starting all its services doesn't flood the controller with calls that
+fail and get retried. Queued requests of interactive actions, e.g. `get_info`
+or `start`, are sent before those of bulk actions like `install`.
+
+    from ovc_utils.ratelimit import scheduler
+    scheduler.configure('ovc.demo.greenitglobe.com', rate=20, burst=10)
+"""
+
+import heapq
+import itertools
+import time
+from urllib.parse import urlparse
+
+import gevent
+from gevent.event import Event
+
+# priorities of queued requests, lower is sent first
+INTERACTIVE = 0
+BULK = 1
+
+# template actions a user waits for
+INTERACTIVE_ACTIONS = frozenset(['get_info', 'start', 'stop', 'restart', 'pause', 'resume', 'reset'])
+
+# requests per second and burst per API endpoint of an ovc that isn't configured
+DEFAULT_RATE = 20
+DEFAULT_BURST = 10
+
+
+def priority(action):
+    """ Return priority of requests made by template @action """
+    return INTERACTIVE if action in INTERACTIVE_ACTIONS else BULK
+
+
+def host(address):
+    """ Return host name of ovc @address, which can be a URL """
+    if '://' in address:
+        address = urlparse(address).hostname or ''
+    return address.split(':')[0].lower()
+
+
+class TokenBucket:
+    """
+    Allows @rate calls per second on average and bursts of up to @burst calls
+
+    A @rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """ Take a token if one is available, return whether it was taken """
+        if self.rate <= 0:
+            return True
+
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def acquire(self):
+        """ Take a token, waiting until one is available """
+        while not self.try_acquire():
+            gevent.sleep((1 - self._tokens) / self.rate)
+
+
+class _Queue:
+    """ Budget and waiting requests of one endpoint """
+
+    __slots__ = ('bucket', 'waiting', 'dispatcher')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.waiting = []
+        self.dispatcher = None
+
+
+class Scheduler:
+    """
+    Request budget per API endpoint of an ovc, with requests over budget queued by priority
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._limits = {}
+        self._queues = {}
+        self._order = itertools.count()
+
+    def configure(self, address, rate, burst):
+        """
+        Allow @rate requests per second and bursts of @burst requests
+        per API endpoint of the ovc at @address. A @rate of 0 disables the limit.
+        """
+        name = host(address)
+        self._limits[name] = (rate, burst)
+        for (queue_host, _), queue in self._queues.items():
+            if queue_host == name:
+                queue.bucket.rate = rate
+                queue.bucket.burst = burst
+
+    def limit(self, address):
+        """ Return (rate, burst) of the API endpoints of the ovc at @address """
+        return self._limits.get(host(address), (self.rate, self.burst))
+
+    def _queue(self, name, endpoint):
+        queue = self._queues.get((name, endpoint))
+        if queue is None:
+            rate, burst = self.limit(name)
+            queue = self._queues[(name, endpoint)] = _Queue(TokenBucket(rate, burst))
+        return queue
+
+    def acquire(self, address, endpoint, action=None):
+        """
+        Return once a request to @endpoint of the ovc at @address fits in the budget
+
+        :param action: template action making the request, determines its priority
+        """
+        queue = self._queue(host(address), endpoint)
+        if not queue.waiting and queue.bucket.try_acquire():
+            return
+
+        ready = Event()
+        heapq.heappush(queue.waiting, (priority(action), next(self._order), ready))
+        if queue.dispatcher is None:
+            queue.dispatcher = gevent.spawn(self._dispatch, queue)
+        ready.wait()
+
+    @staticmethod
+    def _dispatch(queue):
+        """ Release waiting requests of @queue as tokens become available """
+        try:
+            while queue.waiting:
+                queue.bucket.acquire()
+                heapq.heappop(queue.waiting)[2].set()
+        finally:
+            queue.dispatcher = None
+
+    def queued(self):
+        """ Return number of waiting requests per (host, endpoint) """
+        return {key: len(queue.waiting) for key, queue in self._queues.items() if queue.waiting}
+
+    def clear(self):
+        """ Drop configured limits and budgets """
+        self._limits.clear()
+        self._queues.clear()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,111 @@
+"""
+Robot-wide cache of the vdc -> account -> openvcloud service hierarchy.
+
+Node and disk services need the real names of their vdc, account and
+ovc connection. Resolving them means one `get_info` action per level, so the
+result is memoized per service name and shared by all services of the robot.
+Services owning a level of the hierarchy invalidate it on `update`/`uninstall`.
+A service waiting for actions of the services below it seeds the cache with its
+own info first: 0-robot runs the actions of a service one at a time, so their
+`get_info` call on it would only run once it stopped waiting for them.
+
+`fetch_info` fetches the info of a service that isn't part of the hierarchy,
+templates run it alongside their other lookups with `concurrency.parallel`.
+"""
+
+from gevent.event import AsyncResult
+
+OVC_TEMPLATE = 'github.com/openvcloud/0-templates/openvcloud/0.0.1'
+ACCOUNT_TEMPLATE = 'github.com/openvcloud/0-templates/account/0.0.1'
+VDC_TEMPLATE = 'github.com/openvcloud/0-templates/vdc/0.0.1'
+
+# fields of get_info results that are kept in the cache
+INFO_FIELDS = {
+    OVC_TEMPLATE: ('name',),
+    ACCOUNT_TEMPLATE: ('name', 'openvcloud'),
+    VDC_TEMPLATE: ('name', 'account'),
+}
+
+
+def fetch_info(api, template_uid, name):
+    """
+    Return get_info result of service @name of template @template_uid
+    """
+    proxy = api.services.get(template_uid=template_uid, name=name)
+    return proxy.schedule_action(action='get_info').wait(die=True).result
+
+
+class Resolver:
+    """
+    Memoizes service name -> names of the vdc/account/ovc it refers to
+    """
+
+    def __init__(self):
+        self._infos = {}
+        self._pending = {}
+
+    def info(self, api, template_uid, name):
+        """
+        Return cached get_info fields of service @name
+
+        Concurrent lookups of the same service share one get_info call.
+        """
+        if name in self._infos:
+            return self._infos[name]
+
+        if name in self._pending:
+            return self._pending[name].get()
+
+        pending = self._pending[name] = AsyncResult()
+        try:
+            result = fetch_info(api, template_uid, name)
+            info = {key: result[key] for key in INFO_FIELDS[template_uid]}
+        except BaseException as err:
+            pending.set_exception(err)
+            raise
+        finally:
+            del self._pending[name]
+
+        self._infos[name] = info
+        pending.set(info)
+        return info
+
+    def ovc(self, api, ovc_service):
+        """ Return name of the ovc connection instance """
+        return self.info(api, OVC_TEMPLATE, ovc_service)['name']
+
+    def account(self, api, account_service):
+        """ Return names of the account and ovc connection """
+        account_info = self.info(api, ACCOUNT_TEMPLATE, account_service)
+        return {
+            'account': account_info['name'],
+            'ovc': self.ovc(api, account_info['openvcloud']),
+        }
+
+    def vdc(self, api, vdc_service):
+        """ Return names of the vdc, account and ovc connection """
+        vdc_info = self.info(api, VDC_TEMPLATE, vdc_service)
+        config = self.account(api, vdc_info['account'])
+        config['vdc'] = vdc_info['name']
+        return config
+
+    def seed(self, template_uid, name, info):
+        """
+        Cache @info, the get_info result of service @name of template @template_uid
+        """
+        self._infos[name] = {key: info[key] for key in INFO_FIELDS[template_uid]}
+
+    def invalidate(self, name):
+        """
+        Drop cached info of service @name
+
+        Lookups going through this service are resolved again on next use.
+        """
+        self._infos.pop(name, None)
+
+    def clear(self):
+        """ Drop all cached info """
+        self._infos.clear()
+
+
+resolver = Resolver()
@@ -0,0 +1,190 @@
+"""
+Retry policy for actions talking to OpenvCloud.
+
+Only transient errors (connection problems, request timeouts, 5xx responses)
+are retried, with jittered exponential backoff. Errors that will fail again
+(validation errors, 4xx responses such as exceeded quota) are raised at once,
+and so are local waits that timed out (`waiter.wait_for`, `gevent.Timeout`):
+the action already waited for their full deadline.
+A circuit breaker per ovc connection instance stops all services of the robot from
+hammering a G8 that keeps failing. Retry counts are kept in `stats`.
+"""
+
+import random
+import socket
+import time
+from collections import Counter
+from functools import wraps
+
+import gevent
+import requests
+from js9 import j
+
+# HTTP status codes of 4xx responses that are worth a retry
+TRANSIENT_STATUS_CODES = (408, 429)
+
+# consecutive transient failures after which the circuit opens
+FAILURE_THRESHOLD = 5
+# seconds the circuit stays open before a trial call is let through,
+# and seconds the trial call may take before another one is let through
+RESET_TIMEOUT = 30
+
+
+class CircuitOpenError(RuntimeError):
+    """ Raised when calls to an ovc are suspended """
+
+
+def status_code(err):
+    """ Return HTTP status code carried by @err or None """
+    response = getattr(err, 'response', None)
+    code = getattr(response, 'status_code', None) or getattr(err, 'status_code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_transient(err):
+    """
+    Return True if an action failing with @err may succeed when retried
+    """
+    if isinstance(err, (gevent.Timeout, j.exceptions.Timeout)):
+        return False
+
+    if isinstance(err, (CircuitOpenError, ConnectionError, TimeoutError, socket.timeout,
+                        requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+
+    code = status_code(err)
+    if code is None:
+        return False
+
+    return code >= 500 or code in TRANSIENT_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive transient failures of calls to one ovc
+    """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    def check(self):
+        """
+        Raise CircuitOpenError if calls are suspended
+
+        Once reset_timeout passed, a single trial call is let through: its
+        success closes the circuit, its failure opens it anew. Other calls stay
+        suspended meanwhile, unless the trial call didn't report back within
+        reset_timeout.
+        """
+        if self.opened_at is None:
+            return
+        now = time.time()
+        remaining = self.opened_at + self.reset_timeout - now
+        if remaining > 0:
+            raise CircuitOpenError('calls to ovc suspended for %.0f seconds' % remaining)
+        if self.probe_at is not None and now - self.probe_at < self.reset_timeout:
+            raise CircuitOpenError('calls to ovc suspended until the trial call returns')
+        # half open: this call is the trial call
+        self.probe_at = now
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold or self.probe_at is not None:
+            self.opened_at = time.time()
+            self.probe_at = None
+
+    def remaining(self):
+        """ Seconds until calls are let through again """
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.reset_timeout - time.time())
+
+
+# circuit breakers keyed by name of the ovc connection instance
+_breakers = {}
+
+
+def breaker(instance):
+    """ Return circuit breaker of ovc connection @instance """
+    if instance not in _breakers:
+        _breakers[instance] = CircuitBreaker()
+    return _breakers[instance]
+
+
+def drop(instance):
+    """ Forget circuit breaker of ovc connection @instance """
+    _breakers.pop(instance, None)
+
+
+# counters keyed by '<template>.<action>'
+stats = {
+    'retries': Counter(),
+    'gave_up': Counter(),
+    'permanent': Counter(),
+}
+
+
+def backoff_delay(attempt, delay, backoff, max_delay):
+    """ Full jitter: random delay up to the exponential backoff of @attempt """
+    return random.uniform(0, min(max_delay, delay * backoff ** attempt))
+
+
+def retry(tries=5, delay=3, backoff=2, max_delay=60):
+    """
+    Retry a template action failing with a transient error
+
+    The circuit breaker used is the one of the connection instance of the
+    action's ovc client (`self.ovc`). The client is looked up before each attempt,
+    so the first attempt after a restart of the robot respects an open circuit too.
+
+    :param tries: number of attempts
+    :param delay: base delay in seconds
+    :param backoff: factor the delay grows with per attempt
+    :param max_delay: upper bound of one delay
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = '%s.%s' % (getattr(self, 'template_name', type(self).__name__), func.__name__)
+            for attempt in range(tries):
+                ovc = None
+                try:
+                    ovc = getattr(self, 'ovc', None)
+                    if ovc is not None:
+                        breaker(ovc.instance).check()
+                    result = func(self, *args, **kwargs)
+                except Exception as err:
+                    if not is_transient(err):
+                        stats['permanent'][key] += 1
+                        if ovc is not None and status_code(err) is not None:
+                            # the ovc answered, it is reachable again
+                            breaker(ovc.instance).success()
+                        raise
+
+                    wait = backoff_delay(attempt, delay, backoff, max_delay)
+                    if ovc is not None:
+                        if not isinstance(err, CircuitOpenError):
+                            breaker(ovc.instance).failure()
+                        wait = max(wait, breaker(ovc.instance).remaining())
+
+                    if attempt == tries - 1:
+                        stats['gave_up'][key] += 1
+                        raise
+
+                    stats['retries'][key] += 1
+                    gevent.sleep(wait)
+                else:
+                    if ovc is not None:
+                        breaker(ovc.instance).success()
+                    return result
+        return wrapper
+    return decorator
@@ -0,0 +1,749 @@
+"""
+In-process OpenvCloud simulator for offline testing and benchmarking.
+
+The simulator keeps the state of a G8 (accounts, cloudspaces, machines,
+disks, ACLs, port forwards and users) in memory and exposes it through
+objects shaped like the ones of `j.clients.openvcloud`: the client with its
+`api.cloudapi`/`api.system` endpoints, accounts, spaces and machines.
+Every call goes through one entry point that counts it, waits a configurable
+latency (gevent friendly) and can fail on purpose.
+
+    sim = Simulator(latency={'default': 0.01, 'cloudapi.cloudspaces.list': 0.1},
+                    errors={'cloudapi.portforwarding.create': 0.05})
+    with sim.patch():
+        # templates now talk to the simulator
+        ...
+    sim.calls   # Counter of calls per endpoint
+"""
+
+import itertools
+import json
+import random
+from collections import Counter
+from contextlib import contextmanager
+
+import gevent
+from js9 import j
+
+LOCATION = {'name': 'sim-location', 'gid': 1}
+
+
+class Response:
+    """ HTTP response carried by the errors of the simulated API """
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class SimulatedError(Exception):
+    """ Error response of the simulated API """
+
+    def __init__(self, status_code, message):
+        super().__init__('%s: %s' % (status_code, message))
+        self.status_code = status_code
+        self.response = Response(status_code)
+
+
+class Simulator:
+    """
+    State of a simulated G8 and the knobs to tune its behavior
+
+    :param latency: dict endpoint -> seconds every call waits, key 'default' for all others
+    :param errors: dict endpoint -> probability of a call failing with a 500 error, key 'default' for all others
+    :param seed: seed of the random generator deciding about failures
+    """
+
+    def __init__(self, latency=None, errors=None, seed=None):
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._clients = {}
+
+        self.accounts = {}
+        self.cloudspaces = {}
+        self.machines = {}
+        self.disks = {}
+        self.portforwards = {}
+        self.users = {}
+
+    def call(self, endpoint):
+        """
+        Account for one call to @endpoint: count it, wait and maybe fail
+        """
+        self.calls[endpoint] += 1
+        delay = self.latency.get(endpoint, self.latency.get('default', 0))
+        if delay:
+            gevent.sleep(delay)
+        if self._random.random() < self.errors.get(endpoint, self.errors.get('default', 0)):
+            raise SimulatedError(500, 'injected failure of %s' % endpoint)
+
+    def new_id(self):
+        return next(self._ids)
+
+    def client(self, instance='sim'):
+        """ Return the client of connection @instance to the simulated G8 """
+        if instance not in self._clients:
+            self._clients[instance] = Client(self, instance)
+        return self._clients[instance]
+
+    @contextmanager
+    def patch(self):
+        """
+        Make j.clients.openvcloud return clients of this simulator
+        """
+        factory = getattr(j.clients, '_openvcloud', None)
+        j.clients._openvcloud = Factory(self)
+        try:
+            yield self
+        finally:
+            j.clients._openvcloud = factory
+
+    # helpers shared by the simulated objects
+
+    @staticmethod
+    def not_found(kind, key):
+        return SimulatedError(404, '%s %s not found' % (kind, key))
+
+    @staticmethod
+    def acl_set(model, username, right):
+        for ace in model['acl']:
+            if ace['userGroupId'] == username:
+                ace['right'] = right
+                return True
+        model['acl'].append({'userGroupId': username, 'right': right, 'type': 'U', 'status': 'CONFIRMED'})
+        return True
+
+    @staticmethod
+    def acl_delete(model, username):
+        for ace in list(model['acl']):
+            if ace['userGroupId'] == username:
+                model['acl'].remove(ace)
+                return True
+        return False
+
+
+class Factory:
+    """ Simulated j.clients.openvcloud, returning clients of the simulator """
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def get(self, instance, *args, **kwargs):
+        return self._sim.client(instance)
+
+
+class Config:
+    """ Connection settings of a client, saved by the openvcloud template """
+
+    def save(self):
+        pass
+
+
+class Client:
+    """ Simulated j.clients.openvcloud client """
+
+    def __init__(self, sim, instance):
+        self._sim = sim
+        self.instance = instance
+        self.api = API(sim)
+        self.config = Config()
+
+    @property
+    def locations(self):
+        self._sim.call('cloudapi.locations.list')
+        return [dict(LOCATION)]
+
+    @property
+    def accounts(self):
+        self._sim.call('cloudapi.accounts.list')
+        return [Account(self._sim, self, account_id) for account_id in self._sim.accounts]
+
+    def account_get(self, name, create=True, maxMemoryCapacity=-1, maxVDiskCapacity=-1,
+                    maxCPUCapacity=-1, maxNumPublicIP=-1, **kwargs):
+        self._sim.call('cloudapi.accounts.list')
+        for account_id, model in self._sim.accounts.items():
+            if model['name'] == name:
+                return Account(self._sim, self, account_id)
+        if not create:
+            raise self._sim.not_found('account', name)
+
+        self._sim.call('cloudbroker.account.create')
+        account_id = self._sim.new_id()
+        self._sim.accounts[account_id] = {
+            'id': account_id,
+            'name': name,
+            'status': 'CONFIRMED',
+            'acl': [],
+            'maxMemoryCapacity': maxMemoryCapacity,
+            'maxVDiskCapacity': maxVDiskCapacity,
+            'maxCPUCapacity': maxCPUCapacity,
+            'maxNumPublicIP': maxNumPublicIP,
+        }
+        return Account(self._sim, self, account_id)
+
+    def space_get(self, accountName, spaceName, create=True, **kwargs):
+        account = self.account_get(accountName, create=False)
+        return account.space_get(spaceName, create=create, **kwargs)
+
+
+class Account:
+    """ Simulated account """
+
+    def __init__(self, sim, client, account_id):
+        self._sim = sim
+        self.client = client
+        self.id = account_id
+        self.model = dict(sim.accounts[account_id], acl=[dict(ace) for ace in sim.accounts[account_id]['acl']])
+
+    @property
+    def _state(self):
+        try:
+            return self._sim.accounts[self.id]
+        except KeyError:
+            raise self._sim.not_found('account', self.id)
+
+    def refresh(self):
+        self._sim.call('cloudapi.accounts.get')
+        state = self._state
+        self.model = dict(state, acl=[dict(ace) for ace in state['acl']])
+
+    def save(self):
+        self._sim.call('cloudapi.accounts.update')
+        for key in ['maxMemoryCapacity', 'maxVDiskCapacity', 'maxCPUCapacity', 'maxNumPublicIP']:
+            self._state[key] = self.model[key]
+
+    def delete(self):
+        self._sim.call('cloudbroker.account.delete')
+        self._sim.accounts.pop(self.id, None)
+
+    @property
+    def spaces(self):
+        self._sim.call('cloudapi.cloudspaces.list')
+        return [Space(self._sim, self, space_id) for space_id, model in self._sim.cloudspaces.items()
+                if model['accountId'] == self.id]
+
+    def space_get(self, name, create=True, maxMemoryCapacity=-1, maxVDiskCapacity=-1,
+                  maxCPUCapacity=-1, maxNumPublicIP=-1, maxNetworkPeerTransfer=-1,
+                  externalnetworkId=None, **kwargs):
+        self._sim.call('cloudapi.cloudspaces.list')
+        for space_id, model in self._sim.cloudspaces.items():
+            if model['accountId'] == self.id and model['name'] == name:
+                return Space(self._sim, self, space_id)
+        if not create:
+            raise self._sim.not_found('cloudspace', name)
+
+        self._sim.call('cloudapi.cloudspaces.create')
+        space_id = self._sim.new_id()
+        self._sim.cloudspaces[space_id] = {
+            'id': space_id,
+            'name': name,
+            'accountId': self.id,
+            'status': 'DEPLOYED',
+            'location': LOCATION['name'],
+            'externalnetworkip': '10.0.%s.%s' % (space_id // 256 % 256, space_id % 256),
+            'acl': [],
+            'maxMemoryCapacity': maxMemoryCapacity,
+            'maxVDiskCapacity': maxVDiskCapacity,
+            'maxCPUCapacity': maxCPUCapacity,
+            'maxNumPublicIP': maxNumPublicIP,
+            'maxNetworkPeerTransfer': maxNetworkPeerTransfer,
+        }
+        return Space(self._sim, self, space_id)
+
+    @property
+    def disks(self):
+        return self.client.api.cloudapi.disks.list(accountId=self.id)
+
+    def disk_create(self, name, gid, description, size=10, type='D'):
+        self._sim.call('cloudapi.disks.create')
+        disk_id = self._sim.new_id()
+        self._sim.disks[disk_id] = {
+            'id': disk_id,
+            'name': name,
+            'description': description,
+            'accountId': self.id,
+            'sizeMax': size,
+            'type': type,
+            'machineId': None,
+            'iotune': {},
+        }
+        return disk_id
+
+    def disk_delete(self, disk_id, detach=False):
+        self._sim.call('cloudapi.disks.delete')
+        disk = self._sim.disks.get(disk_id)
+        if disk is None:
+            raise self._sim.not_found('disk', disk_id)
+        if disk['machineId'] and not detach:
+            raise SimulatedError(409, 'disk %s is attached' % disk_id)
+        del self._sim.disks[disk_id]
+
+    def authorize_user(self, username, right):
+        self._sim.call('cloudapi.accounts.addUser')
+        return self._sim.acl_set(self._state, username, right)
+
+    def update_access(self, username, right):
+        self._sim.call('cloudapi.accounts.updateUser')
+        return self._sim.acl_set(self._state, username, right)
+
+    def unauthorize_user(self, username):
+        self._sim.call('cloudapi.accounts.deleteUser')
+        return self._sim.acl_delete(self._state, username)
+
+
+class Space:
+    """ Simulated cloudspace """
+
+    def __init__(self, sim, account, space_id):
+        self._sim = sim
+        self.account = account
+        self.id = space_id
+        state = sim.cloudspaces[space_id]
+        self.model = dict(state, acl=[dict(ace) for ace in state['acl']])
+
+    @property
+    def _state(self):
+        try:
+            return self._sim.cloudspaces[self.id]
+        except KeyError:
+            raise self._sim.not_found('cloudspace', self.id)
+
+    @property
+    def ipaddr_pub(self):
+        return self.model['externalnetworkip']
+
+    def refresh(self):
+        self._sim.call('cloudapi.cloudspaces.get')
+        state = self._state
+        self.model = dict(state, acl=[dict(ace) for ace in state['acl']])
+
+    def save(self):
+        self._sim.call('cloudapi.cloudspaces.update')
+        for key in ['maxMemoryCapacity', 'maxVDiskCapacity', 'maxCPUCapacity',
+                    'maxNumPublicIP', 'maxNetworkPeerTransfer']:
+            self._state[key] = self.model[key]
+
+    def delete(self):
+        self._sim.call('cloudapi.cloudspaces.delete')
+        self._sim.cloudspaces.pop(self.id, None)
+
+    def enable(self, reason):
+        self._sim.call('cloudapi.cloudspaces.enable')
+        self._state['status'] = 'DEPLOYED'
+
+    def disable(self, reason):
+        self._sim.call('cloudapi.cloudspaces.disable')
+        self._state['status'] = 'DISABLED'
+
+    def authorize_user(self, username, right):
+        self._sim.call('cloudapi.cloudspaces.addUser')
+        return self._sim.acl_set(self._state, username, right)
+
+    def update_access(self, username, right):
+        self._sim.call('cloudapi.cloudspaces.updateUser')
+        return self._sim.acl_set(self._state, username, right)
+
+    def unauthorize_user(self, username):
+        self._sim.call('cloudapi.cloudspaces.deleteUser')
+        return self._sim.acl_delete(self._state, username)
+
+    @property
+    def machines(self):
+        self._sim.call('cloudapi.machines.list')
+        return {model['name']: Machine(self._sim, self, machine_id)
+                for machine_id, model in self._sim.machines.items()
+                if model['cloudspaceid'] == self.id}
+
+    def _machine_id(self, name):
+        """ Id of VM @name, the client looks it up in the listing of the cloudspace """
+        self._sim.call('cloudapi.machines.list')
+        for machine_id, model in self._sim.machines.items():
+            if model['cloudspaceid'] == self.id and model['name'] == name:
+                return machine_id
+        return None
+
+    def machine_get(self, name, create=False, **kwargs):
+        machine_id = self._machine_id(name)
+        if machine_id is not None:
+            self._sim.call('cloudapi.machines.get')
+            return Machine(self._sim, self, machine_id)
+        if not create:
+            raise self._sim.not_found('machine', name)
+        return self.machine_create(name, **kwargs)
+
+    def machine_create(self, name, sshkeyname=None, image='Ubuntu 16.04', disksize=10,
+                       datadisks=(), sizeId=1, managed_private=False, **kwargs):
+        if self._machine_id(name) is not None:
+            raise RuntimeError('Name is not unique, already exists in cloudspace %s' % self.id)
+        self._sim.call('cloudapi.machines.create')
+        machine_id = self._sim.new_id()
+        disk_ids = []
+        for size, disk_type in [(disksize, 'B')] + [(size, 'D') for size in datadisks]:
+            disk_id = self._sim.new_id()
+            self._sim.disks[disk_id] = {
+                'id': disk_id,
+                'name': '%s disk %s' % (name, disk_type),
+                'description': '',
+                'accountId': self.account.id,
+                'sizeMax': size,
+                'type': disk_type,
+                'machineId': machine_id,
+                'iotune': {},
+            }
+            disk_ids.append(disk_id)
+
+        self._sim.machines[machine_id] = {
+            'id': machine_id,
+            'name': name,
+            'cloudspaceid': self.id,
+            'status': 'RUNNING',
+            'imagename': image,
+            'sizeid': sizeId,
+            'disks': disk_ids,
+            'snapshots': [],
+            'accounts': [{'login': 'cloudscalers', 'password': 'sim-%s' % machine_id}],
+            'interfaces': [{'ipAddress': '192.168.103.%s' % (machine_id % 254 + 1)}],
+            'mounts': {},
+        }
+        return Machine(self._sim, self, machine_id)
+
+
+class Machine:
+    """ Simulated virtual machine """
+
+    def __init__(self, sim, space, machine_id):
+        self._sim = sim
+        self.space = space
+        self.id = machine_id
+        self.model = dict(sim.machines[machine_id])
+        self.name = self.model['name']
+
+    @property
+    def _state(self):
+        try:
+            return self._sim.machines[self.id]
+        except KeyError:
+            raise self._sim.not_found('machine', self.id)
+
+    @property
+    def ipaddr_priv(self):
+        return self.model['interfaces'][0]['ipAddress']
+
+    @property
+    def ipaddr_public(self):
+        return self.space.ipaddr_pub
+
+    @property
+    def disks(self):
+        self._sim.call('cloudapi.machines.get')
+        return [dict(self._sim.disks[disk_id]) for disk_id in self._state['disks']]
+
+    def _set_status(self, action, status):
+        self._sim.call('cloudapi.machines.%s' % action)
+        self._state['status'] = status
+
+    def start(self):
+        self._set_status('start', 'RUNNING')
+
+    def stop(self):
+        self._set_status('stop', 'HALTED')
+
+    def restart(self):
+        self._set_status('reboot', 'RUNNING')
+
+    def reset(self):
+        self._set_status('reset', 'RUNNING')
+
+    def pause(self):
+        self._set_status('pause', 'PAUSED')
+
+    def resume(self):
+        self._set_status('resume', 'RUNNING')
+
+    def delete(self):
+        self._sim.call('cloudapi.machines.delete')
+        for disk_id in self._sim.machines.pop(self.id)['disks']:
+            self._sim.disks.pop(disk_id, None)
+
+    def clone(self, name):
+        self._sim.call('cloudapi.machines.clone')
+        model = self._state
+        return self.space.machine_create(name, sizeId=model['sizeid'], image=model['imagename'])
+
+    def snapshot_create(self):
+        self._sim.call('cloudapi.machines.snapshot')
+        self._state['snapshots'].append({'epoch': self._sim.new_id(), 'name': 'snapshot'})
+
+    @property
+    def snapshots(self):
+        self._sim.call('cloudapi.machines.listSnapshots')
+        return list(self._state['snapshots'])
+
+    def snapshot_rollback(self, snapshot_epoch):
+        self._sim.call('cloudapi.machines.rollbackSnapshot')
+
+    def snapshot_delete(self, snapshot_epoch):
+        self._sim.call('cloudapi.machines.deleteSnapshot')
+        self._state['snapshots'] = [snapshot for snapshot in self._state['snapshots']
+                                    if snapshot['epoch'] != snapshot_epoch]
+
+    def disk_add(self, name, description, size=10, type='D'):
+        disk_id = self.space.account.disk_create(name, LOCATION['gid'], description, size, type)
+        self.disk_attach(disk_id)
+        return disk_id
+
+    def disk_attach(self, disk_id):
+        self._sim.call('cloudapi.machines.attachDisk')
+        self._sim.disks[disk_id]['machineId'] = self.id
+        self._state['disks'].append(disk_id)
+
+    def disk_detach(self, disk_id):
+        self._sim.call('cloudapi.machines.detachDisk')
+        self._sim.disks[disk_id]['machineId'] = None
+        self._state['disks'].remove(disk_id)
+
+    @property
+    def prefab(self):
+        return Prefab(self._sim, self._state)
+
+    prefab_private = prefab
+
+
+class Prefab:
+    """ Simulated prefab of a machine """
+
+    def __init__(self, sim, machine):
+        self.core = PrefabCore(sim, machine)
+        self.executor = Executor()
+
+
+class PrefabCore:
+    """
+    Simulated `prefab.core` of a machine
+
+    Commands are accepted and answered with the state of the machine mounts,
+    the way templates/node/bootstrap_disk.sh reports it.
+    """
+
+    def __init__(self, sim, machine):
+        self._sim = sim
+        self._machine = machine
+
+    def run(self, cmd, *args, **kwargs):
+        self._sim.call('ssh.run')
+        mounts = self._machine['mounts']
+        formatted = 'CHECK_ONLY' not in cmd and '/dev/vdb' not in mounts
+        if formatted:
+            mounts['/dev/vdb'] = {'source': '/dev/vdb', 'target': '/var', 'fstype': 'ext4'}
+        filesystems = [mounts['/dev/vdb']] if '/dev/vdb' in mounts else []
+        return 0, json.dumps({'formatted': formatted, 'mount': {'filesystems': filesystems}}), ''
+
+
+class Executor:
+    """ Simulated `prefab.executor`, the SSH connection always succeeds """
+
+    def __init__(self):
+        self.sshclient = SSHClient()
+
+
+class SSHClient:
+    """ Simulated SSH client of a machine """
+
+    def connect(self):
+        pass
+
+
+class API:
+    """ Simulated portal api of the client """
+
+    def __init__(self, sim):
+        self.cloudapi = CloudAPI(sim)
+        self.system = SystemAPI(sim)
+
+
+class CloudAPI:
+    """ Simulated `api.cloudapi` """
+
+    def __init__(self, sim):
+        self.accounts = AccountsAPI(sim)
+        self.cloudspaces = CloudspacesAPI(sim)
+        self.machines = MachinesAPI(sim)
+        self.portforwarding = PortforwardingAPI(sim)
+        self.disks = DisksAPI(sim)
+
+
+class AccountsAPI:
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def get(self, accountId):
+        self._sim.call('cloudapi.accounts.get')
+        try:
+            model = self._sim.accounts[accountId]
+        except KeyError:
+            raise self._sim.not_found('account', accountId)
+        return dict(model, acl=[dict(ace) for ace in model['acl']])
+
+    def list(self):
+        self._sim.call('cloudapi.accounts.list')
+        return [dict(model, acl=[dict(ace) for ace in model['acl']]) for model in self._sim.accounts.values()]
+
+
+class CloudspacesAPI:
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def get(self, cloudspaceId):
+        self._sim.call('cloudapi.cloudspaces.get')
+        try:
+            return dict(self._sim.cloudspaces[cloudspaceId])
+        except KeyError:
+            raise self._sim.not_found('cloudspace', cloudspaceId)
+
+    def list(self):
+        self._sim.call('cloudapi.cloudspaces.list')
+        return [dict(model) for model in self._sim.cloudspaces.values()]
+
+
+class MachinesAPI:
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def get(self, machineId):
+        self._sim.call('cloudapi.machines.get')
+        try:
+            model = self._sim.machines[machineId]
+        except KeyError:
+            raise self._sim.not_found('machine', machineId)
+        return {key: model[key] for key in ('id', 'name', 'status', 'imagename', 'sizeid', 'cloudspaceid')}
+
+    def list(self, cloudspaceId):
+        self._sim.call('cloudapi.machines.list')
+        return [{key: model[key] for key in ('id', 'name', 'status', 'imagename', 'sizeid')}
+                for model in self._sim.machines.values() if model['cloudspaceid'] == cloudspaceId]
+
+    def _set_status(self, action, machineId, status):
+        self._sim.call('cloudapi.machines.%s' % action)
+        try:
+            self._sim.machines[machineId]['status'] = status
+        except KeyError:
+            raise self._sim.not_found('machine', machineId)
+        return True
+
+    def start(self, machineId, **kwargs):
+        return self._set_status('start', machineId, 'RUNNING')
+
+    def stop(self, machineId, **kwargs):
+        return self._set_status('stop', machineId, 'HALTED')
+
+    def reboot(self, machineId):
+        return self._set_status('reboot', machineId, 'RUNNING')
+
+    def reset(self, machineId):
+        return self._set_status('reset', machineId, 'RUNNING')
+
+    def pause(self, machineId):
+        return self._set_status('pause', machineId, 'PAUSED')
+
+    def resume(self, machineId):
+        return self._set_status('resume', machineId, 'RUNNING')
+
+
+class PortforwardingAPI:
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def create(self, cloudspaceId, protocol, localPort, publicPort, publicIp, machineId):
+        self._sim.call('cloudapi.portforwarding.create')
+        for forward in self._sim.portforwards.values():
+            if (forward['cloudspaceId'] == cloudspaceId and forward['publicPort'] == str(publicPort)
+                    and forward['protocol'] == protocol):
+                raise SimulatedError(409, 'public port %s already in use' % publicPort)
+        forward_id = self._sim.new_id()
+        self._sim.portforwards[forward_id] = {
+            'id': forward_id,
+            'cloudspaceId': cloudspaceId,
+            'protocol': protocol,
+            'localPort': str(localPort),
+            'publicPort': str(publicPort),
+            'publicIp': publicIp,
+            'machineId': machineId,
+        }
+        return forward_id
+
+    def list(self, cloudspaceId, machineId=None):
+        self._sim.call('cloudapi.portforwarding.list')
+        return [dict(forward) for forward in self._sim.portforwards.values()
+                if forward['cloudspaceId'] == cloudspaceId
+                and (machineId is None or forward['machineId'] == machineId)]
+
+    def delete(self, id, cloudspaceId=None, **kwargs):
+        self._sim.call('cloudapi.portforwarding.delete')
+        if self._sim.portforwards.pop(id, None) is None:
+            raise self._sim.not_found('portforward', id)
+        return True
+
+
+class DisksAPI:
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def get(self, diskId):
+        self._sim.call('cloudapi.disks.get')
+        try:
+            return dict(self._sim.disks[diskId])
+        except KeyError:
+            raise self._sim.not_found('disk', diskId)
+
+    def list(self, accountId, type=None):
+        self._sim.call('cloudapi.disks.list')
+        return [dict(disk) for disk in self._sim.disks.values()
+                if disk['accountId'] == accountId and (type is None or disk['type'] == type)]
+
+    def limitIO(self, diskId, **limits):
+        self._sim.call('cloudapi.disks.limitIO')
+        try:
+            self._sim.disks[diskId]['iotune'] = dict(limits)
+        except KeyError:
+            raise self._sim.not_found('disk', diskId)
+        return True
+
+
+class SystemAPI:
+    """ Simulated `api.system` """
+
+    def __init__(self, sim):
+        self.usermanager = UsermanagerAPI(sim)
+
+
+class UsermanagerAPI:
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    def userexists(self, name):
+        self._sim.call('system.usermanager.userexists')
+        return name in self._sim.users
+
+    def create(self, username, password, groups, emails, domain='', provider=None):
+        self._sim.call('system.usermanager.create')
+        fqid = '%s@%s' % (username, provider) if provider else username
+        self._sim.users[fqid] = {'groups': list(groups), 'emails': list(emails)}
+        return True
+
+    def delete(self, username):
+        self._sim.call('system.usermanager.delete')
+        self._sim.users.pop(username, None)
+        return True
+
+    def editUser(self, username, groups, provider=None, emails=None):
+        self._sim.call('system.usermanager.editUser')
+        self._sim.users[username] = {'groups': list(groups), 'emails': list(emails or [])}
+        return True
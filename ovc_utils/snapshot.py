@@ -0,0 +1,177 @@
+"""
+Inventory snapshots of an ovc, for a fast start of robots adopting existing infrastructure.
+
+A snapshot holds the accounts, cloudspaces (with their ACLs), VMs and disks
+of an ovc, pulled with one listing call per kind of entity and per
+cloudspace/account. It is written to a file, msgpack if available and JSON
+otherwise. Once loaded for an ovc connection, services installing existing
+entities look up their ids in the snapshot instead of calling the OVC.
+Entities may be deleted or re-created after the snapshot was taken, so it is
+only used for MAX_AGE seconds:
+
+    inventory = pull(ovc)
+    dump(inventory, '/opt/var/data/zrobot/be-gen.snapshot')
+    snapshots.load('be-gen', '/opt/var/data/zrobot/be-gen.snapshot')
+    snapshots.get('be-gen').cloudspace('account', 'vdc')
+"""
+
+import json
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from ovc_utils.concurrency import bounded_map
+
+VERSION = 1
+
+# number of cloudspaces and accounts listed at the same time
+CONCURRENCY = 10
+
+# seconds a snapshot is used after it was taken
+MAX_AGE = 3600
+
+
+def pull(ovc, concurrency=CONCURRENCY):
+    """
+    Return inventory of ovc connection @ovc
+
+    :return: dict with lists of `accounts`, `cloudspaces`, `machines` and `disks`.
+             VMs get the id of their cloudspace as `cloudspaceId`.
+    """
+    cloudapi = ovc.api.cloudapi
+    accounts = cloudapi.accounts.list()
+    cloudspaces = cloudapi.cloudspaces.list()
+
+    def machines(cloudspace):
+        return [dict(machine, cloudspaceId=cloudspace['id'])
+                for machine in cloudapi.machines.list(cloudspaceId=cloudspace['id'])]
+
+    def disks(account):
+        return cloudapi.disks.list(accountId=account['id'])
+
+    def collect(func, items):
+        entities = []
+        for result, err in bounded_map(func, items, concurrency):
+            if err is not None:
+                raise err
+            entities.extend(result)
+        return entities
+
+    return {
+        'version': VERSION,
+        'created': int(time.time()),
+        'accounts': accounts,
+        'cloudspaces': cloudspaces,
+        'machines': collect(machines, cloudspaces),
+        'disks': collect(disks, accounts),
+    }
+
+
+def dump(inventory, path):
+    """ Write @inventory to file @path, return the format used """
+    if msgpack is not None:
+        with open(path, 'wb') as snapshot:
+            snapshot.write(msgpack.packb(inventory, use_bin_type=True))
+        return 'msgpack'
+
+    with open(path, 'w') as snapshot:
+        json.dump(inventory, snapshot, separators=(',', ':'))
+    return 'json'
+
+
+def load(path):
+    """ Return inventory of snapshot file @path """
+    with open(path, 'rb') as snapshot:
+        content = snapshot.read()
+
+    # JSON snapshots are objects, msgpack maps never start with `{`
+    if content.lstrip()[:1] == b'{':
+        return json.loads(content.decode())
+
+    if msgpack is None:
+        raise RuntimeError('msgpack is required to read snapshot "%s"' % path)
+    return msgpack.unpackb(content, raw=False)
+
+
+class Snapshot:
+    """
+    Inventory of an ovc indexed for lookups by name, used for @max_age seconds after it was taken
+    """
+
+    def __init__(self, inventory, max_age=MAX_AGE):
+        if inventory.get('version') != VERSION:
+            raise ValueError('unsupported snapshot version %s' % inventory.get('version'))
+
+        self.created = inventory['created']
+        self.max_age = max_age
+        self._accounts = {account['name']: account for account in inventory['accounts']}
+        self._cloudspaces = {(cloudspace['accountId'], cloudspace['name']): cloudspace
+                             for cloudspace in inventory['cloudspaces']}
+        self._machines = {(machine['cloudspaceId'], machine['name']): machine
+                          for machine in inventory['machines']}
+        self._disks = {disk['id']: disk for disk in inventory['disks']}
+
+    @property
+    def expired(self):
+        return time.time() - self.created > self.max_age
+
+    def account(self, name):
+        """ Return account @name, None if it isn't in the snapshot """
+        return self._accounts.get(name)
+
+    def cloudspace(self, account_name, name):
+        """ Return cloudspace @name of account @account_name, None if it isn't in the snapshot """
+        account = self.account(account_name)
+        if account is None:
+            return None
+        return self._cloudspaces.get((account['id'], name))
+
+    def machine(self, cloudspace_id, name):
+        """ Return VM @name of cloudspace @cloudspace_id, None if it isn't in the snapshot """
+        return self._machines.get((cloudspace_id, name))
+
+    def disk(self, disk_id):
+        """ Return disk @disk_id, None if it isn't in the snapshot """
+        return self._disks.get(disk_id)
+
+
+class Snapshots:
+    """
+    Snapshots loaded by name of the ovc connection instance
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def set(self, instance, snapshot):
+        """ Use @snapshot for connection @instance """
+        self._snapshots[instance] = snapshot
+
+    def load(self, instance, path, max_age=MAX_AGE):
+        """ Load snapshot file @path for connection @instance, used for @max_age seconds after it was taken """
+        snapshot = Snapshot(load(path), max_age)
+        self.set(instance, snapshot)
+        return snapshot
+
+    def get(self, instance):
+        """ Return snapshot of connection @instance, None if there is none or it expired """
+        snapshot = self._snapshots.get(instance)
+        if snapshot is not None and snapshot.expired:
+            self.discard(instance)
+            return None
+        return snapshot
+
+    def discard(self, instance):
+        self._snapshots.pop(instance, None)
+
+    def clear(self):
+        self._snapshots.clear()
+
+
+snapshots = Snapshots()
@@ -0,0 +1,83 @@
+from unittest import TestCase
+
+import gevent
+from ovc_utils import benchmark
+from ovc_utils.resolver import resolver
+from ovc_utils.simulator import Simulator
+
+
+class TestBenchmark(TestCase):
+
+    def test_percentile(self):
+        values = [0.1 * i for i in range(1, 11)]
+        self.assertAlmostEqual(benchmark.percentile(values, 50), 0.5)
+        self.assertAlmostEqual(benchmark.percentile(values, 90), 0.9)
+        self.assertAlmostEqual(benchmark.percentile(values, 99), 1.0)
+        self.assertIsNone(benchmark.percentile([], 50))
+
+    def test_summary(self):
+        result = benchmark.summary([3, 1, 2])
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(result['mean'], 2)
+        self.assertEqual(result['max'], 3)
+        self.assertEqual(result['p50'], 2)
+
+    def test_compare(self):
+        baseline = {
+            'latency': {'node.install': {'p50': 1.0, 'p90': 2.0, 'p99': 3.0}},
+            'ovc_calls': {'cloudapi.machines.list': 10},
+        }
+        result = {
+            'latency': {
+                'node.install': {'p50': 1.1, 'p90': 3.0, 'p99': 3.0},
+                'disk.install': {'p50': 1.0, 'p90': 1.0, 'p99': 1.0},
+            },
+            'ovc_calls': {'cloudapi.machines.list': 10, 'cloudapi.disks.list': 1},
+        }
+        regressions = benchmark.compare(baseline, result)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('node.install p90'))
+        self.assertTrue(regressions[1].startswith('cloudapi.disks.list calls'))
+        self.assertEqual(benchmark.compare(result, result), [])
+
+    def test_run(self):
+        result = benchmark.run(accounts=1, vdcs=2, nodes=2, info_rounds=2, monitor_rounds=2)
+
+        self.assertEqual(result['latency']['node.install']['count'], 4)
+        self.assertEqual(result['latency']['vdc.uninstall']['count'], 2)
+        # every node has a boot and a data disk service
+        self.assertEqual(result['latency']['disk.install']['count'], 8)
+        self.assertEqual(result['ovc_calls']['cloudapi.machines.create'], 4)
+        self.assertEqual(result['latency']['node.monitor']['count'], 8)
+        # VMs are listed once per cloudspace for all monitor actions, the client lists
+        # them once more when a node creates its VM and when it gets it to delete it
+        listed = result['ovc_calls']['cloudapi.machines.list'] - 2 * result['latency']['node.install']['count']
+        self.assertLess(listed, result['latency']['node.monitor']['count'])
+        self.assertEqual(result['memory']['node']['services'], 4)
+        self.assertEqual(result['memory']['disk']['services'], 8)
+        self.assertEqual(result['ovc_calls_total'], sum(result['ovc_calls'].values()))
+        self.assertGreater(result['actions_per_second'], 0)
+
+    def test_vdc_waits_for_children(self):
+        """ vdc actions waiting for nodes and disks don't deadlock when the resolver cache is cold """
+        benchmark.reset()
+        robot = benchmark.Robot()
+        with Simulator().patch():
+            _, (vdc,), _ = benchmark.create_services(robot, accounts=1, vdcs=1, nodes=0)
+            for proxy in robot.services.find():
+                if proxy.service.template_name in ('account', 'vdc'):
+                    proxy.schedule_action('install').wait(die=True)
+
+            # the children resolve their vdc with get_info on the vdc running the action
+            actions = [
+                ('nodes_create', {'nodes': [{'name': 'vm', 'sshKey': 'sshkey', 'bootDiskSize': 10,
+                                             'dataDiskSize': 10}]}),
+                ('nodes_power', {'action': 'stop'}),
+                ('disks_limit_io', {'policy': {'totalIopsSec': 500}}),
+            ]
+            for action, args in actions:
+                resolver.clear()
+                with gevent.Timeout(10):
+                    result = vdc.schedule_action(action, args).wait(die=True).result
+                self.assertTrue(result)
+                self.assertTrue(all(item['state'] == 'ok' for item in result.values()), result)
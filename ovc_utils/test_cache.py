@@ -0,0 +1,28 @@
+from unittest import TestCase
+from unittest import mock
+
+from ovc_utils.cache import TTLValue
+
+
+class TestTTLValue(TestCase):
+
+    def test_expires(self):
+        value = TTLValue(ttl=10)
+        self.assertTrue(value.expired)
+        self.assertEqual(value.get('default'), 'default')
+
+        with mock.patch('time.time', return_value=100):
+            value.set('cached')
+            self.assertEqual(value.get(), 'cached')
+
+        with mock.patch('time.time', return_value=110):
+            self.assertTrue(value.expired)
+            self.assertIsNone(value.get())
+            # the expired value is dropped
+            self.assertIsNone(value._value)
+
+    def test_clear(self):
+        value = TTLValue(ttl=10)
+        value.set('cached')
+        value.clear()
+        self.assertTrue(value.expired)
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from unittest import mock
+from unittest.mock import MagicMock
+
+from js9 import j
+from ovc_utils import retry, waiter
+from ovc_utils.cache import TTLValue
+from ovc_utils.clients import ClientPool
+
+
+class TestClientPool(TestCase):
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_get_shared(self, ovc):
+        pool = ClientPool()
+        client = pool.get('ovc_instance')
+        self.assertIs(pool.get('ovc_instance'), client)
+        ovc.get.assert_called_once_with('ovc_instance')
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_get_bounds_session(self, ovc):
+        pool = ClientPool(max_connections=3)
+        session = ovc.get.return_value.api._session
+        pool.get('ovc_instance')
+        adapter = session.mount.call_args[0][1]
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertTrue(adapter._pool_block)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_get_without_session(self, ovc):
+        ovc.get.return_value = MagicMock(api=object())
+        with self.assertLogs('ovc_utils.clients', level='WARNING') as logs:
+            ClientPool().get('ovc_instance')
+        self.assertIn('ovc_instance', logs.output[0])
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_invalidate(self, ovc):
+        ovc.get.side_effect = lambda instance: MagicMock()
+        pool = ClientPool()
+        client = pool.get('ovc_instance')
+        pool.invalidate('ovc_instance')
+        self.assertIsNot(pool.get('ovc_instance'), client)
+        self.assertEqual(ovc.get.call_count, 2)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_invalidate_drops_state(self, ovc):
+        client = MagicMock(instance='ovc_instance')
+        ovc.get.return_value = client
+        pool = ClientPool()
+        pool.get('ovc_instance')
+        retry.breaker('ovc_instance').failure()
+        waiter._watchers['ovc_instance'] = waiter.CloudspaceWatcher(client)
+
+        pool.invalidate('ovc_instance')
+        self.assertNotIn('ovc_instance', retry._breakers)
+        self.assertNotIn('ovc_instance', waiter._watchers)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_connect_drops_caches(self, ovc):
+        ovc.get.side_effect = lambda instance: MagicMock()
+        pool = ClientPool()
+        service = MagicMock(_ovc=None, _space='space', _machine=TTLValue(60))
+        service._machine.set('machine')
+
+        client = pool.connect(service, 'ovc_instance', ('_space', '_machine'))
+        self.assertIs(service._ovc, client)
+        self.assertEqual(service._space, 'space')
+
+        # the objects of the old client are dropped when the connection was invalidated
+        pool.invalidate('ovc_instance')
+        self.assertIsNot(pool.connect(service, 'ovc_instance', ('_space', '_machine')), client)
+        self.assertIsNone(service._space)
+        self.assertIsNone(service._machine.get())
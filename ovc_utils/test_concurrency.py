@@ -0,0 +1,76 @@
+import time
+from unittest import TestCase
+
+import gevent
+
+from ovc_utils.concurrency import bounded_map, parallel, report
+
+
+class TestBoundedMap(TestCase):
+
+    def test_results_in_order(self):
+        def func(item):
+            gevent.sleep(0.01 * (3 - item))
+            return item * 2
+
+        self.assertEqual(bounded_map(func, [1, 2, 3]), [(2, None), (4, None), (6, None)])
+
+    def test_errors_reported(self):
+        def func(item):
+            if item == 2:
+                raise RuntimeError('failed')
+            return item
+
+        results = bounded_map(func, [1, 2, 3])
+        self.assertEqual(results[0], (1, None))
+        self.assertIsNone(results[1][0])
+        self.assertIsInstance(results[1][1], RuntimeError)
+        self.assertEqual(results[2], (3, None))
+
+    def test_concurrency_bounded(self):
+        running = []
+        peak = []
+
+        def func(item):
+            running.append(item)
+            peak.append(len(running))
+            gevent.sleep(0.01)
+            running.remove(item)
+
+        bounded_map(func, range(10), concurrency=3)
+        self.assertEqual(max(peak), 3)
+
+
+class TestReport(TestCase):
+
+    def test_outcomes(self):
+        results = [(True, None), (None, RuntimeError('failed')), (0, None)]
+        self.assertEqual(report(['a', 'b', 'c'], results), {
+            'a': {'state': 'ok'},
+            'b': {'state': 'error', 'error': 'failed'},
+            'c': {'state': 'ok'},
+        })
+        self.assertEqual(report(['a', 'b', 'c'], results, changed=True), {
+            'a': {'state': 'ok', 'changed': True},
+            'b': {'state': 'error', 'error': 'failed'},
+            'c': {'state': 'ok', 'changed': False},
+        })
+
+
+class TestParallel(TestCase):
+
+    def test_concurrent(self):
+        def lookup(value):
+            gevent.sleep(0.05)
+            return value
+
+        start = time.time()
+        self.assertEqual(parallel(lambda: lookup(1), lambda: lookup(2)), [1, 2])
+        self.assertLess(time.time() - start, 0.09)
+
+    def test_error_raised(self):
+        def fail():
+            raise RuntimeError('failed')
+
+        with self.assertRaisesRegex(RuntimeError, 'failed'):
+            parallel(lambda: 1, fail)
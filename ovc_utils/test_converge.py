@@ -0,0 +1,34 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from ovc_utils.converge import converged, record, save_changes
+
+KEYS = ('name', 'maxCPUCapacity')
+
+
+class TestConverge(TestCase):
+
+    def test_converged(self):
+        data = {'name': 'account', 'maxCPUCapacity': 4, 'users': [], 'appliedHash': ''}
+        self.assertFalse(converged(data, KEYS))
+
+        record(data, KEYS)
+        self.assertTrue(converged(data, KEYS))
+
+        # only the given keys matter
+        data['users'].append('admin')
+        self.assertTrue(converged(data, KEYS))
+
+        data['maxCPUCapacity'] = 8
+        self.assertFalse(converged(data, KEYS))
+
+    def test_save_changes(self):
+        entity = MagicMock(model={'maxCPUCapacity': 4, 'maxNumPublicIP': 1})
+
+        changes = save_changes(entity, {'maxCPUCapacity': 4, 'maxNumPublicIP': 2, 'maxMemoryCapacity': -1})
+        self.assertEqual(changes, {'maxNumPublicIP': 2, 'maxMemoryCapacity': -1})
+        self.assertEqual(entity.model, {'maxCPUCapacity': 4, 'maxNumPublicIP': 2, 'maxMemoryCapacity': -1})
+        entity.save.assert_called_once_with()
+
+        self.assertEqual(save_changes(entity, {'maxCPUCapacity': 4}), {})
+        entity.save.assert_called_once_with()
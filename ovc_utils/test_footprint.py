@@ -0,0 +1,52 @@
+import sys
+from unittest import TestCase
+
+from ovc_utils.cache import TTLValue
+from ovc_utils.footprint import sizeof, footprint, usage
+
+
+class Remote:
+    """ Remote object of the OpenvCloud client """
+
+    def __init__(self, model):
+        self.model = model
+        self.client = object()
+
+
+class Node:
+    template_name = 'node'
+
+    def __init__(self, model=None):
+        self.data = {'name': 'vm', 'machineId': 1}
+        self._space = Remote(model) if model else None
+        self._machine = TTLValue(60)
+
+
+class TestFootprint(TestCase):
+
+    def test_sizeof(self):
+        model = {'id': 1, 'acl': [{'userGroupId': 'user@provider'}]}
+        self.assertGreater(sizeof(model), sys.getsizeof(model))
+        # the model of remote objects is counted, the client isn't
+        self.assertEqual(sizeof(Remote(model)), sys.getsizeof(Remote(model)) + sizeof(model))
+        self.assertEqual(sizeof(None), 0)
+
+        # shared values are counted once
+        self.assertEqual(sizeof([model, model]), sys.getsizeof([model, model]) + sizeof(model))
+
+    def test_remote_models(self):
+        model = {'id': 1234, 'acl': [{'userGroupId': 'user%d' % i} for i in range(100)]}
+        released = Node()
+        self.assertGreater(footprint(Node(model)), footprint(released) + sizeof(model) - 1)
+
+        released._machine.set(Remote(model))
+        self.assertGreaterEqual(footprint(released), sizeof(model))
+
+    def test_usage(self):
+        class Disk(Node):
+            template_name = 'disk'
+
+        report = usage([Node(), Node(), Disk()])
+        self.assertEqual(report['node']['services'], 2)
+        self.assertEqual(report['node']['bytes'], 2 * footprint(Node()))
+        self.assertEqual(report['disk']['services'], 1)
@@ -0,0 +1,132 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, PropertyMock
+
+import gevent
+from ovc_utils.inventory import DiskInventory, PortforwardIndex
+from ovc_utils.simulator import Simulator
+
+
+class NotFoundError(Exception):
+    response = MagicMock(status_code=404)
+
+
+class TestDiskInventory(TestCase):
+
+    def setUp(self):
+        self.ovc = MagicMock()
+        self.account = MagicMock(id=1)
+        self.listing = PropertyMock(return_value=[{'id': 10, 'name': 'disk10'},
+                                                  {'id': 11, 'name': 'disk11'}])
+        type(self.account).disks = self.listing
+
+    def test_listing_shared(self):
+        inventory = DiskInventory()
+        self.ovc.api.cloudapi.disks.get.side_effect = NotFoundError()
+        self.assertEqual(inventory.get(self.ovc, self.account, 10)['name'], 'disk10')
+        self.assertEqual(inventory.get(self.ovc, self.account, 11)['name'], 'disk11')
+        self.assertIsNone(inventory.get(self.ovc, self.account, 12))
+        self.assertEqual(self.listing.call_count, 1)
+        # disk missing from the listing is checked by id
+        self.ovc.api.cloudapi.disks.get.assert_called_once_with(diskId=12)
+
+    def test_listing_coalesced(self):
+        inventory = DiskInventory()
+
+        def slow_listing():
+            gevent.sleep(0.01)
+            return [{'id': 10, 'name': 'disk10'}]
+        self.listing.side_effect = slow_listing
+
+        greenlets = [gevent.spawn(inventory.disks, self.ovc, self.account) for _ in range(5)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(self.listing.call_count, 1)
+
+    def test_listing_expires(self):
+        inventory = DiskInventory(ttl=0)
+        inventory.disks(self.ovc, self.account)
+        inventory.disks(self.ovc, self.account)
+        self.assertEqual(self.listing.call_count, 2)
+
+    def test_fetch_by_id(self):
+        inventory = DiskInventory()
+        self.ovc.api.cloudapi.disks.get.return_value = {'id': 10, 'name': 'disk10', 'accountId': 1}
+        self.assertEqual(inventory.get(self.ovc, self.account, 10, fetch=True)['name'], 'disk10')
+        self.listing.assert_not_called()
+
+        # disk of another account
+        self.ovc.api.cloudapi.disks.get.return_value = {'id': 10, 'name': 'disk10', 'accountId': 2}
+        self.assertIsNone(inventory.get(self.ovc, self.account, 10, fetch=True))
+
+        self.ovc.api.cloudapi.disks.get.side_effect = NotFoundError()
+        self.assertIsNone(inventory.get(self.ovc, self.account, 10, fetch=True))
+
+    def test_add_remove(self):
+        inventory = DiskInventory()
+        inventory.disks(self.ovc, self.account)
+        inventory.add(self.ovc, self.account, {'id': 12, 'name': 'disk12'})
+        inventory.remove(self.ovc, self.account, 10)
+
+        self.assertEqual(sorted(inventory.disks(self.ovc, self.account)), [11, 12])
+        # cached listing is used even with fetch
+        self.assertEqual(inventory.get(self.ovc, self.account, 12, fetch=True)['name'], 'disk12')
+        self.ovc.api.cloudapi.disks.get.assert_not_called()
+        self.assertEqual(self.listing.call_count, 1)
+
+    def test_created_after_listing(self):
+        sim = Simulator()
+        ovc = sim.client()
+        account = ovc.account_get('account')
+        space = account.space_get('vdc')
+        space.machine_create('vm1')
+
+        inventory = DiskInventory()
+        inventory.disks(ovc, account)
+
+        # disks created by a VM after the listing was cached
+        machine = space.machine_create('vm2', datadisks=[10])
+        disk_id = machine.disk_add(name='extra', description='', size=10, type='D')
+        for disk in machine.model['disks'] + [disk_id]:
+            self.assertIsNotNone(inventory.get(ovc, account, disk))
+            self.assertIsNotNone(inventory.get(ovc, account, disk, fetch=True))
+        self.assertEqual(sim.calls['cloudapi.disks.list'], 1)
+        self.assertEqual(sim.calls['cloudapi.disks.get'], 3)
+
+        self.assertIsNone(inventory.get(ovc, account, 9999))
+
+
+class TestPortforwardIndex(TestCase):
+
+    def setUp(self):
+        self.ovc = MagicMock()
+        self.listing = self.ovc.api.cloudapi.portforwarding.list
+        self.listing.return_value = [
+            {'id': 1, 'publicPort': '22', 'localPort': '22', 'protocol': 'tcp', 'machineId': 10},
+            {'id': 2, 'publicPort': '80', 'localPort': '80', 'protocol': 'tcp', 'machineId': 11},
+        ]
+
+    def test_listing_shared(self):
+        index = PortforwardIndex()
+        self.assertEqual([fwd['id'] for fwd in index.machine(self.ovc, 5, 10)], [1])
+        self.assertEqual(len(index.forwards(self.ovc, 5)), 2)
+        self.listing.assert_called_once_with(cloudspaceId=5)
+
+    def test_conflict(self):
+        index = PortforwardIndex()
+        self.assertIsNone(index.conflict(self.ovc, 5, 22, 'tcp', 10, 22))
+        self.assertIsNone(index.conflict(self.ovc, 5, 22, 'udp', 11, 22))
+        self.assertIsNone(index.conflict(self.ovc, 5, 8080, 'tcp', 11, 80))
+        self.assertEqual(index.conflict(self.ovc, 5, 22, 'tcp', 11, 22)['id'], 1)
+        self.assertEqual(index.conflict(self.ovc, 5, 22, 'tcp', 10, 2222)['id'], 1)
+
+    def test_add_remove(self):
+        index = PortforwardIndex()
+        index.forwards(self.ovc, 5)
+        index.add({'id': 3, 'publicPort': 443, 'localPort': 443, 'protocol': 'tcp', 'machineId': 11})
+        index.remove(22, 'tcp')
+        self.assertEqual(sorted(index.forwards(self.ovc, 5)), [('443', 'tcp'), ('80', 'tcp')])
+        self.assertEqual(self.listing.call_count, 1)
+
+        # forwards without id can't be indexed, the listing is fetched again
+        index.add({'id': True, 'publicPort': 8080, 'localPort': 80, 'protocol': 'tcp', 'machineId': 11})
+        index.forwards(self.ovc, 5)
+        self.assertEqual(self.listing.call_count, 2)
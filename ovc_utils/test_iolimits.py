@@ -0,0 +1,20 @@
+from unittest import TestCase
+
+from ovc_utils import iolimits
+
+
+class TestValidate(TestCase):
+
+    def test_valid(self):
+        iolimits.validate({'totalIopsSec': 500, 'readBytesSec': 10, 'writeBytesSec': 0})
+        iolimits.validate({key: 0 for key in iolimits.IOTUNE})
+
+    def test_total_and_read_write(self):
+        with self.assertRaisesRegex(RuntimeError, 'iops_sec cannot be set'):
+            iolimits.validate({'maxIops': 100, 'writeIopsSec': 10})
+        with self.assertRaisesRegex(RuntimeError, 'bytes_sec_max cannot be set'):
+            iolimits.validate({'totalBytesSecMax': 100, 'readBytesSecMax': 10})
+
+    def test_unknown(self):
+        with self.assertRaisesRegex(ValueError, 'unknown IO limits: iops'):
+            iolimits.validate({'iops': 100})
@@ -0,0 +1,121 @@
+from collections import Counter
+from unittest import TestCase
+from unittest import mock
+from unittest.mock import MagicMock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ovc_utils.metrics import Metrics, InstrumentedAdapter, endpoint, current_origin, instrument, UNKNOWN
+from ovc_utils.concurrency import bounded_map
+
+
+@instrument
+class Vdc:
+    """ Looks like a template to the metrics """
+
+    template_name = 'vdc'
+
+    def __init__(self, name):
+        self.name = name
+
+    def user_authorize(self):
+        return self._refresh()
+
+    def get_info(self):
+        return self.user_authorize()
+
+    def nodes_create(self):
+        return bounded_map(lambda _: current_origin(), range(3))
+
+    def _refresh(self):
+        return current_origin()
+
+
+class TestMetrics(TestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(endpoint('https://g8.example.com/restmachine/cloudapi/portforwarding/create'),
+                         'cloudapi.portforwarding.create')
+        self.assertEqual(endpoint('https://g8.example.com/restmachine/system/usermanager/userexists?x=1'),
+                         'system.usermanager.userexists')
+
+    def test_current_origin(self):
+        self.assertEqual(Vdc('space').user_authorize(), ('vdc', 'space', 'user_authorize'))
+        # the outermost action wins
+        self.assertEqual(Vdc('space').get_info(), ('vdc', 'space', 'get_info'))
+        self.assertEqual(current_origin(), UNKNOWN)
+
+    def test_origin_fan_out(self):
+        # greenlets spawned by an action are attributed to it
+        origin = ('vdc', 'space', 'nodes_create')
+        self.assertEqual(Vdc('space').nodes_create(), [(origin, None)] * 3)
+        self.assertEqual(bounded_map(lambda _: current_origin(), range(2)), [(UNKNOWN, None)] * 2)
+
+    def test_observe_export(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        origin = ('vdc', 'space', 'install')
+        metrics.observe('cloudapi.cloudspaces.get', 0.05, 10, 100, origin=origin)
+        metrics.observe('cloudapi.cloudspaces.get', 0.5, 10, 100, error=True, origin=origin)
+
+        self.assertEqual(metrics.count(template='vdc'), 2)
+        self.assertEqual(metrics.count(action='uninstall'), 0)
+
+        labels = 'endpoint="cloudapi.cloudspaces.get",template="vdc",service="space",action="install"'
+        text = metrics.export()
+        self.assertIn('ovc_api_requests_total{%s} 2' % labels, text)
+        self.assertIn('ovc_api_errors_total{%s} 1' % labels, text)
+        self.assertIn('ovc_api_response_bytes_total{%s} 200' % labels, text)
+        self.assertIn('ovc_api_request_duration_seconds_bucket{%s,le="0.1"} 1' % labels, text)
+        self.assertIn('ovc_api_request_duration_seconds_bucket{%s,le="1"} 2' % labels, text)
+        self.assertIn('ovc_api_request_duration_seconds_bucket{%s,le="+Inf"} 2' % labels, text)
+
+    def test_export_retries(self):
+        retries = {'retries': Counter({'node.install': 3}), 'gave_up': Counter(), 'permanent': Counter()}
+        text = Metrics(retries=retries).export()
+        self.assertIn('# TYPE ovc_action_retries_total counter', text)
+        self.assertIn('ovc_action_retries_total{template="node",action="install"} 3', text)
+        self.assertIn('# TYPE ovc_action_gave_up_total counter', text)
+        self.assertNotIn('ovc_action', Metrics().export())
+
+    @mock.patch.object(HTTPAdapter, 'send')
+    def test_adapter(self, send):
+        metrics = Metrics()
+        adapter = InstrumentedAdapter(metrics)
+        send.return_value = MagicMock(status_code=200, headers={'Content-Length': '42'})
+        request = requests.Request(
+            'POST', 'https://g8/restmachine/cloudapi/disks/get', json={'diskId': 1}).prepare()
+
+        adapter.send(request)
+
+        send.side_effect = requests.exceptions.ConnectionError()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            adapter.send(request)
+
+        self.assertEqual(metrics.count(endpoint='cloudapi.disks.get'), 2)
+        text = metrics.export()
+        self.assertIn('ovc_api_errors_total{endpoint="cloudapi.disks.get",template="",service="",action=""} 1', text)
+        self.assertIn('ovc_api_response_bytes_total{endpoint="cloudapi.disks.get",template="",service="",action=""} 42', text)
+
+    @mock.patch.object(HTTPAdapter, 'send')
+    def test_adapter_scheduler(self, send):
+        scheduler = MagicMock()
+        adapter = InstrumentedAdapter(Metrics(), scheduler=scheduler)
+        send.return_value = MagicMock(status_code=200, headers={'Content-Length': '0'})
+        url = 'https://g8/restmachine/cloudapi/disks/get'
+
+        adapter.send(requests.Request('POST', url).prepare())
+        scheduler.acquire.assert_called_once_with(url, 'cloudapi.disks.get', '')
+
+        # requests of greenlets spawned by an interactive action get its priority
+        @instrument
+        class Node:
+            template_name = 'node'
+            name = 'vm'
+
+            def start(self):
+                bounded_map(lambda _: adapter.send(requests.Request('POST', url).prepare()), range(2))
+
+        Node().start()
+        scheduler.acquire.assert_called_with(url, 'cloudapi.disks.get', 'start')
+        self.assertEqual(scheduler.acquire.call_count, 3)
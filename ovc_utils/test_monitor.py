@@ -0,0 +1,95 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import gevent
+from ovc_utils.monitor import Listings, Monitor, fingerprint
+from ovc_utils.simulator import Simulator
+
+
+class TestListings(TestCase):
+
+    def setUp(self):
+        self.sim = Simulator()
+        self.ovc = self.sim.client()
+        account = self.ovc.account_get('account')
+        self.space = account.space_get('vdc')
+        self.space.machine_create('vm1')
+        self.space.machine_create('vm2')
+        self.sim.calls.clear()
+
+    def test_listing_shared(self):
+        listings = Listings()
+        machines = listings.machines(self.ovc, self.space.id)
+        self.assertEqual(sorted(machine['name'] for machine in machines.values()), ['vm1', 'vm2'])
+        listings.machines(self.ovc, self.space.id)
+        self.assertIn(self.space.id, listings.cloudspaces(self.ovc))
+        self.assertEqual(len(listings.accounts(self.ovc)), 1)
+        self.assertEqual(self.sim.calls['cloudapi.machines.list'], 1)
+
+    def test_listing_coalesced(self):
+        self.sim.latency = {'cloudapi.cloudspaces.list': 0.01}
+        listings = Listings()
+        greenlets = [gevent.spawn(listings.cloudspaces, self.ovc) for _ in range(5)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(self.sim.calls['cloudapi.cloudspaces.list'], 1)
+
+    def test_listing_expires(self):
+        listings = Listings(ttl=0)
+        listings.cloudspaces(self.ovc)
+        listings.cloudspaces(self.ovc)
+        self.assertEqual(self.sim.calls['cloudapi.cloudspaces.list'], 2)
+
+    def test_created_after_listing(self):
+        listings = Listings()
+        account_id = self.space.account.id
+        listings.machines(self.ovc, self.space.id)
+        listings.disks(self.ovc, account_id)
+        listings.cloudspaces(self.ovc)
+
+        # entities created after the listings were cached are found by id
+        machine = self.space.machine_create('vm3')
+        listed = self.sim.calls['cloudapi.machines.list']
+        self.assertEqual(listings.machine(self.ovc, self.space.id, machine.id)['name'], 'vm3')
+        self.assertEqual(listings.machine(self.ovc, self.space.id, machine.id)['name'], 'vm3')
+        self.assertIsNotNone(listings.disk(self.ovc, account_id, machine.model['disks'][0]))
+        self.assertEqual(self.sim.calls['cloudapi.machines.get'], 1)
+        self.assertEqual(self.sim.calls['cloudapi.machines.list'], listed)
+
+        space = self.space.account.space_get('vdc2')
+        self.assertEqual(listings.cloudspace(self.ovc, space.id)['name'], 'vdc2')
+        self.assertEqual(listings.account(self.ovc, account_id)['name'], 'account')
+
+        # entities that don't exist are still reported as gone
+        self.assertIsNone(listings.machine(self.ovc, self.space.id, 9999))
+        self.assertIsNone(listings.account(self.ovc, 9999))
+
+
+class TestMonitor(TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint({'a': 1, 'b': [1]}), fingerprint({'b': [1], 'a': 1}))
+        self.assertNotEqual(fingerprint({'a': 1}), fingerprint({'a': 2}))
+
+    def test_observe(self):
+        monitor = Monitor()
+        data = {'users': [], 'maxCPUCapacity': 2}
+        fields = MagicMock(side_effect=lambda entity: (
+            {'users': entity['users']}, {'maxCPUCapacity': entity['cpu']}))
+
+        result = monitor.observe(data, {'users': ['admin'], 'cpu': 4}, fields)
+        self.assertEqual(result, {
+            'changed': True,
+            'updated': {'users': ['admin']},
+            'drift': {'maxCPUCapacity': {'expected': 2, 'actual': 4}},
+        })
+        self.assertEqual(data['users'], ['admin'])
+        self.assertEqual(data['maxCPUCapacity'], 2)
+
+        # unchanged entity doesn't touch the data
+        result = monitor.observe(data, {'users': ['admin'], 'cpu': 4}, fields)
+        self.assertFalse(result['changed'])
+        self.assertEqual(result['drift'], {'maxCPUCapacity': {'expected': 2, 'actual': 4}})
+        self.assertEqual(fields.call_count, 1)
+
+        result = monitor.observe(data, {'users': ['admin'], 'cpu': 2}, fields)
+        self.assertEqual(result, {'changed': True, 'updated': {}, 'drift': {}})
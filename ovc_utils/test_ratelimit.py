@@ -0,0 +1,65 @@
+import time
+from unittest import TestCase
+
+import gevent
+from ovc_utils.ratelimit import Scheduler, TokenBucket, host
+
+
+class TestTokenBucket(TestCase):
+
+    def test_rate(self):
+        bucket = TokenBucket(rate=100, burst=2)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # the burst is free, the other 4 calls take 10ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(rate=0)
+        start = time.monotonic()
+        for _ in range(100):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.01)
+
+
+class TestScheduler(TestCase):
+
+    def test_host(self):
+        self.assertEqual(host('https://G8.example.com:443/restmachine/cloudapi/disks/get'), 'g8.example.com')
+        self.assertEqual(host('g8.example.com'), 'g8.example.com')
+
+    def test_configure(self):
+        scheduler = Scheduler(rate=20, burst=10)
+        self.assertEqual(scheduler.limit('g8.example.com'), (20, 10))
+        scheduler.configure('g8.example.com', rate=5, burst=1)
+        self.assertEqual(scheduler.limit('https://g8.example.com/restmachine'), (5, 1))
+        scheduler.clear()
+        self.assertEqual(scheduler.limit('g8.example.com'), (20, 10))
+
+    def test_queue_by_priority(self):
+        scheduler = Scheduler(rate=100, burst=1)
+        url = 'https://g8/restmachine/cloudapi/machines/list'
+        order = []
+
+        def call(action):
+            scheduler.acquire(url, 'cloudapi.machines.list', action)
+            order.append(action)
+
+        # takes the only token, the other calls are queued
+        call('install')
+        greenlets = [gevent.spawn(call, action) for action in ['install', 'monitor', 'get_info', 'start']]
+        gevent.sleep(0)
+        self.assertEqual(scheduler.queued(), {('g8', 'cloudapi.machines.list'): 4})
+
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(order, ['install', 'get_info', 'start', 'install', 'monitor'])
+        self.assertEqual(scheduler.queued(), {})
+
+    def test_endpoints_independent(self):
+        scheduler = Scheduler(rate=1, burst=1)
+        start = time.monotonic()
+        scheduler.acquire('https://g8/a', 'a')
+        scheduler.acquire('https://g8/b', 'b')
+        scheduler.acquire('https://other/a', 'a')
+        self.assertLess(time.monotonic() - start, 0.01)
@@ -0,0 +1,76 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from ovc_utils.resolver import Resolver, ACCOUNT_TEMPLATE, OVC_TEMPLATE, VDC_TEMPLATE, fetch_info
+
+
+class TestResolver(TestCase):
+
+    def setUp(self):
+        self.infos = {
+            'ovc_service': {'name': 'ovc_instance'},
+            'account_service': {'name': 'account_name', 'openvcloud': 'ovc_service', 'users': []},
+            'vdc_service': {'name': 'vdc_name', 'account': 'account_service', 'users': []},
+        }
+        self.api = MagicMock()
+        self.api.services.get.side_effect = self.get_service
+
+    def get_service(self, template_uid, name):
+        proxy = MagicMock()
+        proxy.schedule_action.return_value.wait.return_value.result = self.infos[name]
+        return proxy
+
+    def test_vdc(self):
+        resolver = Resolver()
+        self.assertEqual(resolver.vdc(self.api, 'vdc_service'), {
+            'vdc': 'vdc_name',
+            'account': 'account_name',
+            'ovc': 'ovc_instance',
+        })
+        self.assertEqual(self.api.services.get.call_count, 3)
+
+    def test_cached(self):
+        resolver = Resolver()
+        resolver.vdc(self.api, 'vdc_service')
+        resolver.vdc(self.api, 'vdc_service')
+        resolver.account(self.api, 'account_service')
+        self.assertEqual(self.api.services.get.call_count, 3)
+
+    def test_invalidate(self):
+        resolver = Resolver()
+        resolver.vdc(self.api, 'vdc_service')
+
+        self.infos['account_service']['name'] = 'new_account_name'
+        resolver.invalidate('account_service')
+
+        self.assertEqual(resolver.vdc(self.api, 'vdc_service')['account'], 'new_account_name')
+        self.api.services.get.assert_called_with(template_uid=ACCOUNT_TEMPLATE, name='account_service')
+        self.assertEqual(self.api.services.get.call_count, 4)
+
+    def test_seed(self):
+        resolver = Resolver()
+        resolver.seed(VDC_TEMPLATE, 'vdc_service', self.infos['vdc_service'])
+        self.assertEqual(resolver.vdc(self.api, 'vdc_service')['vdc'], 'vdc_name')
+        # only account and ovc are looked up
+        self.assertEqual(self.api.services.get.call_count, 2)
+
+    def test_failed_lookup_not_cached(self):
+        resolver = Resolver()
+        self.api.services.get.side_effect = KeyError('vdc_service')
+        with self.assertRaises(KeyError):
+            resolver.vdc(self.api, 'vdc_service')
+
+        self.api.services.get.side_effect = self.get_service
+        self.assertEqual(resolver.vdc(self.api, 'vdc_service')['vdc'], 'vdc_name')
+
+
+class TestFetchInfo(TestCase):
+
+    def test_fetch_info(self):
+        api = MagicMock()
+        proxy = api.services.get.return_value
+        proxy.schedule_action.return_value.wait.return_value.result = {'name': 'vdc'}
+
+        self.assertEqual(fetch_info(api, VDC_TEMPLATE, 'vdc'), {'name': 'vdc'})
+        api.services.get.assert_called_once_with(template_uid=VDC_TEMPLATE, name='vdc')
+        proxy.schedule_action.assert_called_once_with(action='get_info')
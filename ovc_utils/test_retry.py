@@ -0,0 +1,160 @@
+from unittest import TestCase
+from unittest import mock
+from unittest.mock import MagicMock
+
+import gevent
+from js9 import j
+from ovc_utils import retry as retry_module
+from ovc_utils.retry import retry, is_transient, CircuitBreaker, CircuitOpenError
+
+
+class HTTPError(Exception):
+    def __init__(self, code):
+        super().__init__('status %s' % code)
+        self.response = MagicMock(status_code=code)
+
+
+class Service:
+    template_name = 'test'
+
+    def __init__(self, errors):
+        self._ovc = None
+        self.errors = list(errors)
+        self.calls = 0
+
+    @property
+    def ovc(self):
+        return self._ovc
+
+    @retry(tries=3, delay=0, max_delay=0)
+    def install(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestRetry(TestCase):
+
+    def setUp(self):
+        for counter in retry_module.stats.values():
+            counter.clear()
+        retry_module._breakers.clear()
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient(HTTPError(503)))
+        self.assertTrue(is_transient(HTTPError(429)))
+        self.assertTrue(is_transient(ConnectionError()))
+        self.assertFalse(is_transient(HTTPError(400)))
+        self.assertFalse(is_transient(HTTPError(409)))
+        self.assertFalse(is_transient(ValueError('invalid')))
+
+        # local waits already took their full deadline
+        self.assertFalse(is_transient(j.exceptions.Timeout('ssh not reachable')))
+        self.assertFalse(is_transient(gevent.Timeout(1)))
+
+    def test_retry_transient(self):
+        service = Service([HTTPError(502), ConnectionError()])
+        self.assertEqual(service.install(), 'ok')
+        self.assertEqual(service.calls, 3)
+        self.assertEqual(retry_module.stats['retries']['test.install'], 2)
+
+    def test_no_retry_permanent(self):
+        service = Service([HTTPError(409)])
+        with self.assertRaises(HTTPError):
+            service.install()
+        self.assertEqual(service.calls, 1)
+        self.assertEqual(retry_module.stats['permanent']['test.install'], 1)
+
+    def test_give_up(self):
+        service = Service([HTTPError(500)] * 3)
+        with self.assertRaises(HTTPError):
+            service.install()
+        self.assertEqual(service.calls, 3)
+        self.assertEqual(retry_module.stats['gave_up']['test.install'], 1)
+
+    def test_circuit_opens(self):
+        ovc = MagicMock(instance='ovc_instance')
+        retry_module.breaker('ovc_instance').threshold = 2
+        for _ in range(2):
+            service = Service([HTTPError(500)] * 3)
+            service._ovc = ovc
+            with mock.patch.object(gevent, 'sleep'), self.assertRaises(Exception):
+                service.install()
+
+        # circuit is open, the action is not even called
+        service = Service([])
+        service._ovc = ovc
+        with mock.patch.object(gevent, 'sleep'), self.assertRaises(CircuitOpenError):
+            service.install()
+        self.assertEqual(service.calls, 0)
+
+    def test_circuit_open_after_restart(self):
+        retry_module.breaker('ovc_instance').threshold = 1
+        retry_module.breaker('ovc_instance').failure()
+
+        # a new service looks its client up in the first attempt
+        class Restarted(Service):
+            @property
+            def ovc(self):
+                return MagicMock(instance='ovc_instance')
+
+        service = Restarted([])
+        with mock.patch.object(gevent, 'sleep'), self.assertRaises(CircuitOpenError):
+            service.install()
+        self.assertEqual(service.calls, 0)
+
+    def test_trial_call_answered(self):
+        ovc = MagicMock(instance='ovc_instance')
+        retry_module.breaker('ovc_instance').threshold = 1
+        retry_module.breaker('ovc_instance').reset_timeout = 0
+        retry_module.breaker('ovc_instance').failure()
+
+        # a 4xx answer of the trial call closes the circuit
+        service = Service([HTTPError(409)])
+        service._ovc = ovc
+        with self.assertRaises(HTTPError):
+            service.install()
+        self.assertIsNone(retry_module.breaker('ovc_instance').opened_at)
+
+
+class TestCircuitBreaker(TestCase):
+
+    @mock.patch('ovc_utils.retry.time.time')
+    def test_half_open(self, now):
+        now.return_value = 100
+        breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        breaker.failure()
+        breaker.failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+
+        # reset timeout passed, a single trial call goes through
+        now.return_value = 130
+        breaker.check()
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+
+        # failing trial call opens the circuit again
+        breaker.failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+
+        now.return_value = 160
+        breaker.check()
+        breaker.success()
+        self.assertEqual(breaker.failures, 0)
+        breaker.check()
+        breaker.check()
+
+    @mock.patch('ovc_utils.retry.time.time')
+    def test_trial_call_lost(self, now):
+        now.return_value = 100
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+        breaker.failure()
+
+        # the trial call never reported back, another one goes through
+        now.return_value = 130
+        breaker.check()
+        now.return_value = 160
+        breaker.check()
@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+from js9 import j
+from ovc_utils.simulator import Simulator, SimulatedError
+
+
+class TestSimulator(TestCase):
+
+    def setUp(self):
+        self.sim = Simulator(seed=1)
+        self.client = self.sim.client()
+
+    def test_account_space_machine(self):
+        account = self.client.account_get('account', maxMemoryCapacity=5)
+        space = account.space_get('vdc')
+        machine = space.machine_create('vm', datadisks=[20])
+
+        self.assertEqual(self.client.account_get('account', create=False).model['maxMemoryCapacity'], 5)
+        self.assertEqual(self.client.space_get('account', 'vdc').id, space.id)
+        self.assertIn('vm', space.machines)
+        self.assertEqual(sorted(disk['type'] for disk in machine.disks), ['B', 'D'])
+        self.assertEqual(len(account.disks), 2)
+        self.assertEqual(self.client.api.cloudapi.cloudspaces.get(cloudspaceId=space.id)['status'], 'DEPLOYED')
+
+        machine.stop()
+        self.assertEqual(self.sim.machines[machine.id]['status'], 'HALTED')
+        self.client.api.cloudapi.machines.pause(machineId=machine.id)
+        self.assertEqual(self.sim.machines[machine.id]['status'], 'PAUSED')
+        machine.delete()
+        self.assertEqual(account.disks, [])
+
+    def test_machine_names(self):
+        space = self.client.account_get('account').space_get('vdc')
+        machine = space.machine_create('vm')
+        with self.assertRaisesRegex(RuntimeError, 'Name is not unique'):
+            space.machine_create('vm')
+
+        # the client lists the VMs of the cloudspace to find the id of the VM
+        self.sim.calls.clear()
+        self.assertEqual(space.machine_get('vm').id, machine.id)
+        self.assertEqual(self.sim.calls, {'cloudapi.machines.list': 1, 'cloudapi.machines.get': 1})
+
+    def test_not_found(self):
+        with self.assertRaises(SimulatedError) as err:
+            self.client.account_get('missing', create=False)
+        self.assertEqual(err.exception.response.status_code, 404)
+
+    def test_acl(self):
+        space = self.client.account_get('account').space_get('vdc')
+        space.authorize_user('user@provider', 'R')
+        space.update_access('user@provider', 'RCX')
+        space.refresh()
+        self.assertEqual(space.model['acl'][0]['right'], 'RCX')
+        self.assertTrue(space.unauthorize_user('user@provider'))
+        self.assertFalse(space.unauthorize_user('user@provider'))
+
+    def test_portforwards(self):
+        space = self.client.account_get('account').space_get('vdc')
+        machine = space.machine_create('vm')
+        cloudapi = self.client.api.cloudapi
+        cloudapi.portforwarding.create(cloudspaceId=space.id, protocol='tcp', localPort=22,
+                                       publicPort=2222, publicIp=space.ipaddr_pub, machineId=machine.id)
+        with self.assertRaises(SimulatedError):
+            cloudapi.portforwarding.create(cloudspaceId=space.id, protocol='tcp', localPort=80,
+                                           publicPort=2222, publicIp=space.ipaddr_pub, machineId=machine.id)
+
+        forwards = cloudapi.portforwarding.list(cloudspaceId=space.id, machineId=machine.id)
+        self.assertEqual([(fwd['publicPort'], fwd['localPort']) for fwd in forwards], [('2222', '22')])
+        cloudapi.portforwarding.delete(id=forwards[0]['id'], cloudspaceId=space.id)
+        self.assertEqual(cloudapi.portforwarding.list(cloudspaceId=space.id), [])
+
+    def test_call_counts_and_errors(self):
+        sim = Simulator(errors={'cloudapi.cloudspaces.list': 1})
+        client = sim.client()
+        client.account_get('account')
+        self.assertEqual(sim.calls['cloudapi.accounts.list'], 1)
+        self.assertEqual(sim.calls['cloudbroker.account.create'], 1)
+
+        with self.assertRaises(SimulatedError) as err:
+            client.api.cloudapi.cloudspaces.list()
+        self.assertEqual(err.exception.response.status_code, 500)
+
+    def test_patch(self):
+        with self.sim.patch():
+            client = j.clients.openvcloud.get('instance')
+        self.assertIs(client, self.sim.client('instance'))
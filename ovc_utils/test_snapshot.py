@@ -0,0 +1,87 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest import mock
+
+from ovc_utils import snapshot
+from ovc_utils.snapshot import Snapshot, Snapshots, pull, dump, load
+from ovc_utils.simulator import Simulator
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        self.sim = Simulator()
+        self.ovc = self.sim.client()
+        account = self.ovc.account_get('account')
+        self.space = account.space_get('vdc')
+        self.space.authorize_user('user@provider', 'RCX')
+        self.machine = self.space.machine_create('vm1', datadisks=[10])
+        account.space_get('vdc2').machine_create('vm2')
+        self.ovc.account_get('other')
+        self.sim.calls.clear()
+
+        self.path = os.path.join(tempfile.mkdtemp(), 'inventory.snapshot')
+
+    def test_pull(self):
+        inventory = pull(self.ovc)
+        self.assertEqual(len(inventory['accounts']), 2)
+        self.assertEqual(len(inventory['cloudspaces']), 2)
+        self.assertEqual(len(inventory['machines']), 2)
+        self.assertEqual(len(inventory['disks']), 3)
+
+        # one listing per kind and per cloudspace/account
+        self.assertEqual(self.sim.calls['cloudapi.accounts.list'], 1)
+        self.assertEqual(self.sim.calls['cloudapi.cloudspaces.list'], 1)
+        self.assertEqual(self.sim.calls['cloudapi.machines.list'], 2)
+        self.assertEqual(self.sim.calls['cloudapi.disks.list'], 2)
+
+    @mock.patch.object(snapshot, 'msgpack', None)
+    def test_dump_load(self):
+        inventory = pull(self.ovc)
+        self.assertEqual(dump(inventory, self.path), 'json')
+        self.assertEqual(load(self.path), inventory)
+
+    def test_lookup(self):
+        inventory = Snapshot(pull(self.ovc))
+
+        cloudspace = inventory.cloudspace('account', 'vdc')
+        self.assertEqual(cloudspace['id'], self.space.id)
+        self.assertEqual(cloudspace['acl'][0]['userGroupId'], 'user@provider')
+        self.assertEqual(inventory.machine(self.space.id, 'vm1')['id'], self.machine.id)
+        self.assertEqual(inventory.disk(self.machine.model['disks'][1])['type'], 'D')
+
+        self.assertIsNone(inventory.account('missing'))
+        self.assertIsNone(inventory.cloudspace('missing', 'vdc'))
+        self.assertIsNone(inventory.cloudspace('other', 'vdc'))
+        self.assertIsNone(inventory.machine(self.space.id, 'vm2'))
+
+    def test_version(self):
+        with self.assertRaisesRegex(ValueError, 'unsupported snapshot version'):
+            Snapshot({'version': 0})
+
+    @mock.patch.object(snapshot, 'msgpack', None)
+    def test_snapshots(self):
+        dump(pull(self.ovc), self.path)
+        snapshots = Snapshots()
+        self.assertEqual(len(snapshots), 0)
+
+        loaded = snapshots.load('ovc', self.path)
+        self.assertIs(snapshots.get('ovc'), loaded)
+        self.assertIsNone(snapshots.get('other'))
+
+        snapshots.discard('ovc')
+        self.assertIsNone(snapshots.get('ovc'))
+
+    @mock.patch.object(snapshot, 'msgpack', None)
+    def test_expired(self):
+        dump(pull(self.ovc), self.path)
+        snapshots = Snapshots()
+        loaded = snapshots.load('ovc', self.path, max_age=60)
+        self.assertFalse(loaded.expired)
+
+        # entities may have changed since, old snapshots are not used
+        with mock.patch('time.time', return_value=loaded.created + 61):
+            self.assertTrue(loaded.expired)
+            self.assertIsNone(snapshots.get('ovc'))
+        self.assertEqual(len(snapshots), 0)
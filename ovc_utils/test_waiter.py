@@ -0,0 +1,51 @@
+from unittest import TestCase
+from unittest import mock
+from unittest.mock import MagicMock
+
+import gevent
+from js9 import j
+from ovc_utils import waiter
+
+
+class TestWaitFor(TestCase):
+
+    def test_wait_for_success(self):
+        results = iter([False, False, 'done'])
+        result = waiter.wait_for(lambda: next(results), interval=0.01)
+        self.assertEqual(result, 'done')
+
+    def test_wait_for_timeout(self):
+        with self.assertRaisesRegex(j.exceptions.Timeout, 'still down'):
+            waiter.wait_for(lambda: False, timeout=0.05, interval=0.01, message='still down')
+
+    def test_wait_for_backoff(self):
+        with mock.patch.object(gevent, 'sleep') as sleep:
+            results = iter([False] * 5 + [True])
+            waiter.wait_for(lambda: next(results), interval=1, max_interval=4, backoff=2)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2, 4, 4, 4])
+
+
+class TestCloudspaceWatcher(TestCase):
+
+    def setUp(self):
+        self.ovc = MagicMock()
+        self.statuses = {1: 'DEPLOYING', 2: 'DEPLOYING'}
+        self.ovc.api.cloudapi.cloudspaces.list.side_effect = lambda: [
+            {'id': space_id, 'status': status} for space_id, status in self.statuses.items()]
+
+    def test_wait_shared_listing(self):
+        watcher = waiter.CloudspaceWatcher(self.ovc)
+        waiters = [gevent.spawn(watcher.wait, space_id, timeout=5) for space_id in (1, 2)]
+        # let the first poll happen while still deploying
+        gevent.sleep(0.1)
+        self.statuses = {1: 'DEPLOYED', 2: 'DEPLOYED'}
+        gevent.joinall(waiters, raise_error=True)
+
+        self.assertEqual([greenlet.value for greenlet in waiters], ['DEPLOYED', 'DEPLOYED'])
+        # both cloudspaces were checked by the same listing calls
+        self.assertEqual(self.ovc.api.cloudapi.cloudspaces.list.call_count, 2)
+
+    def test_wait_timeout(self):
+        watcher = waiter.CloudspaceWatcher(self.ovc)
+        with self.assertRaises(j.exceptions.Timeout):
+            watcher.wait(1, timeout=0.05)
@@ -0,0 +1,126 @@
+"""
+Waiting for remote state without blocking a worker on fixed sleeps.
+
+`wait_for` polls a condition with an exponentially growing interval,
+`cloudspace_status` waits for a cloudspace to reach a status. All cloudspaces
+awaited on the same ovc connection are checked with one listing call per tick.
+"""
+
+import time
+
+import gevent
+from gevent.event import AsyncResult
+from js9 import j
+
+# first and maximum interval between two polls, in seconds
+INTERVAL = 0.5
+MAX_INTERVAL = 5
+BACKOFF = 2
+
+
+def wait_for(condition, timeout=60, interval=INTERVAL, max_interval=MAX_INTERVAL,
+             backoff=BACKOFF, message='condition not met in time'):
+    """
+    Poll @condition until it returns a true value and return that value
+
+    :param condition: callable without arguments
+    :param timeout: deadline in seconds, j.exceptions.Timeout is raised when it passes
+    :param interval: seconds to wait after the first poll
+    :param max_interval: upper bound of the interval
+    :param backoff: factor the interval grows with after each poll
+    :param message: message of the timeout error
+    """
+    deadline = time.time() + timeout
+    while True:
+        result = condition()
+        if result:
+            return result
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise j.exceptions.Timeout(message)
+
+        gevent.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+
+class CloudspaceWatcher:
+    """
+    Waits for cloudspaces of one ovc connection to reach a status
+
+    One greenlet lists the cloudspaces as long as somebody waits,
+    no matter how many cloudspaces are awaited.
+    """
+
+    def __init__(self, ovc):
+        self._ovc = ovc
+        self._waiters = {}
+        self._interval = INTERVAL
+        self._poller = None
+
+    def wait(self, cloudspace_id, status='DEPLOYED', timeout=60):
+        """
+        Block until cloudspace @cloudspace_id has @status
+        """
+        result = AsyncResult()
+        waiter = (status, result)
+        self._waiters.setdefault(cloudspace_id, []).append(waiter)
+
+        # a new waiter wants a fast answer, restart from the shortest interval
+        self._interval = INTERVAL
+        if self._poller is None or self._poller.dead:
+            self._poller = gevent.spawn(self._poll)
+
+        try:
+            return result.get(timeout=timeout)
+        except gevent.Timeout:
+            raise j.exceptions.Timeout(
+                'cloudspace %s did not reach status %s in time' % (cloudspace_id, status))
+        finally:
+            waiters = self._waiters.get(cloudspace_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(cloudspace_id, None)
+
+    def _poll(self):
+        while self._waiters:
+            try:
+                statuses = {space['id']: space['status']
+                            for space in self._ovc.api.cloudapi.cloudspaces.list()}
+            except Exception:
+                # waiters time out on their own if the listing keeps failing
+                statuses = {}
+
+            for cloudspace_id, waiters in list(self._waiters.items()):
+                for status, result in waiters:
+                    if statuses.get(cloudspace_id) == status:
+                        result.set(status)
+
+            gevent.sleep(self._interval)
+            self._interval = min(self._interval * BACKOFF, MAX_INTERVAL)
+
+
+# watchers keyed by name of the ovc connection instance
+_watchers = {}
+
+
+def cloudspace_status(ovc, cloudspace_id, status='DEPLOYED', timeout=60):
+    """
+    Wait until cloudspace @cloudspace_id reached @status
+
+    :param ovc: ovc client the cloudspace is listed with
+    """
+    watcher = _watchers.get(ovc.instance)
+    if watcher is None:
+        watcher = _watchers[ovc.instance] = CloudspaceWatcher(ovc)
+    return watcher.wait(cloudspace_id, status=status, timeout=timeout)
+
+
+def drop(instance):
+    """
+    Forget watcher of ovc connection @instance
+
+    Waits in progress go on with the client they started with.
+    """
+    _watchers.pop(instance, None)
@@ -1,9 +1,25 @@
-from js9 import j
+import os
+import sys
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
-from zerorobot.template.decorator import retry
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
 
+from ovc_utils.resolver import resolver, fetch_info
+from ovc_utils.concurrency import parallel
+from ovc_utils.retry import retry
+from ovc_utils.cache import TTLValue
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.monitor import Monitor, listings, users as acl_users
+from ovc_utils.converge import converged, record, diff, save_changes
+from ovc_utils.snapshot import snapshots
+from ovc_utils.metrics import instrument
+
+
+@instrument
 class Account(TemplateBase):
 
     version = '0.0.1'
@@ -13,8 +29,17 @@ class Account(TemplateBase):
     VDC_TEMPLATE = 'github.com/openvcloud/0-templates/vdc/0.0.1'
     VDCUSER_TEMPLATE = 'github.com/openvcloud/0-templates/vdcuser/0.0.1'
 
+    # seconds the list of authorized users is served from cache by get_info
+    USERS_TTL = 60
+
+    LIMITS = ('maxMemoryCapacity', 'maxCPUCapacity', 'maxNumPublicIP', 'maxVDiskCapacity')
+    # data applied by install, install is skipped if it didn't change since
+    INSTALL_KEYS = ('name', 'openvcloud', 'create') + LIMITS
+
     def __init__(self, name, guid=None, data=None):
         super().__init__(name=name, guid=guid, data=data)
+        self._users = TTLValue(self.USERS_TTL)
+        self._monitor = Monitor()
         self._account = None
         self._ovc = None
 
@@ -29,17 +54,13 @@ class Account(TemplateBase):
     @property
     def ovc(self):
         """ Get ovc client """
-        if not self._ovc:
-            proxy = self.api.services.get(
-                template_uid=self.OVC_TEMPLATE, name=self.data['openvcloud'])
-            ovc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-            self._ovc = j.clients.openvcloud.get(ovc_info['name'])
-        return self._ovc
+        return ovc_pool.connect(self, resolver.ovc(self.api, self.data['openvcloud']), ('_account',))
 
     @property
     def account(self):
+        ovc = self.ovc
         if not self._account:
-            self._account = self.ovc.account_get(
+            self._account = ovc.account_get(
                 name=self.data['name'],
                 create=False)
         return self._account
@@ -50,7 +71,7 @@ class Account(TemplateBase):
         return {
             'name' : self.data['name'],
             'openvcloud' : self.data['openvcloud'],
-            'users' : self._get_users()
+            'users' : self.get_users(refresh=False)
         }
 
     def _get_users(self, refresh=True):
@@ -62,19 +83,71 @@ class Account(TemplateBase):
             users.append({'name': user['userGroupId'],
                           'accesstype': user['right']})
         self.data['users'] = users
+        self._users.set(users)
+        return users
+
+    def get_users(self, refresh=True):
+        """
+        Return users authorized on the account
+
+        :param refresh: if False, the list fetched less than USERS_TTL seconds ago is returned
+        """
+        self.state.check('actions', 'install', 'ok')
+        users = self._users.get()
+        if refresh or users is None:
+            users = self._get_users()
         return users
 
-    @retry((BaseException),
-            tries=5, delay=3, backoff=2, logger=None)
+    def monitor(self):
+        """
+        Detect changes of the account made outside of this service.
+        Users are updated in the service data, changed limits are reported as drift.
+        If the account doesn't exist anymore, the service is not installed anymore.
+        """
+        self.state.check('actions', 'install', 'ok')
+
+        account = listings.account(self.ovc, self.data['accountID'])
+        if account is None:
+            self._monitor.reset()
+            self._account = None
+            self.state.delete('actions', 'install')
+            return {'exists': False}
+
+        def fields(account):
+            mirrored = {'users': acl_users(account['acl'])} if 'acl' in account else {}
+            desired = {key: account[key] for key in self.LIMITS if key in account}
+            return mirrored, desired
+
+        result = self._monitor.observe(self.data, account, fields)
+        if 'users' in result['updated']:
+            self._users.set(self.data['users'])
+        result['exists'] = True
+        return result
+
+    @retry(tries=5, delay=3, backoff=2)
     def install(self):
         """ Install account
             
-            If action was not successfull it will be retried
+            If action was not successfull it will be retried.
+            If the account is installed and its data didn't change since, nothing is done.
         """
         try:
             self.state.check('actions', 'install', 'ok')
+            if converged(self.data, self.INSTALL_KEYS):
+                return
         except StateCheckError:
             pass
+
+        adopted = self._adopt() if not self.data['create'] else None
+        if adopted is not None:
+            # the account is only fetched if the snapshot doesn't show the limits applied
+            limits = {key: self.data[key] for key in self.LIMITS}
+            if diff(adopted, limits):
+                save_changes(self.account, limits)
+            record(self.data, self.INSTALL_KEYS)
+            self.state.set('actions', 'install', 'ok')
+            return
+
         # Set limits
         # if account does not exist, it will create it,
         # unless 'create' flag is set to False
@@ -93,14 +166,30 @@ class Account(TemplateBase):
         self._get_users(refresh=False)
 
         # update capacity in case account already existed
-        self.account.model['maxMemoryCapacity'] = self.data['maxMemoryCapacity']
-        self.account.model['maxVDiskCapacity'] = self.data['maxVDiskCapacity']
-        self.account.model['maxNumPublicIP'] = self.data['maxNumPublicIP']
-        self.account.model['maxCPUCapacity'] = self.data['maxCPUCapacity']
-        self.account.save()
+        save_changes(self.account, {key: self.data[key] for key in self.LIMITS})
 
+        record(self.data, self.INSTALL_KEYS)
         self.state.set('actions', 'install', 'ok')
 
+    def _adopt(self):
+        """
+        Fill id and users of the account in from the inventory snapshot of the ovc
+
+        :return: the account in the snapshot, None if there is no snapshot or the account isn't in it
+        """
+        if not snapshots:
+            return None
+
+        snapshot = snapshots.get(resolver.ovc(self.api, self.data['openvcloud']))
+        account = snapshot.account(self.data['name']) if snapshot else None
+        if not account:
+            return None
+
+        self.data['accountID'] = account['id']
+        self.data['users'] = acl_users(account['acl'])
+        self._users.set(self.data['users'])
+        return account
+
     def uninstall(self):
 
         # check if account is listed on given ovc connection
@@ -120,6 +209,7 @@ class Account(TemplateBase):
 
         self.account.delete()
         self.state.delete('actions', 'install')
+        resolver.invalidate(self.name)
 
     def user_authorize(self, vdcuser, accesstype='R'):
         """
@@ -132,13 +222,12 @@ class Account(TemplateBase):
         if not self.data['create']:
             raise RuntimeError('readonly account')
 
-        # fetch user name from the vdcuser service
-        proxy = self.api.services.get(
-            template_uid=self.VDCUSER_TEMPLATE, name=vdcuser)
-        user_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        name = user_info['name']  
-
-        users = self._get_users()
+        # fetch user name from the vdcuser service and users of the account at once
+        user_info, users = parallel(
+            lambda: fetch_info(self.api, self.VDCUSER_TEMPLATE, vdcuser),
+            self._get_users,
+        )
+        name = user_info['name']
 
         for existent_user in users:
             if existent_user['name'] != name:
@@ -149,6 +238,7 @@ class Account(TemplateBase):
                 break
             if self.account.update_access(username=name, right=accesstype):
                 existent_user['accesstype'] = accesstype
+                self._users.set(self.data['users'])
                 break
             raise RuntimeError(
                 'failed to update access type of user "%s"' % name)
@@ -160,6 +250,7 @@ class Account(TemplateBase):
                     "accesstype": accesstype
                 }
                 self.data['users'].append(new_user)
+                self._users.set(self.data['users'])
             else:
                 raise RuntimeError('failed to add user "%s"' % name)
 
@@ -176,19 +267,18 @@ class Account(TemplateBase):
 
         self.state.check('actions', 'install', 'ok')
 
-        # fetch user name from the vdcuser service
-        proxy = self.api.services.get(
-            template_uid=self.VDCUSER_TEMPLATE, name=vdcuser)
-        user_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        # fetch user name from the vdcuser service and user access on the account at once
+        user_info, users = parallel(
+            lambda: fetch_info(self.api, self.VDCUSER_TEMPLATE, vdcuser),
+            self._get_users,
+        )
         username = user_info['name']
 
-        # get user access on the account
-        users = self._get_users()
-
         for user in users:
             if username == user['name']:
                 if self.account.unauthorize_user(username=user['name']):
                     self.data['users'].remove(user)
+                    self._users.set(self.data['users'])
                     break
                 raise RuntimeError('failed to remove user "%s"' % username)
 
@@ -201,6 +291,7 @@ class Account(TemplateBase):
         :param maxVDiskCapacity: The limit on the disk capacity that can be used by the account.
         :param maxNumPublicIP: The limit on the number of public IPs that can be used by the account.
         :param maxCPUCapacity: The limit on the CPUs that can be used by the account.
+        :return: dict of the limits that differed on the account and were saved
         """
 
         self.state.check('actions', 'install', 'ok')
@@ -210,20 +301,12 @@ class Account(TemplateBase):
 
         # work around not supporting the **kwargs in actions call
         kwargs = locals()
-
-        self.state.check('actions', 'install', 'ok')
+        desired = {key: kwargs[key] for key in self.LIMITS if kwargs[key] is not None}
 
         account = self.ovc.account_get(name=self.data['name'], create=False)
+        resolver.invalidate(self.name)
 
-        for key in ['maxMemoryCapacity', 'maxVDiskCapacity',
-                    'maxNumPublicIP', 'maxCPUCapacity']:
-            value = kwargs[key]
-            if value is None:
-                continue
-
-            updated = True
-            self.data[key] = value
-            account.model[key] = value
-
-        if updated:
-            account.save()
+        self.data.update(desired)
+        changes = save_changes(account, desired)
+        record(self.data, self.INSTALL_KEYS)
+        return changes
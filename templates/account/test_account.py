@@ -1,5 +1,6 @@
 from js9 import j
 import os
+import time
 
 from unittest import TestCase
 from unittest import mock
@@ -8,10 +9,16 @@ from unittest.mock import MagicMock, patch
 from zerorobot import config, template_collection
 from zerorobot.template.state import StateCheckError
 from zerorobot.service_collection import ServiceNotFoundError
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.snapshot import snapshots, Snapshot
 
 class TestAccount(TestCase):
     def setUp(self):
         config.DATA_DIR = '/tmp'
+        resolver.clear()
+        ovc_pool.clear()
+        snapshots.clear()
         self.type = template_collection._load_template(
             "https://github.com/openvcloud/0-templates",
             os.path.dirname(__file__)
@@ -102,6 +109,27 @@ class TestAccount(TestCase):
         with self.assertRaises(ServiceNotFoundError):
             instance.ovc
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_get_info_cached_users(self, ovc):
+        """ Test get_info serves users from cache, get_users refreshes them """
+        data = self.acc['info']
+        instance = self.type('test', None, data)
+        instance.state.set('actions', 'install', 'ok')
+
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        account = ovc.get.return_value.account_get.return_value
+        with mock.patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            info = instance.get_info()
+            instance.get_info()
+            account.refresh.assert_called_once_with()
+
+            instance.get_users()
+            self.assertEqual(account.refresh.call_count, 2)
+
+        self.assertEqual(info['users'], [{'name': self.vdcuser['info']['name'],
+                                          'accesstype': self.vdcuser['accesstype']}])
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_install(self, ovc):
         data = self.acc['info']
@@ -128,6 +156,60 @@ class TestAccount(TestCase):
         account = cl.account_get.return_value
         account.save.assert_called_once_with()
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_converged(self, ovc):
+        """
+        Test install of an installed account without changes
+        """
+        instance = self.type('test', None, self.acc['info'])
+
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        with mock.patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance.install()
+            instance.install()
+
+            cl = ovc.get.return_value
+            cl.account_get.assert_called_once()
+
+            # changed limits are applied again
+            instance.data['maxCPUCapacity'] = 4
+            instance.install()
+            self.assertEqual(cl.account_get.call_count, 2)
+            self.assertEqual(cl.account_get.return_value.model['maxCPUCapacity'], 4)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_from_snapshot(self, ovc):
+        """
+        Test install of an existing account found in the inventory snapshot
+        """
+        limits = {'maxMemoryCapacity': -1, 'maxCPUCapacity': -1, 'maxNumPublicIP': -1, 'maxVDiskCapacity': -1}
+        snapshots.set(self.ovc['info']['name'], Snapshot({
+            'version': 1,
+            'created': int(time.time()),
+            'accounts': [dict(limits, id=111, name=self.acc['info']['name'], acl=[])],
+            'cloudspaces': [],
+            'machines': [],
+            'disks': [],
+        }))
+        instance = self.type('test', None, dict(self.acc['info'], create=False))
+
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        with mock.patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            # the snapshot shows the limits applied
+            instance.install()
+            self.assertEqual(instance.data['accountID'], 111)
+            ovc.get.return_value.account_get.assert_not_called()
+
+            # changed limits are applied
+            instance.data['maxCPUCapacity'] = 4
+            instance.install()
+            cl = ovc.get.return_value
+            cl.account_get.assert_called_once_with(name=self.acc['info']['name'], create=False)
+            self.assertEqual(cl.account_get.return_value.model['maxCPUCapacity'], 4)
+            cl.account_get.return_value.save.assert_called_once_with()
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_uninstall_nonexistent_account(self, ovc):
         """
@@ -244,6 +326,26 @@ class TestAccount(TestCase):
             'maxNumPublicIP': 3
         })
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_update_unchanged(self, ovc):
+        """
+        Test updating account limits to the values of the account
+        """
+        instance = self.type('test', None, self.acc['info'])
+        instance.state.set('actions', 'install', 'ok')
+
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        account = ovc.get.return_value.account_get.return_value
+        account.model = {'maxNumPublicIP': 3}
+
+        with mock.patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            self.assertEqual(instance.update(), {})
+            self.assertEqual(instance.update(maxNumPublicIP=3), {})
+
+        account.save.assert_not_called()
+        self.assertEqual(instance.data['maxNumPublicIP'], 3)
+
     def test_user_authorize_statecheckerror(self):
         instance = self.type('test', None)
         user = {'vdcuser': 'test1', 'accesstype': 'RCX',
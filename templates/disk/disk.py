@@ -1,7 +1,22 @@
-from js9 import j
+import os
+import sys
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.inventory import disk_inventory
+from ovc_utils.monitor import Monitor, listings
+from ovc_utils.snapshot import snapshots
+from ovc_utils import iolimits
+from ovc_utils.metrics import instrument
+
+@instrument
 class Disk(TemplateBase):
 
     version = '0.0.1'
@@ -10,14 +25,15 @@ class Disk(TemplateBase):
     OVC_TEMPLATE = 'github.com/openvcloud/0-templates/openvcloud/0.0.1'
     ACCOUNT_TEMPLATE = 'github.com/openvcloud/0-templates/account/0.0.1'
     VDC_TEMPLATE = 'github.com/openvcloud/0-templates/vdc/0.0.1'
+    IOPROFILE_TEMPLATE = 'github.com/openvcloud/0-templates/ioprofile/0.0.1'
 
     def __init__(self, name, guid=None, data=None):
         super().__init__(name=name, guid=guid, data=data)
 
         self._ovc = None
         self._account = None
-        self._config = None
         self._space = None
+        self._monitor = Monitor()
 
     def validate(self):
         """
@@ -40,19 +56,7 @@ class Disk(TemplateBase):
         """
         Validate limits on the Disk
         """
-        data = self.data
-        # ensure that limits are given correctly
-        if (data['maxIops'] or data['totalIopsSec']) and (data['readIopsSec'] or data['writeIopsSec']):
-            raise RuntimeError("total and read/write of iops_sec cannot be set at the same time")
-
-        if data['totalBytesSec'] and (data['readBytesSec'] or data['writeBytesSec']):
-            raise RuntimeError("total and read/write of bytes_sec cannot be set at the same time")
-
-        if data['totalBytesSecMax'] and (data['readBytesSecMax'] or data['writeBytesSecMax']):
-            raise RuntimeError("total and read/write of bytes_sec_max cannot be set at the same time")
-
-        if data['totalIopsSecMax'] and (data['readIopsSecMax'] or data['writeIopsSecMax']):
-            raise RuntimeError("total and read/write of iops_sec_max cannot be set at the same time")
+        iolimits.validate({key: self.data[key] for key in iolimits.IOTUNE})
 
     def update(self, maxIops=None, totalBytesSec=None, readBytesSec=None,
                writeBytesSec=None, totalIopsSec=None, readIopsSec=None,
@@ -65,43 +69,49 @@ class Disk(TemplateBase):
         :value 0: unset limit
         :value None: parameter was not provided in the action data and limit will not be updated
         :other values: update of the limit 
+        :return: True if limits were changed and applied to the disk
         """
 
         self.state.check('actions', 'install', 'ok')
-        updated = []
-        updated.append(self._update_value('maxIops', maxIops))
-        updated.append(self._update_value('totalBytesSec', totalBytesSec))
-        updated.append(self._update_value('readBytesSec', readBytesSec))
-        updated.append(self._update_value('writeBytesSec', writeBytesSec))
-        updated.append(self._update_value('totalIopsSec', totalIopsSec))
-        updated.append(self._update_value('readIopsSec', readIopsSec))
-        updated.append(self._update_value('writeIopsSec', writeIopsSec))
-        updated.append(self._update_value('totalBytesSecMax', totalBytesSecMax))
-        updated.append(self._update_value('readBytesSecMax', readBytesSecMax))
-        updated.append(self._update_value('writeBytesSecMax', writeBytesSecMax))
-        updated.append(self._update_value('totalIopsSecMax', totalIopsSecMax))
-        updated.append(self._update_value('readIopsSecMax', readIopsSecMax))
-        updated.append(self._update_value('writeIopsSecMax', writeIopsSecMax))
-        updated.append(self._update_value('sizeIopsSec', sizeIopsSec))
-
-        if any(updated):
-            # check that new limits are valid
-            self._validate_limits()
-
-            # apply new limits
-            self._limit_io()
-
-    def _update_value(self, arg, value):
+        limits = {key: self.data[key] for key in iolimits.IOTUNE}
+        self._update_value(limits, 'maxIops', maxIops)
+        self._update_value(limits, 'totalBytesSec', totalBytesSec)
+        self._update_value(limits, 'readBytesSec', readBytesSec)
+        self._update_value(limits, 'writeBytesSec', writeBytesSec)
+        self._update_value(limits, 'totalIopsSec', totalIopsSec)
+        self._update_value(limits, 'readIopsSec', readIopsSec)
+        self._update_value(limits, 'writeIopsSec', writeIopsSec)
+        self._update_value(limits, 'totalBytesSecMax', totalBytesSecMax)
+        self._update_value(limits, 'readBytesSecMax', readBytesSecMax)
+        self._update_value(limits, 'writeBytesSecMax', writeBytesSecMax)
+        self._update_value(limits, 'totalIopsSecMax', totalIopsSecMax)
+        self._update_value(limits, 'readIopsSecMax', readIopsSecMax)
+        self._update_value(limits, 'writeIopsSecMax', writeIopsSecMax)
+        self._update_value(limits, 'sizeIopsSec', sizeIopsSec)
+
+        changed = {key: value for key, value in limits.items() if self.data[key] != value}
+        if not changed:
+            return False
+
+        # check that new limits are valid before they replace the current ones
+        iolimits.validate(limits)
+        for key, value in changed.items():
+            self.data[key] = value
+
+        # apply new limits
+        self._limit_io()
+
+        return True
+
+    def _update_value(self, limits, arg, value):
+        """ Set limit @arg in @limits to @value unless @value is None """
         if value is not None:
             if isinstance(self.data[arg], type(value)):
-                if self.data[arg] != value: 
-                    self.data[arg] = value
-                    return True
+                limits[arg] = value
             else:
                 raise TypeError("limit {lim} has type {type}, expected type {expect_type}".format(
                                 lim=arg, type=type(value), expect_type=type(self.data[arg]))
                                 )
-        return False
       
 
     def install(self):
@@ -109,6 +119,7 @@ class Disk(TemplateBase):
         Install disk.
         If disk @id is present in data: check if disk with id exists and apply limits.
         If disk @id is not given: create new disk with given limits.
+        If @ioprofile is given: subscribe to the profile and apply its limits.
         """
 
         try:
@@ -117,22 +128,68 @@ class Disk(TemplateBase):
         except StateCheckError:
             pass
 
-        self.data['location'] = self.space.model['location']
         if self.data['diskId']:
             # if disk is given in data, check if disk exist
-            disks = self.account.disks
-            disk = [disk for disk in disks if disk['id'] == self.data['diskId']]
-            if not disk:
-                raise ValueError('Disk with id {} does not exist on account "{}"'.format(
-                                  self.data['diskId'], self.account.model['name'])
-                                  )
-            self.data['name'] = disk[0]['name']
+            if not self._adopt():
+                self.data['location'] = self.space.model['location']
+                disk = disk_inventory.get(self.ovc, self.account, self.data['diskId'])
+                if not disk:
+                    raise ValueError('Disk with id {} does not exist on account "{}"'.format(
+                                      self.data['diskId'], self.account.model['name'])
+                                      )
+                self.data['name'] = disk['name']
 
         else:
+            self.data['location'] = self.space.model['location']
             self._create()
 
+        if self.data['ioprofile']:
+            self._subscribe()
+
+        self._release()
         self.state.set('actions', 'install', 'ok')
 
+    def _release(self):
+        """ Drop the space and account objects, only the id of the account is kept """
+        if self._account is not None:
+            self.data['accountId'] = self._account.id
+        self._space = None
+        self._account = None
+
+    def _adopt(self):
+        """
+        Fill name and location of the disk in from the inventory snapshot of the ovc
+
+        :return: False if there is no snapshot or the disk isn't in it
+        """
+        if not snapshots:
+            return False
+
+        snapshot = snapshots.get(self.config['ovc'])
+        if snapshot is None:
+            return False
+
+        cloudspace = snapshot.cloudspace(self.config['account'], self.config['vdc'])
+        disk = snapshot.disk(self.data['diskId'])
+        if not cloudspace or not disk or disk['accountId'] != cloudspace['accountId']:
+            return False
+
+        self.data['location'] = cloudspace['location']
+        self.data['name'] = disk['name']
+        self.data['accountId'] = disk['accountId']
+        return True
+
+    def _ioprofile(self):
+        return self.api.services.get(template_uid=self.IOPROFILE_TEMPLATE, name=self.data['ioprofile'])
+
+    def _subscribe(self):
+        """
+        Subscribe to the IO profile, the profile applies its limits with the `update` action
+
+        The profile isn't waited for, it waits for its disks while rolling out limits.
+        """
+        self._ioprofile().schedule_action(action='subscribe', args={'disk_service': self.name})
+
     def _create(self):
         """ Create disk in isolation
         """
@@ -149,6 +206,11 @@ class Disk(TemplateBase):
                             size=data['size'],
                             type=data['type'],
                         )
+        disk_inventory.add(self.ovc, self.account, {
+            'id': data['diskId'],
+            'name': data['name'],
+            'type': data['type'],
+        })
         
     def uninstall(self):
         """
@@ -158,12 +220,17 @@ class Disk(TemplateBase):
                                 managing VM where the disk attached.
                                 Relevant only for attached disks
         """
-        disks = [disk['id'] for disk in self.account.disks]   
-        if self.data['diskId'] in disks:
+        disk = disk_inventory.get(self.ovc, self.account, self.data['diskId'], fetch=True)
+        if disk:
             if self.data['type'] == 'B':
                 raise RuntimeError("can't delete boot disk")
             self.account.disk_delete(self.data['diskId'], detach=False)
-        
+            disk_inventory.remove(self.ovc, self.account, self.data['diskId'])
+
+        if self.data['ioprofile']:
+            # not waited for, the profile may be waiting for this disk
+            self._ioprofile().schedule_action(action='unsubscribe', args={'disk_service': self.name})
+
         self.state.delete('actions', 'install')
         self.data['diskId'] = 0
 
@@ -171,47 +238,24 @@ class Disk(TemplateBase):
     def config(self):
         """
         Return an object with names of vdc, account, and ovc
-        """
-
-        if self._config is not None:
-            return self._config
-
-        config = {}
-
-        # get real vdc name
-        proxy = self.api.services.get(
-            template_uid=self.VDC_TEMPLATE, name=self.data['vdc'])
-        vdc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        config['vdc'] = vdc_info['name']
-
-        # get account name
-        proxy = self.api.services.get(
-            template_uid=self.ACCOUNT_TEMPLATE, name=vdc_info['account'])
-        account_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        config['account'] = account_info['name']
-
-        # get ovc name
-        proxy = self.api.services.get(
-            template_uid=self.OVC_TEMPLATE, name=account_info['openvcloud'])
-        ovc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        config['ovc'] = ovc_info['name']
 
-        self._config = config
-        return self._config
+        The names are resolved on each use, the resolver memoizes them for all services
+        and forgets them when the vdc, account or ovc service is updated or uninstalled.
+        """
+        return resolver.vdc(self.api, self.data['vdc'])
 
     @property
     def ovc(self):
         """ An ovc connection instance """
-        if not self._ovc:
-            self._ovc = j.clients.openvcloud.get(instance=self.config['ovc'])
-        return self._ovc
+        return ovc_pool.connect(self, self.config['ovc'], ('_space', '_account'))
 
     @property
     def space(self):
         """ Return vdc client """
 
+        ovc = self.ovc
         if not self._space:
-            self._space = self.ovc.space_get(
+            self._space = ovc.space_get(
                 accountName=self.config['account'],
                 spaceName=self.config['vdc']
             )
@@ -220,22 +264,23 @@ class Disk(TemplateBase):
 
     @property
     def account(self):
-        if not self._account:
+        if not ovc_pool.cached(self, '_account'):
             self._account = self.space.account
 
         return self._account
 
+    @property
+    def account_id(self):
+        """ Id of the account, kept in the service data when the account object is dropped after install """
+        if not self.data['accountId']:
+            self.data['accountId'] = self.account.id
+        return self.data['accountId']
+
     def _limit_io(self):
 
         data = self.data
         self.ovc.api.cloudapi.disks.limitIO(
-            diskId=data['diskId'], iops=data['maxIops'], total_bytes_sec=data['totalBytesSec'],
-            read_bytes_sec=data['readBytesSec'], write_bytes_sec=data['writeBytesSec'],
-            total_iops_sec=data['totalIopsSec'], read_iops_sec=data['readIopsSec'],
-            write_iops_sec=data['writeIopsSec'], total_bytes_sec_max=data['totalBytesSecMax'],
-            read_bytes_sec_max=data['readBytesSecMax'], write_bytes_sec_max=data['writeBytesSecMax'],
-            total_iops_sec_max=data['totalIopsSecMax'], read_iops_sec_max=data['readIopsSecMax'],
-            write_iops_sec_max=data['writeIopsSecMax'], size_iops_sec=data['sizeIopsSec']
+            diskId=data['diskId'], **{arg: data[key] for key, arg in iolimits.IOTUNE.items()}
         )
 
     def get_info(self):
@@ -249,3 +294,26 @@ class Disk(TemplateBase):
             'diskType' : self.data['type'],
             'vdc' : self.data['vdc'],
         }
+
+    def monitor(self):
+        """
+        Detect changes of the disk made outside of this service.
+        Name and size are updated in the service data, changed limits are reported as drift.
+        If the disk doesn't exist anymore, the service is not installed anymore.
+        """
+        self.state.check('actions', 'install', 'ok')
+
+        disk = listings.disk(self.ovc, self.account_id, self.data['diskId'])
+        if disk is None:
+            self._monitor.reset()
+            self.state.delete('actions', 'install')
+            return {'exists': False}
+
+        def fields(disk):
+            iotune = disk.get('iotune') or {}
+            desired = {key: iotune[arg] for key, arg in iolimits.IOTUNE.items() if arg in iotune}
+            return {'name': disk['name'], 'size': disk['sizeMax']}, desired
+
+        result = self._monitor.observe(self.data, disk, fields)
+        result['exists'] = True
+        return result
@@ -1,5 +1,6 @@
 from js9 import j
 import os
+import time
 
 from unittest import TestCase
 from unittest import mock
@@ -7,10 +8,23 @@ from unittest.mock import MagicMock, patch
 from zerorobot import config, template_collection
 from zerorobot.template.state import StateCheckError
 from zerorobot.service_collection import ServiceNotFoundError
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.inventory import disk_inventory
+from ovc_utils.snapshot import snapshots, Snapshot
+
+class NotFoundError(Exception):
+    """ Error of the ovc api when an object doesn't exist """
+    response = MagicMock(status_code=404)
+
 
 class TestDisk(TestCase):
     def setUp(self):
         config.DATA_DIR = '/tmp'
+        resolver.clear()
+        ovc_pool.clear()
+        disk_inventory.clear()
+        snapshots.clear()
         self.type = template_collection._load_template(
             "https://github.com/openvcloud/0-templates",
             os.path.dirname(__file__)
@@ -78,6 +92,14 @@ class TestDisk(TestCase):
                                       }
                                     ],
                                 )
+
+        def disk_get(diskId):
+            for disk in disks:
+                if disk['id'] == diskId:
+                    return dict(disk, accountId=account_mock.id)
+            raise NotFoundError()
+
+        ovc_mock.api.cloudapi.disks.get.side_effect = disk_get
         return ovc_mock
 
     def test_validate_success_create_disk(self):
@@ -278,6 +300,50 @@ class TestDisk(TestCase):
                             type=data['type'],
             )     
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_with_ioprofile(self, ovc):
+        data = {'name': self.disk['info']['name'], 'ioprofile': 'gold'}
+        name = 'my-disk-service'
+        instance = self.type(name=name, data=data)
+        profile = self.set_up_proxy_mock(name='gold')
+
+        def get_service(template_uid, name):
+            if template_uid == self.type.IOPROFILE_TEMPLATE:
+                return profile
+            return self.get_service(template_uid, name)
+
+        with patch.object(instance, 'api') as api:
+            ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+            api.services.get.side_effect = get_service
+            instance.install()
+
+            # the profile applies its limits with the update action of the disk
+            profile.schedule_action.assert_called_with(
+                action='subscribe', args={'disk_service': name})
+            profile.schedule_action.return_value.wait.assert_not_called()
+            ovc.get.return_value.api.cloudapi.disks.limitIO.assert_not_called()
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_existent_disk_from_snapshot(self, ovc):
+        snapshots.set(self.ovc['info']['name'], Snapshot({
+            'version': 1,
+            'created': int(time.time()),
+            'accounts': [{'id': 1, 'name': self.acc['info']['name'], 'acl': []}],
+            'cloudspaces': [{'id': 2, 'accountId': 1, 'name': self.vdc['info']['name'],
+                             'location': self.location['name'], 'acl': []}],
+            'machines': [],
+            'disks': [{'id': 1111, 'accountId': 1, 'name': 'data', 'type': 'D'}],
+        }))
+        instance = self.type(name='my-disk-service', data={'vdc': self.vdc['service'], 'diskId': 1111})
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance.install()
+
+        ovc.get.assert_not_called()
+        self.assertEqual(instance.data['name'], 'data')
+        self.assertEqual(instance.data['location'], self.location['name'])
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_install_existent_disk_success(self, ovc):
         name = 'my-disk-service'
@@ -391,3 +457,20 @@ class TestDisk(TestCase):
             instance.update(maxIops=maxIops)
         
         self.assertEqual(instance.data['maxIops'], maxIops)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_update_fail_invalid_limits(self, ovc):
+        data = dict(self.disk['info'], totalBytesSec=100)
+        instance = self.type(name='test', data=data)
+        instance.state.set('actions', 'install', 'ok')
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+            with self.assertRaisesRegex(RuntimeError, 'total and read/write of bytes_sec'):
+                instance.update(readBytesSec=50)
+
+        # invalid limits are neither kept nor applied
+        self.assertEqual(instance.data['readBytesSec'], 0)
+        self.assertEqual(instance.data['totalBytesSec'], 100)
+        ovc.get.return_value.api.cloudapi.disks.limitIO.assert_not_called()
@@ -0,0 +1,169 @@
+import os
+import sys
+import gevent
+from zerorobot.template.base import TemplateBase
+from zerorobot.template.state import StateCheckError
+
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from ovc_utils.concurrency import bounded_map, report
+from ovc_utils import iolimits
+from ovc_utils.metrics import instrument
+
+
+@instrument
+class Ioprofile(TemplateBase):
+
+    version = '0.0.1'
+    template_name = "ioprofile"
+
+    DISK_TEMPLATE = 'github.com/openvcloud/0-templates/disk/0.0.1'
+
+    def __init__(self, name, guid=None, data=None):
+        super().__init__(name=name, guid=guid, data=data)
+
+    def validate(self):
+        """
+        Validate service data received during creation
+        """
+        iolimits.validate(self.limits)
+
+        if self.data['batchSize'] < 1:
+            raise ValueError('batchSize must be at least 1')
+
+        if self.data['batchInterval'] < 0:
+            raise ValueError('batchInterval can not be negative')
+
+    @property
+    def limits(self):
+        """ IO limits of the profile, named as in the disk schema """
+        return {key: self.data[key] for key in iolimits.IOTUNE}
+
+    def install(self):
+        """
+        Install IO profile
+        """
+        try:
+            self.state.check('actions', 'install', 'ok')
+            return
+        except StateCheckError:
+            pass
+
+        self.state.set('actions', 'install', 'ok')
+
+    def uninstall(self):
+        """
+        Uninstall IO profile. Fails if disks still use the profile.
+        """
+        if self.data['disks']:
+            raise RuntimeError('profile is used by disks: %s' % ', '.join(self.data['disks']))
+
+        self.state.delete('actions', 'install')
+
+    def get_info(self):
+        """ Return IO profile info if installed """
+        self.state.check('actions', 'install', 'ok')
+        return {
+            'name': self.name,
+            'limits': self.limits,
+            'disks': list(self.data['disks']),
+        }
+
+    def _disk(self, name):
+        return self.api.services.get(template_uid=self.DISK_TEMPLATE, name=name)
+
+    def subscribe(self, disk_service):
+        """
+        Register @disk_service as user of the profile and schedule `update` of the disk with the limits
+
+        The disk isn't waited for, it is installing when it subscribes.
+
+        :return: IO limits of the profile
+        """
+        self.state.check('actions', 'install', 'ok')
+        if disk_service not in self.data['disks']:
+            self.data['disks'].append(disk_service)
+
+        limits = self.limits
+        self._disk(disk_service).schedule_action(action='update', args=limits)
+        return limits
+
+    def unsubscribe(self, disk_service):
+        """
+        Unregister @disk_service as user of the profile
+        """
+        if disk_service in self.data['disks']:
+            self.data['disks'].remove(disk_service)
+
+    def update(self, maxIops=None, totalBytesSec=None, readBytesSec=None,
+               writeBytesSec=None, totalIopsSec=None, readIopsSec=None,
+               writeIopsSec=None, totalBytesSecMax=None, readBytesSecMax=None,
+               writeBytesSecMax=None, totalIopsSecMax=None, readIopsSecMax=None,
+               writeIopsSecMax=None, sizeIopsSec=None):
+        """
+        Update limits of the profile and apply them to all disks using the profile
+
+        Limits not given (None) are kept, 0 unsets a limit.
+        Disks are updated in batches of `batchSize` with `batchInterval` seconds in between,
+        if a disk of a batch fails the remaining batches are skipped.
+        Calling update without limits applies the profile again, e.g. after failures.
+
+        :return: dict of disk service name -> {'state': 'ok', 'changed': bool},
+                 {'state': 'error', 'error': message} or {'state': 'skipped'}
+        """
+        self.state.check('actions', 'install', 'ok')
+        limits = {key: value for key, value in [
+            ('maxIops', maxIops),
+            ('totalBytesSec', totalBytesSec),
+            ('readBytesSec', readBytesSec),
+            ('writeBytesSec', writeBytesSec),
+            ('totalIopsSec', totalIopsSec),
+            ('readIopsSec', readIopsSec),
+            ('writeIopsSec', writeIopsSec),
+            ('totalBytesSecMax', totalBytesSecMax),
+            ('readBytesSecMax', readBytesSecMax),
+            ('writeBytesSecMax', writeBytesSecMax),
+            ('totalIopsSecMax', totalIopsSecMax),
+            ('readIopsSecMax', readIopsSecMax),
+            ('writeIopsSecMax', writeIopsSecMax),
+            ('sizeIopsSec', sizeIopsSec),
+        ] if value is not None}
+
+        new = self.limits
+        new.update(limits)
+        iolimits.validate(new)
+        for key, value in limits.items():
+            self.data[key] = value
+
+        return self._rollout()
+
+    def _rollout(self):
+        """
+        Apply limits of the profile to the subscribed disks batch by batch
+        """
+        limits = self.limits
+        disks = list(self.data['disks'])
+        size = self.data['batchSize']
+
+        def limit_io(name):
+            return self._disk(name).schedule_action(action='update', args=limits).wait(die=True).result
+
+        results = {}
+        failed = False
+        for start in range(0, len(disks), size):
+            batch = disks[start:start + size]
+            if failed:
+                results.update({name: {'state': 'skipped'} for name in batch})
+                continue
+
+            if start:
+                gevent.sleep(self.data['batchInterval'])
+
+            outcomes = report(batch, bounded_map(limit_io, batch, size), changed=True)
+            failed = any(outcome['state'] == 'error' for outcome in outcomes.values())
+            results.update(outcomes)
+
+        return results
@@ -0,0 +1,134 @@
+import os
+
+from unittest import TestCase
+from unittest import mock
+from unittest.mock import MagicMock, patch
+from zerorobot import config, template_collection
+from zerorobot.template.state import StateCheckError
+
+
+class TestIoprofile(TestCase):
+    def setUp(self):
+        config.DATA_DIR = '/tmp'
+        self.type = template_collection._load_template(
+            "https://github.com/openvcloud/0-templates",
+            os.path.dirname(__file__)
+        )
+
+    def tearDown(self):
+        patch.stopall()
+
+    @staticmethod
+    def set_up_proxy_mock(result=None, name='service_name'):
+        """ Setup a mock for a proxy of zrobot service  """
+        proxy = MagicMock(schedule_action=MagicMock())
+        proxy.schedule_action().wait = MagicMock()
+        proxy.schedule_action().wait(die=True).result = result
+        proxy.name = name
+        return proxy
+
+    def installed(self, data=None):
+        instance = self.type(name='gold', data=data)
+        instance.state.set('actions', 'install', 'ok')
+        return instance
+
+    def test_validate_success(self):
+        instance = self.type(name='gold', data={'totalIopsSec': 500})
+        instance.validate()
+
+    def test_validate_fail_limits(self):
+        instance = self.type(name='gold', data={'totalIopsSec': 500, 'readIopsSec': 100})
+        with self.assertRaisesRegex(RuntimeError,
+                                    "total and read/write of iops_sec cannot be set at the same time"):
+            instance.validate()
+
+    def test_validate_fail_batch_size(self):
+        instance = self.type(name='gold', data={'batchSize': 0})
+        with self.assertRaisesRegex(ValueError, 'batchSize must be at least 1'):
+            instance.validate()
+
+    def test_install(self):
+        instance = self.type(name='gold', data=None)
+        instance.install()
+        instance.state.check('actions', 'install', 'ok')
+
+    def test_uninstall_fail_used(self):
+        instance = self.installed({'disks': ['disk1']})
+        with self.assertRaisesRegex(RuntimeError, 'profile is used by disks: disk1'):
+            instance.uninstall()
+
+    def test_uninstall(self):
+        instance = self.installed()
+        instance.uninstall()
+        with self.assertRaises(StateCheckError):
+            instance.state.check('actions', 'install', 'ok')
+
+    def test_subscribe(self):
+        instance = self.installed({'totalIopsSec': 500})
+        proxy = self.set_up_proxy_mock(name='disk1')
+        with patch.object(instance, 'api') as api:
+            api.services.get.return_value = proxy
+            limits = instance.subscribe('disk1')
+            instance.subscribe('disk1')
+        self.assertEqual(instance.data['disks'], ['disk1'])
+        self.assertEqual(limits['totalIopsSec'], 500)
+        # the disk is installing, it isn't waited for
+        proxy.schedule_action.assert_called_with(action='update', args=limits)
+        proxy.schedule_action.return_value.wait.assert_not_called()
+        self.assertEqual(instance.get_info()['limits'], limits)
+
+        instance.unsubscribe('disk1')
+        instance.unsubscribe('disk1')
+        self.assertEqual(instance.data['disks'], [])
+
+    def test_subscribe_fail_statecheckerror(self):
+        instance = self.type(name='gold', data=None)
+        with self.assertRaises(StateCheckError):
+            instance.subscribe('disk1')
+
+    def test_update_fail_limits(self):
+        instance = self.installed({'totalIopsSec': 500})
+        with self.assertRaisesRegex(RuntimeError,
+                                    "total and read/write of iops_sec cannot be set at the same time"):
+            instance.update(readIopsSec=100)
+        with self.assertRaises(TypeError):
+            instance.update(iops=100)
+        self.assertEqual(instance.data['readIopsSec'], 0)
+
+    @mock.patch('gevent.sleep')
+    def test_update_rollout(self, sleep):
+        disks = ['disk%d' % i for i in range(5)]
+        instance = self.installed({'disks': disks, 'batchSize': 2, 'batchInterval': 3})
+        proxy = self.set_up_proxy_mock(result=True)
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.return_value = proxy
+            result = instance.update(totalIopsSec=500)
+
+        self.assertEqual(instance.data['totalIopsSec'], 500)
+        self.assertEqual(result, {name: {'state': 'ok', 'changed': True} for name in disks})
+        proxy.schedule_action.assert_called_with(action='update', args=instance.limits)
+        # 3 batches with a pause in between
+        self.assertEqual(sleep.call_count, 2)
+        sleep.assert_called_with(3)
+
+    @mock.patch('gevent.sleep')
+    def test_update_rollout_stops_on_error(self, sleep):
+        disks = ['disk%d' % i for i in range(4)]
+        instance = self.installed({'disks': disks, 'batchSize': 2})
+
+        def get_service(template_uid, name):
+            proxy = self.set_up_proxy_mock(result=False, name=name)
+            if name == 'disk1':
+                proxy.schedule_action().wait.side_effect = RuntimeError('disk is detached')
+            return proxy
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = get_service
+            result = instance.update()
+
+        self.assertEqual(result['disk0'], {'state': 'ok', 'changed': False})
+        self.assertEqual(result['disk1'], {'state': 'error', 'error': 'disk is detached'})
+        self.assertEqual(result['disk2'], {'state': 'skipped'})
+        self.assertEqual(result['disk3'], {'state': 'skipped'})
+        sleep.assert_not_called()
@@ -0,0 +1,32 @@
+# Formats and mounts the data disk of a VM in one ssh session.
+# Expects DEVICE, MOUNTPOINT and FSTYPE to be set. With CHECK_ONLY set,
+# only reports the mount. The last line of output is the state of the
+# mount as JSON: {"formatted": bool, "mount": <findmnt --json output>}
+set -e
+
+mount_state() {
+    state=$(findmnt --json --source "$DEVICE" --output SOURCE,TARGET,FSTYPE) \
+        || state='{"filesystems": []}'
+    echo "$state" | tr -d '\n'
+}
+
+if [ -n "$CHECK_ONLY" ] || findmnt --source "$DEVICE" > /dev/null; then
+    echo "{\"formatted\": false, \"mount\": $(mount_state)}"
+    exit 0
+fi
+
+if [ -z "$(blkid -o value -s TYPE "$DEVICE")" ]; then
+    mkfs -t "$FSTYPE" "$DEVICE" > /dev/null
+fi
+
+# copy current content of the mount point to the disk
+tmp=$(mktemp -d)
+mount "$DEVICE" "$tmp"
+cp -a "$MOUNTPOINT"/. "$tmp"/
+umount "$tmp"
+rmdir "$tmp"
+
+grep -q "^$DEVICE " /etc/fstab || echo "$DEVICE $MOUNTPOINT $FSTYPE defaults 0 2" >> /etc/fstab
+mount "$MOUNTPOINT"
+
+echo "{\"formatted\": true, \"mount\": $(mount_state)}"
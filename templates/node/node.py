@@ -1,10 +1,31 @@
-import re
+import base64
+import json
+import os
+import shlex
+import sys
 from js9 import j
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
-from zerorobot.template.decorator import retry
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
 
+from ovc_utils.resolver import resolver, fetch_info
+from ovc_utils.retry import retry, is_transient
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.waiter import wait_for
+from ovc_utils.concurrency import bounded_map, parallel
+from ovc_utils.monitor import Monitor, listings
+from ovc_utils.cache import TTLValue
+from ovc_utils.metrics import instrument
+
+# seconds a VM object is reused by the actions of a node
+MACHINE_TTL = 60
+
+
+@instrument
 class Node(TemplateBase):
 
     version = '0.0.1'
@@ -16,13 +37,16 @@ class Node(TemplateBase):
     SSH_TEMPLATE = 'github.com/openvcloud/0-templates/sshkey/0.0.1'
     DISK_TEMPLATE = 'github.com/openvcloud/0-templates/disk/0.0.1'
 
+    # number of disk services installed at the same time
+    DISK_CONCURRENCY = 5
+
     def __init__(self, name, guid=None, data=None):
         super().__init__(name=name, guid=guid, data=data)
 
-        self._config = None
         self._ovc = None
         self._space = None
-        self._machine = None
+        self._machine = TTLValue(MACHINE_TTL)
+        self._monitor = Monitor()
 
     def validate(self):
         """
@@ -48,73 +72,99 @@ class Node(TemplateBase):
             'disk_services': self.data['disks']
         }
 
-    @property
-    def config(self):
+    def monitor(self):
         """
-        returns an object with names of vdc, account, and ovc
+        Detect changes of the VM made outside of this service.
+        CPUs and memory are updated in the service data, a changed name is reported as drift.
+        If the VM doesn't exist anymore, the service is not installed anymore.
         """
-        if self._config is not None:
-            return self._config
-
-        config = {}
-        # traverse the tree up words so we have all info we need to return, connection and
+        self.state.check('actions', 'install', 'ok')
 
-        # get vdc proxy
-        proxy = self.api.services.get(template_uid=self.VDC_TEMPLATE, name=self.data['vdc'])
+        machine = listings.machine(self.ovc, self.space_id, self.data['machineId'])
+        if machine is None:
+            self._monitor.reset()
+            self._machine.clear()
+            self.state.delete('actions', 'install')
+            return {'exists': False}
 
-        # get vdc info
-        vdc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        config['vdc'] = vdc_info['name']
+        def fields(machine):
+            mirrored = {key: machine[remote] for key, remote in [('vCpus', 'vcpus'), ('memSize', 'memory')]
+                        if remote in machine}
+            return mirrored, {'name': machine['name']}
 
-        # get account name
-        proxy = self.api.services.get(template_uid=self.ACCOUNT_TEMPLATE,  name=vdc_info['account'])
-        account_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        config['account'] = account_info['name']
+        result = self._monitor.observe(self.data, machine, fields)
+        result['exists'] = True
+        result['status'] = machine['status']
+        return result
 
-        # get connection instance name
-        proxy = self.api.services.get(
-            template_uid=self.OVC_TEMPLATE, name=account_info['openvcloud'])
-        ovc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        config['ovc'] = ovc_info['name']
+    @property
+    def config(self):
+        """
+        returns an object with names of vdc, account, and ovc
 
-        self._config = config
-        return self._config
+        The names are resolved on each use, the resolver memoizes them for all services
+        and forgets them when the vdc, account or ovc service is updated or uninstalled.
+        """
+        return resolver.vdc(self.api, self.data['vdc'])
 
     @property
     def ovc(self):
         """
         An ovc connection instance
         """
-        if self._ovc is not None:
-            return self._ovc
-
-        self._ovc = j.clients.openvcloud.get(instance=self.config['ovc'])
-
-        return self._ovc
+        return ovc_pool.connect(self, self.config['ovc'], ('_space', '_machine'))
 
     @property
     def space(self):
         """ Return space object """
+        ovc = self.ovc
         if not self._space:
             account = self.config['account']
             vdc = self.config['vdc']
-            self._space = self.ovc.space_get(
+            self._space = ovc.space_get(
                 accountName=account,
                 spaceName=vdc
             )
         return self._space
 
     @property
-    def machine(self):
-        """ Return VM object """
-        if not self._machine:
-            if self.data['name'] in self.space.machines:
-                self._machine = self.space.machine_get(name=self.data['name'])
+    def space_id(self):
+        """ Id of the space, kept in the service data for the actions run after a restart of the robot """
+        if not self.data['cloudspaceId']:
+            self.data['cloudspaceId'] = self.space.id
+        return self.data['cloudspaceId']
 
-        return self._machine
+    @property
+    def machine(self):
+        """
+        Return VM object, None if the VM doesn't exist
 
-    @retry((BaseException),
-           tries=5, delay=3, backoff=2, logger=None)
+        A VM with a known id is looked up in the listing of the cloudspace shared by
+        all nodes (see `monitor.listings`), and by id if it isn't listed, then got by its
+        current name, so a renamed VM is found. A VM without id is looked up by name in the
+        cloudspace. The VM object is reused for MACHINE_TTL seconds.
+        """
+        machine = self._machine.get()
+        if machine is None:
+            if self.data['machineId']:
+                listed = listings.machine(self.ovc, self.space_id, self.data['machineId'])
+                name = listed['name'] if listed is not None else None
+            else:
+                name = self.data['name'] if self.data['name'] in self.space.machines else None
+            if name is None:
+                return None
+            try:
+                machine = self.space.machine_get(name=name)
+            except Exception as err:
+                if not self.data['machineId'] or is_transient(err):
+                    raise
+                # renamed or deleted since the cloudspace was listed
+                return None
+            self._machine.set(machine)
+
+        return machine
+
+    @retry(tries=5, delay=3, backoff=2)
     def install(self):
         """ Install VM """
 
@@ -134,20 +184,30 @@ class Node(TemplateBase):
         self.data['machineId'] = machine.id
         # configure disks of the vm
         self._configure_disks()
+        self._release()
         self.state.set('actions', 'install', 'ok')
 
+    def _release(self):
+        """
+        Drop the VM object, the space object is kept to get the VM again without looking up the space
+        """
+        if self._space is not None:
+            self.data['cloudspaceId'] = self._space.id
+        self._machine.clear()
+
     def _machine_create(self):
         """ 
         Create a new machine
         """
         data = self.data
 
-        # get name of sshkey
-        proxy = self.api.services.get(
-            template_uid=self.SSH_TEMPLATE, name=self.data['sshKey'])
-        sshkey_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        # get name of sshkey while the space is looked up
+        sshkey_info, space = parallel(
+            lambda: fetch_info(self.api, self.SSH_TEMPLATE, self.data['sshKey']),
+            lambda: self.space,
+        )
 
-        self._machine = self.space.machine_create(
+        machine = space.machine_create(
             name=data['name'],
             sshkeyname=sshkey_info['name'],
             image=data['osImage'],
@@ -156,8 +216,9 @@ class Node(TemplateBase):
             sizeId=data['sizeId'],
             managed_private=data.get('managedPrivate', False)
         )
+        self._machine.set(machine)
 
-        return self._machine
+        return machine
 
     def _configure_disks(self):
         """
@@ -202,40 +263,85 @@ class Node(TemplateBase):
             machine.disk_add(name='Disk nr 1', description='Machine disk of type D',
                              size=self.data['dataDiskSize'], type='D')
 
-        for disk in machine.disks:
-            # create a disk service
-            self._create_disk_service(disk)
+        # create disk services
+        self._create_disk_services(machine.disks)
 
-        prefab = self._get_prefab()
+        # format and mount data disk
+        self._mount_data_disk(device, mount_point, fs_type)
+
+    def _mount_data_disk(self, device, mount_point, fs_type):
+        """
+        Format and mount the data disk in a single ssh session.
 
-        # check if device is already mounted
-        _, disk_info, _ = prefab.core.run('mount')
-        if disk_info.find(device) != -1:
-            # check if mount point is correct
-            mp_found = re.search('%s on (.+?) ' % device, disk_info)
-
-            if mp_found == None or mp_found.group(1) != mount_point:
-                raise RuntimeError('mount point of device "{device}" is "{mp_found}", expected "{mp}"'.format(
-                    device=device, mp_found=mp_found, mp=mount_point
-                ))
-
-            # check type of the filesystem
-            fs_found = re.search('%s on %s type (.+?) ' %
-                                 (device, mount_point), disk_info)
-            if fs_found == None or fs_found.group(1) != fs_type:
-                raise RuntimeError('VM "{vm}" has volume mounted on {mp} with filesystem "{fs}", should be "{fs_type}"'.format(
-                    vm=self.data['name'], mp=mount_point, fs=fs_found, fs_type=fs_type))
-            # if filesystem is correct, install is complete
+        The VM is only restarted if the new mount can't be verified live.
+        """
+        prefab = self._get_prefab()
+        state = self._bootstrap_disk(prefab, device, mount_point, fs_type)
+        if not state['formatted']:
+            # device was mounted already, check it is mounted as expected
+            self._check_mount(state['mount'], device, mount_point, fs_type)
             return
 
-        # create file system and mount data disk
-        prefab.system.filesystem.create(fs_type=fs_type, device=device)
-        prefab.system.filesystem.mount(mount_point=mount_point, device=device,
-                                       copy=True, append_fstab=True, fs_type=fs_type)
+        try:
+            self._check_mount(state['mount'], device, mount_point, fs_type)
+            return
+        except RuntimeError:
+            pass
 
-        machine.restart()
+        # mount from fstab on boot
+        self.machine.restart()
         prefab = self._get_prefab()
-        prefab.executor.sshclient.connect()
+        wait_for(
+            lambda: self._ssh_connect(prefab),
+            timeout=120,
+            message='VM "%s" is not reachable over ssh after restart' % self.data['name'],
+        )
+        state = self._bootstrap_disk(prefab, device, mount_point, fs_type, check_only=True)
+        self._check_mount(state['mount'], device, mount_point, fs_type)
+
+    def _bootstrap_disk(self, prefab, device, mount_point, fs_type, check_only=False):
+        """
+        Run bootstrap_disk.sh on the VM, return the state it reports
+        """
+        script = j.sal.fs.fileGetContents(
+            j.sal.fs.joinPaths(j.sal.fs.getDirName(__file__), 'bootstrap_disk.sh')
+        )
+        env = {'DEVICE': device, 'MOUNTPOINT': mount_point, 'FSTYPE': fs_type}
+        if check_only:
+            env['CHECK_ONLY'] = '1'
+
+        # pass the script encoded, so it runs in one command without quoting issues
+        _, out, _ = prefab.core.run('echo {script} | base64 -d | sudo -n {env} bash'.format(
+            script=base64.b64encode(script.encode()).decode(),
+            env=' '.join('%s=%s' % (key, shlex.quote(value)) for key, value in sorted(env.items())),
+        ))
+        return json.loads(out.strip().splitlines()[-1])
+
+    def _check_mount(self, mount, device, mount_point, fs_type):
+        """
+        Check that @device is mounted on @mount_point with filesystem @fs_type
+
+        :param mount: output of findmnt --json for the device
+        """
+        filesystems = mount.get('filesystems', [])
+        mounted = [fs for fs in filesystems if fs['target'] == mount_point]
+        if not mounted:
+            raise RuntimeError('mount point of device "{device}" is "{mp_found}", expected "{mp}"'.format(
+                device=device, mp_found=', '.join(fs['target'] for fs in filesystems), mp=mount_point
+            ))
+
+        if mounted[0]['fstype'] != fs_type:
+            raise RuntimeError('VM "{vm}" has volume mounted on {mp} with filesystem "{fs}", should be "{fs_type}"'.format(
+                vm=self.data['name'], mp=mount_point, fs=mounted[0]['fstype'], fs_type=fs_type))
+
+    @staticmethod
+    def _ssh_connect(prefab):
+        """ Try to connect to the VM, return True on success """
+        try:
+            prefab.executor.sshclient.connect()
+        except Exception:
+            return False
+        return True
 
     def _create_disk_service(self, disk, service_name=None):
         """ Create a disk service
@@ -243,6 +349,30 @@ class Node(TemplateBase):
             :param disk: dict of data
             service_name: name of the disk service
         """
+        service_name = self._install_disk_service(disk, service_name)
+
+        # append service name to the list of attached disks
+        if service_name not in self.data['disks']:
+            self.data['disks'].append(service_name)
+
+    def _create_disk_services(self, disks):
+        """ Create disk services for a list of disks
+
+            Services are installed concurrently. Vdc, account and ovc of the
+            node are already resolved, so disk services find them in the
+            robot-wide resolver cache.
+
+            :param disks: list of dicts of data
+        """
+        results = bounded_map(self._install_disk_service, disks, self.DISK_CONCURRENCY)
+        for service_name, err in results:
+            if err is not None:
+                raise err
+            if service_name not in self.data['disks']:
+                self.data['disks'].append(service_name)
+
+    def _install_disk_service(self, disk, service_name=None):
+        """ Create and install a disk service, return its name """
         if not service_name:
             service_name = 'Disk%s' % str(disk['id'])
 
@@ -256,10 +386,7 @@ class Node(TemplateBase):
         )
         # update data in the disk service
         service.schedule_action(action='install').wait(die=True)
-
-        # append service name to the list of attached disks
-        if service_name not in self.data['disks']:
-            self.data['disks'].append(service_name)
+        return service_name
 
     def _get_prefab(self):
         """ Get prefab """
@@ -284,43 +411,51 @@ class Node(TemplateBase):
             proxy = self.api.services.get(template_uid=self.DISK_TEMPLATE, name=disk)
             proxy.delete()
 
-        self._machine = None
+        self._machine.clear()
+
+    def _lifecycle(self, method, api_method):
+        """
+        Call @method of the VM object, or @api_method of the machines API if the VM id is known
+        """
+        self.state.check('actions', 'install', 'ok')
+        if not self.data['machineId']:
+            getattr(self.machine, method)()
+            return
+
+        # one call by id instead of looking up the cloudspace and the VM
+        getattr(self.ovc.api.cloudapi.machines, api_method)(machineId=self.data['machineId'])
+        # status of the cached VM object is outdated
+        self._machine.clear()
 
     def start(self):
         """ Start the VM """
 
-        self.state.check('actions', 'install', 'ok')
-        self.machine.start()
+        self._lifecycle('start', 'start')
 
     def stop(self):
         """ Stop the VM """
 
-        self.state.check('actions', 'install', 'ok')
-        self.machine.stop()
+        self._lifecycle('stop', 'stop')
 
     def restart(self):
         """ Restart the VM """
 
-        self.state.check('actions', 'install', 'ok')
-        self.machine.restart()
+        self._lifecycle('restart', 'reboot')
 
     def pause(self):
         """ Pause the VM """
 
-        self.state.check('actions', 'install', 'ok')
-        self.machine.pause()
+        self._lifecycle('pause', 'pause')
 
     def resume(self):
         """ Resume the VM """
 
-        self.state.check('actions', 'install', 'ok')
-        self.machine.resume()
+        self._lifecycle('resume', 'resume')
 
     def reset(self):
         """ Reset the VM """
 
-        self.state.check('actions', 'install', 'ok')
-        self.machine.reset()
+        self._lifecycle('reset', 'reset')
 
     def snapshot(self):
         """
@@ -375,13 +510,14 @@ class Node(TemplateBase):
 
         self.state.check('actions', 'install', 'ok')
 
-        # get diskId
-        proxy = self.api.services.get(
-            template_uid=self.DISK_TEMPLATE, name=disk_service_name)
-        disk_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        # get diskId while the machine is looked up
+        disk_info, machine = parallel(
+            lambda: fetch_info(self.api, self.DISK_TEMPLATE, disk_service_name),
+            lambda: self.machine,
+        )
 
         # attach the disk
-        self.machine.disk_attach(disk_info['diskId'])
+        machine.disk_attach(disk_info['diskId'])
 
         # add service name to data
         self.data['disks'].append(disk_service_name)
@@ -397,19 +533,17 @@ class Node(TemplateBase):
 
         if disk_service_name not in self.data['disks']:
             return
-        # get disk id and type
-
-        proxy = self.api.services.get(
-            template_uid=self.DISK_TEMPLATE, name=disk_service_name)
-
-        # fetch disk info
-        disk_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        # fetch disk id and type while the machine is looked up
+        disk_info, machine = parallel(
+            lambda: fetch_info(self.api, self.DISK_TEMPLATE, disk_service_name),
+            lambda: self.machine,
+        )
 
         if disk_info['diskType'] == 'B':
             raise RuntimeError("Can't detach Boot disk")
 
         # detach disk
-        self.machine.disk_detach(disk_info['diskId'])
+        machine.disk_detach(disk_info['diskId'])
 
         # delete disk from list of attached disks
         self.data['disks'].remove(disk_service_name)
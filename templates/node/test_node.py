@@ -3,8 +3,10 @@ from unittest import mock
 from unittest.mock import MagicMock, patch
 from unittest import skip
 import tempfile
+import json
 import shutil
 import os
+import time
 
 from js9 import j
 from zerorobot.template.base import TemplateBase
@@ -12,12 +14,23 @@ from zerorobot import config, template_collection
 from zerorobot.template_uid import TemplateUID
 from zerorobot.template.state import StateCheckError
 from zerorobot.service_collection import ServiceNotFoundError
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.monitor import listings
+
+
+class NotFoundError(Exception):
+    """ Error of the ovc api when an object doesn't exist """
+    response = MagicMock(status_code=404)
 
 
 class TestNode(TestCase):
 
     def setUp(self):
         config.DATA_DIR = '/tmp'
+        resolver.clear()
+        ovc_pool.clear()
+        listings.clear()
         self.type = template_collection._load_template(
             "https://github.com/openvcloud/0-templates",
             os.path.dirname(__file__)
@@ -65,11 +78,21 @@ class TestNode(TestCase):
                  {'type': 'D', 'sizeMax': 10, 'id': 4321}]
         machine_mock = MagicMock(disks=disks)
         machine_mock.prefab.core.run.return_value = (
-                    None, '/dev/vdb on /var type ext4 ', None)
+                    None, self.mount_output(), None)
         space_mock = MagicMock(machines=[self.node['info']['name']],
                                machine_create=MagicMock(return_value=machine_mock))
         return MagicMock(space_get=MagicMock(return_value=space_mock))
 
+    @staticmethod
+    def mount_output(target='/var', fstype='ext4', formatted=False):
+        """ Output of bootstrap_disk.sh """
+        return 'some output\n' + json.dumps({
+            'formatted': formatted,
+            'mount': {'filesystems': [
+                {'source': '/dev/vdb', 'target': target, 'fstype': fstype}
+            ]},
+        })
+
     @staticmethod
     def set_up_proxy_mock(result=None, name='service_name'):
         """ Setup a mock for a proxy of zrobot service  """
@@ -155,6 +178,20 @@ class TestNode(TestCase):
         self.assertEqual(
             instance.config['vdc'], self.vdc['info']['name'])
 
+    def test_config_invalidated(self):
+        """
+        Test that the config follows the resolver when the vdc is invalidated
+        """
+        instance = self.type(name='test', data=self.node['info'])
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            self.assertEqual(instance.config['vdc'], self.vdc['info']['name'])
+
+            self.vdc['info']['name'] = 'renamed_vdc'
+            resolver.invalidate(self.vdc['service'])
+            self.assertEqual(instance.config['vdc'], 'renamed_vdc')
+
     def test_config_fail_no_vdc_service(self):
         """
         Test getting config from a vdc service
@@ -164,6 +201,27 @@ class TestNode(TestCase):
         with self.assertRaises(ServiceNotFoundError):
             instance.config
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_ovc_invalidated(self, ovc):
+        """
+        Test that the service uses the new client once the connection is invalidated
+        """
+        ovc.get.side_effect = [self.ovc_mock(self.ovc['info']['name']),
+                               self.ovc_mock(self.ovc['info']['name'])]
+        instance = self.type(name='test', data=self.node['info'])
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            old = instance.ovc
+            space = instance.space
+            self.assertIs(instance.ovc, old)
+
+            ovc_pool.invalidate(self.ovc['info']['name'])
+            self.assertIsNot(instance.ovc, old)
+            self.assertIsNot(instance.space, space)
+            instance.ovc.space_get.assert_called_once_with(
+                accountName=self.acc['info']['name'], spaceName=self.vdc['info']['name'])
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_install_when_already_installed(self, ovc):
         """
@@ -206,6 +264,94 @@ class TestNode(TestCase):
                 image='Ubuntu 16.04'
             )
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_creates_disk_services(self, ovc):
+        """
+        Test disk services are created for all disks of the VM
+        """
+        instance = self.type(name='test', data=self.node['info'])
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+
+        def find_or_create(template_uid, service_name, data):
+            self.assertEqual(data['vdc'], self.vdc['service'])
+            return self.set_up_proxy_mock(name=service_name)
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            api.services.find_or_create.side_effect = find_or_create
+            instance.install()
+
+        self.assertEqual(instance.data['disks'], ['Disk1234', 'Disk4321'])
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_fail_disk_service(self, ovc):
+        """
+        Test install fails if a disk service fails to install
+        """
+        instance = self.type(name='test', data=self.node['info'])
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+
+        def find_or_create(template_uid, service_name, data):
+            proxy = self.set_up_proxy_mock(name=service_name)
+            if service_name == 'Disk4321':
+                proxy.schedule_action().wait.side_effect = ValueError('disk not found')
+            return proxy
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            api.services.find_or_create.side_effect = find_or_create
+            with self.assertRaisesRegex(ValueError, 'disk not found'):
+                instance.install()
+
+    def install_with_mount_output(self, ovc, outputs):
+        """ Install a node, bootstrap_disk.sh returns @outputs one after the other """
+        instance = self.type(name='test', data=self.node['info'])
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        machine = ovc.get.return_value.space_get.return_value.machine_create.return_value
+        machine.prefab.core.run.side_effect = [(0, output, '') for output in outputs]
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            api.services.find_or_create.side_effect = \
+                lambda template_uid, service_name, data: self.set_up_proxy_mock(name=service_name)
+            instance.install()
+        return machine
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_mount_verified_live(self, ovc):
+        """
+        Test data disk is formatted and mounted without restart of the VM
+        """
+        machine = self.install_with_mount_output(ovc, [self.mount_output(formatted=True)])
+
+        machine.prefab.core.run.assert_called_once()
+        self.assertIn('| base64 -d | sudo -n DEVICE=/dev/vdb FSTYPE=ext4 MOUNTPOINT=/var bash',
+                      machine.prefab.core.run.call_args[0][0])
+        machine.restart.assert_not_called()
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_mount_after_restart(self, ovc):
+        """
+        Test VM is restarted if mount of data disk can't be verified live
+        """
+        machine = self.install_with_mount_output(ovc, [
+            self.mount_output(target='/tmp/tmp.xyz', formatted=True),
+            self.mount_output(),
+        ])
+
+        machine.restart.assert_called_once_with()
+        self.assertEqual(machine.prefab.core.run.call_count, 2)
+        self.assertIn('CHECK_ONLY=1', machine.prefab.core.run.call_args[0][0])
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_install_fail_wrong_mount_point(self, ovc):
+        """
+        Test failing install if data disk is mounted on another mount point
+        """
+        with self.assertRaisesRegex(RuntimeError,
+                                    'mount point of device "/dev/vdb" is "/data", expected "/var"'):
+            self.install_with_mount_output(ovc, [self.mount_output(target='/data')])
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_install_fail_wrong_data_disk_size(self, ovc):
         """
@@ -273,6 +419,103 @@ class TestNode(TestCase):
         with self.assertRaises(StateCheckError):
             instance.state.check('actions', 'install', 'ok')
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_monitor(self, ovc):
+        """
+        Test detecting changes of the VM
+        """
+        instance = self.type(name='test', data=self.node['info'])
+        instance.state.set('actions', 'install', 'ok')
+        instance.data['machineId'] = 10
+
+        machines = [{'id': 10, 'name': self.node['info']['name'], 'status': 'RUNNING', 'vcpus': 2, 'memory': 2048}]
+        ovc.get.side_effect = self.ovc_mock
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance.ovc.api.cloudapi.machines.list.return_value = machines
+            result = instance.monitor()
+            self.assertEqual(result['updated'], {'vCpus': 2, 'memSize': 2048})
+            self.assertEqual(result['drift'], {})
+            self.assertEqual(result['status'], 'RUNNING')
+            self.assertEqual(instance.data['vCpus'], 2)
+
+            # the VM was created after the listing was cached
+            listings.clear()
+            instance.ovc.api.cloudapi.machines.list.return_value = []
+            instance.ovc.api.cloudapi.machines.get.return_value = machines[0]
+            self.assertTrue(instance.monitor()['exists'])
+            instance.ovc.api.cloudapi.machines.get.assert_called_once_with(machineId=10)
+
+            # the VM was deleted
+            listings.clear()
+            instance.ovc.api.cloudapi.machines.get.side_effect = NotFoundError()
+            self.assertEqual(instance.monitor(), {'exists': False})
+
+        with self.assertRaises(StateCheckError):
+            instance.state.check('actions', 'install', 'ok')
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_machine_deleted(self, ovc):
+        """
+        Test getting the VM object of a VM with known id that was deleted
+        """
+        instance = self.type(name='test', data=dict(self.node['info'], machineId=10, cloudspaceId=1))
+
+        ovc.get.side_effect = self.ovc_mock
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance.ovc.api.cloudapi.machines.list.return_value = []
+            instance.ovc.api.cloudapi.machines.get.side_effect = NotFoundError()
+            self.assertIsNone(instance.machine)
+            instance.ovc.space_get.return_value.machine_get.assert_not_called()
+
+            # the VM is listed
+            listings.clear()
+            instance.ovc.api.cloudapi.machines.list.return_value = [{'id': 10, 'name': self.node['info']['name']}]
+            self.assertIs(instance.machine, instance.ovc.space_get.return_value.machine_get.return_value)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_machine_renamed(self, ovc):
+        """
+        Test getting the VM object of a VM with known id that was renamed
+        """
+        instance = self.type(name='test', data=dict(self.node['info'], machineId=10, cloudspaceId=1))
+
+        ovc.get.side_effect = self.ovc_mock
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            space = instance.space
+            instance.ovc.api.cloudapi.machines.list.return_value = [{'id': 10, 'name': 'renamed'}]
+            self.assertIs(instance.machine, space.machine_get.return_value)
+            space.machine_get.assert_called_once_with(name='renamed')
+
+            # renamed again after the cloudspace was listed
+            instance._machine.clear()
+            space.machine_get.side_effect = RuntimeError('Cannot find machine:renamed')
+            self.assertIsNone(instance.machine)
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_release_keeps_space(self, ovc):
+        """
+        Test that the VM is got again without looking up the space after install
+        """
+        instance = self.type(name='test', data=dict(self.node['info'], machineId=10))
+
+        ovc.get.side_effect = self.ovc_mock
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            space = instance.space
+            space.id = 1
+            instance._machine.set(MagicMock())
+            instance._release()
+            self.assertEqual(instance.data['cloudspaceId'], 1)
+            self.assertIsNone(instance._machine.get())
+
+            instance.ovc.api.cloudapi.machines.list.return_value = [{'id': 10, 'name': self.node['info']['name']}]
+            self.assertIs(instance.machine, space.machine_get.return_value)
+            instance.ovc.space_get.assert_called_once_with(
+                accountName=self.acc['info']['name'], spaceName=self.vdc['info']['name'])
+
     def test_start_success(self):
         """
         Test successfull start action
@@ -280,10 +523,28 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.start()
         instance.machine.start.assert_called_once_with()
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_restart_by_id(self, ovc):
+        """
+        Test restart action of a VM with known id
+        """
+        instance = self.type(name='test', data=dict(self.node['info'], machineId=123))
+
+        instance.state.set('actions', 'install', 'ok')
+        ovc.get.side_effect = self.ovc_mock
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance._machine.set(MagicMock())
+            instance.restart()
+            instance.ovc.api.cloudapi.machines.reboot.assert_called_once_with(machineId=123)
+            instance.ovc.space_get.assert_not_called()
+            # cached VM object is outdated
+            self.assertIsNone(instance._machine.get())
+
     def test_start_fail(self):
         """
         Test failing start action
@@ -301,7 +562,7 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.stop()
         instance.machine.stop.assert_called_once_with()
 
@@ -322,7 +583,7 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.restart()
         instance.machine.restart.assert_called_once_with()
 
@@ -343,7 +604,7 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.pause()
         instance.machine.pause.assert_called_once_with()
 
@@ -364,7 +625,7 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.resume()
         instance.machine.resume.assert_called_once_with()
 
@@ -385,7 +646,7 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.reset()
         instance.machine.reset.assert_called_once_with()
 
@@ -406,7 +667,7 @@ class TestNode(TestCase):
         instance = self.type(name='test', data=self.node['info'])
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.snapshot()
         instance.machine.snapshot_create.assert_called_once_with()
 
@@ -428,7 +689,7 @@ class TestNode(TestCase):
         clone_name = 'test_clone'
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.clone(clone_name)
         instance.machine.clone.assert_called_once_with(clone_name)
 
@@ -457,7 +718,7 @@ class TestNode(TestCase):
         snapshot_epoch = 'test_epoch'
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.snapshot_rollback(snapshot_epoch)
         instance.machine.snapshot_rollback.assert_called_once_with(
             snapshot_epoch)
@@ -488,7 +749,7 @@ class TestNode(TestCase):
         snapshot_epoch = 'test_epoch'
 
         instance.state.set('actions', 'install', 'ok')
-        instance._machine = MagicMock()
+        instance._machine.set(MagicMock())
         instance.snapshot_delete(snapshot_epoch)
         instance.machine.snapshot_delete.assert_called_once_with(
             snapshot_epoch)
@@ -528,7 +789,7 @@ class TestNode(TestCase):
         with patch.object(instance, 'api') as api:
             api.services.get.side_effect = self.get_service
             api.services.find_or_create.side_effect = find_or_create
-            instance._machine = MagicMock()
+            instance._machine.set(MagicMock())
             instance.disk_add(name='test')
             instance.machine.disk_add.assert_called_with(
                 name='test', description='Data disk', size=10, type='D'
@@ -561,7 +822,7 @@ class TestNode(TestCase):
 
         with patch.object(instance, 'api') as api:
             api.services.get.side_effect = self.get_service
-            instance._machine = MagicMock()
+            instance._machine.set(MagicMock())
             instance.disk_attach(disk_service_name='test')
             instance.machine.disk_attach.assert_called_with(self.disk['info']['diskId'])
 
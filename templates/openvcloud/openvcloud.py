@@ -1,7 +1,27 @@
+import logging
+import os
+import sys
 from js9 import j
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
+from zerorobot import service_collection
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils import metrics
+from ovc_utils.ratelimit import scheduler
+from ovc_utils import snapshot
+from ovc_utils.footprint import usage
+
+logger = logging.getLogger(__name__)
+
+
+@metrics.instrument
 class Openvcloud(TemplateBase):
 
     version = '0.0.1'
@@ -10,12 +30,33 @@ class Openvcloud(TemplateBase):
     def __init__(self, name, guid=None, data=None):
         super().__init__(name=name, guid=guid, data=data)
 
+        self._limit_rate()
+
+        if self.data.get('snapshot') and os.path.exists(self.data['snapshot']):
+            self._load_snapshot()
+
+    def _load_snapshot(self):
+        """
+        Load the inventory snapshot of the ovc
+
+        A snapshot that can't be read is skipped, services then call the OVC instead.
+        """
+        try:
+            snapshot.snapshots.load(self.data['name'], self.data['snapshot'], self.data['snapshotMaxAge'])
+        except Exception:
+            logger.warning('inventory snapshot "%s" of ovc "%s" not loaded, continuing without it',
+                           self.data['snapshot'], self.data['name'], exc_info=True)
 
     def validate(self):
         for key in ['name', 'address', 'token', 'location']:
             if not self.data[key]:
                 raise ValueError('%s is required' % key)
 
+    def _limit_rate(self):
+        """ Set request budget of the OVC API endpoints """
+        if self.data.get('address'):
+            scheduler.configure(self.data['address'], self.data['apiRate'], self.data['apiBurst'])
+
     def get_info(self):
         """
         Return info of ovc connection if successfully installed
@@ -47,6 +88,11 @@ class Openvcloud(TemplateBase):
         """
         Configure ovc connection
         """
+        # the metrics server is started by the first install of an ovc service in the robot,
+        # also when the service is installed already, e.g. after a restart of the robot
+        if self.data['metricsPort']:
+            metrics.serve(self.data['metricsPort'])
+
         try:
             self.state.check('actions', 'install', 'ok')
             return
@@ -64,6 +110,53 @@ class Openvcloud(TemplateBase):
         conf_manager = j.tools.configmanager
         conf_manager.delete(location="j.clients.openvcloud", instance=self.data['name'])
         self.state.delete('actions', 'install')
+        resolver.invalidate(self.name)
+        ovc_pool.invalidate(self.data['name'])
+        snapshot.snapshots.discard(self.data['name'])
+
+    def _snapshot_path(self, path):
+        path = path or self.data['snapshot']
+        if not path:
+            raise ValueError('path of the snapshot file is required')
+        return path
+
+    def inventory_snapshot(self, path=None):
+        """
+        Write accounts, cloudspaces, VMs and disks of the OVC to a snapshot file
+
+        :param path: path of the snapshot file, `snapshot` of the service data by default
+        :return: path, format and number of entities per kind
+        """
+        self.state.check('actions', 'install', 'ok')
+        path = self._snapshot_path(path)
+
+        inventory = snapshot.pull(ovc_pool.get(self.data['name']))
+        result = {
+            'path': path,
+            'format': snapshot.dump(inventory, path),
+        }
+        for kind in ['accounts', 'cloudspaces', 'machines', 'disks']:
+            result[kind] = len(inventory[kind])
+        return result
+
+    def inventory_import(self, path=None):
+        """
+        Load a snapshot file, services installing existing entities of the OVC look up their ids in it
+
+        :param path: path of the snapshot file, `snapshot` of the service data by default
+        """
+        self.state.check('actions', 'install', 'ok')
+        path = self._snapshot_path(path)
+        loaded = snapshot.snapshots.load(self.data['name'], path, self.data['snapshotMaxAge'])
+        if loaded.expired:
+            snapshot.snapshots.discard(self.data['name'])
+            raise ValueError('snapshot "%s" is older than %s seconds' % (path, self.data['snapshotMaxAge']))
+
+    def memory_usage(self):
+        """
+        Return number of services of the robot and approximate bytes of data and cached remote entities they hold, per template
+        """
+        return usage(service_collection.list_services())
 
     def update(self, address=None, token=None, port=None):
         """
@@ -72,9 +165,17 @@ class Openvcloud(TemplateBase):
         self.state.check('actions', 'install', 'ok')
         kwargs = locals()
 
+        updated = False
         for key in ['address', 'token', 'port']:
             value = kwargs[key]
-            if value is not None:
+            if value is not None and value != self.data[key]:
                 self.data[key] = value
+                updated = True
 
         self._configure()
+        self._limit_rate()
+        resolver.invalidate(self.name)
+
+        if updated:
+            # clients of the old connection settings can't be reused
+            ovc_pool.invalidate(self.data['name'])
@@ -6,6 +6,10 @@ from js9 import j
 
 from zerorobot import config, template_collection
 from zerorobot.template.state import StateCheckError
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.ratelimit import scheduler
+from ovc_utils.snapshot import snapshots
+from ovc_utils.simulator import Simulator
 
 
 class TestOpenvcloud(TestCase):
@@ -70,6 +74,17 @@ class TestOpenvcloud(TestCase):
         instance = self.type(name, None, data)
         instance.validate()
 
+    def test_rate_limit(self):
+        data = {
+            'name': 'be-gen-demo',
+            'address': 'some.address.com',
+            'apiRate': 5,
+            'apiBurst': 2,
+        }
+        self.type('test', None, data)
+        self.assertEqual(scheduler.limit('some.address.com'), (5, 2))
+        scheduler.clear()
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_install(self, client):
         data = {
@@ -119,6 +134,57 @@ class TestOpenvcloud(TestCase):
 
         client.get.return_value.config.save.assert_called_once_with()
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_update_invalidates_client(self, client):
+        data = {
+            'name' : 'be-gen-demo',
+            'address': 'some.address.com',
+            'token': 'some-token',
+            'location': 'abc',
+        }
+        instance = self.type('test', None, data)
+        instance.state.set('actions', 'install', 'ok')
+
+        with mock.patch.object(ovc_pool, 'invalidate') as invalidate:
+            # same settings, client is kept
+            instance.update(address=data['address'])
+            invalidate.assert_not_called()
+
+            instance.update(token='new-token')
+            invalidate.assert_called_once_with(data['name'])
+
+    def test_inventory_snapshot(self):
+        sim = Simulator()
+        client = sim.client()
+        client.account_get('account').space_get('vdc').machine_create('vm')
+        path = os.path.join(config.DATA_DIR, 'test_inventory.snapshot')
+
+        instance = self.type('test', None, {'name': 'be-gen-demo'})
+        instance.state.set('actions', 'install', 'ok')
+        with self.assertRaisesRegex(ValueError, 'path of the snapshot file is required'):
+            instance.inventory_snapshot()
+
+        with mock.patch.object(ovc_pool, 'get', return_value=client):
+            result = instance.inventory_snapshot(path)
+
+        self.assertEqual(result['path'], path)
+        self.assertEqual((result['accounts'], result['cloudspaces'], result['machines'], result['disks']),
+                         (1, 1, 1, 1))
+
+        instance.inventory_import(path)
+        self.assertIsNotNone(snapshots.get('be-gen-demo').cloudspace('account', 'vdc'))
+        snapshots.clear()
+
+    def test_corrupt_snapshot(self):
+        path = os.path.join(config.DATA_DIR, 'test_corrupt.snapshot')
+        with open(path, 'w') as snapshot:
+            snapshot.write('{"version": 0}')
+
+        # the service loads without the snapshot
+        with self.assertLogs(level='WARNING'):
+            self.type('test', None, {'name': 'be-gen-demo', 'snapshot': path})
+        self.assertIsNone(snapshots.get('be-gen-demo'))
+
     @mock.patch.object(j.tools, '_configmanager')
     def test_uninstall(self, conf_manager):
         data = {'name' : 'be-gen-demo'}
@@ -1,5 +1,6 @@
 from js9 import j
 import os
+import time
 
 from unittest import TestCase
 from unittest import mock
@@ -8,10 +9,19 @@ from unittest.mock import MagicMock, patch
 from zerorobot import config, template_collection
 from zerorobot.template.state import StateCheckError
 from zerorobot.service_collection import ServiceNotFoundError
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.monitor import listings
+from ovc_utils.snapshot import snapshots, Snapshot
+from ovc_utils import waiter
 
 class TestVDC(TestCase):
     def setUp(self):
         config.DATA_DIR = '/tmp'
+        resolver.clear()
+        ovc_pool.clear()
+        listings.clear()
+        snapshots.clear()
         self.type = template_collection._load_template(
             "https://github.com/openvcloud/0-templates",
             os.path.dirname(__file__)
@@ -71,6 +81,28 @@ class TestVDC(TestCase):
         proxy.name = name
         return proxy
 
+    def set_up_child_proxy_mock(self, name, info, expected_action, expected_args=None, result=None, error=None):
+        """
+        Setup a mock for a proxy of a node or disk service of the vdc
+
+        get_info returns @info, @expected_action returns @result or fails with @error
+        """
+        proxy = MagicMock()
+        proxy.name = name
+
+        def schedule_action(action, args=None):
+            task = MagicMock()
+            if action == 'get_info':
+                task.wait.return_value.result = info
+            else:
+                self.assertEqual((action, args), (expected_action, expected_args))
+                if error:
+                    task.wait.side_effect = RuntimeError(error)
+                task.wait.return_value.result = result
+            return task
+        proxy.schedule_action.side_effect = schedule_action
+        return proxy
+
     def get_service(self, template_uid, name):
         if template_uid == self.type.OVC_TEMPLATE:
             proxy = self.set_up_proxy_mock(result=self.ovc['info'], name=name)
@@ -172,6 +204,117 @@ class TestVDC(TestCase):
             })
             space.save.assert_called_once_with()
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_get_info_cached_users(self, ovc):
+        """ Test get_info serves users from cache, get_users refreshes them """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            info = instance.get_info()
+            instance.get_info()
+            instance.space.refresh.assert_called_once_with()
+
+            instance.get_users()
+            self.assertEqual(instance.space.refresh.call_count, 2)
+
+        self.assertEqual(info['users'], [self.user['info']])
+
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_monitor(self, ovc):
+        """ Test detecting changes of the cloudspace made in the portal """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+        instance.data['cloudspaceID'] = 100
+
+        space = {
+            'id': 100,
+            'status': 'DISABLED',
+            'acl': [{'userGroupId': self.user['info']['name'], 'right': 'R'}],
+            'maxMemoryCapacity': 8,
+        }
+        ovc.get.return_value = self.ovc_mock(self.ovc['info']['name'])
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance.ovc.api.cloudapi.cloudspaces.list.return_value = [space]
+            result = instance.monitor()
+            self.assertTrue(result['changed'])
+            self.assertEqual(result['updated'], {'disabled': True, 'users': [self.user['info']]})
+            self.assertEqual(result['drift'], {'maxMemoryCapacity': {'expected': -1, 'actual': 8}})
+            self.assertEqual(instance.get_info()['users'], [self.user['info']])
+
+            # the listing is shared and the cloudspace didn't change
+            self.assertFalse(instance.monitor()['changed'])
+            instance.ovc.api.cloudapi.cloudspaces.list.assert_called_once_with()
+
+    def test_install_converged(self):
+        """
+        Test install of an installed vdc without changes
+        """
+        instance = self.type('test', None, {'account': 'account-service-name', 'name': 'test'})
+        instance._ovc = MagicMock()
+
+        with mock.patch.object(instance, '_account') as account:
+            space = account.space_get.return_value
+            space.model = {'id': 'space-id', 'acl': [], 'status': 'DEPLOYED'}
+            instance.install()
+            instance.install()
+            account.space_get.assert_called_once()
+
+            instance.data['maxCPUCapacity'] = 4
+            instance.install()
+            self.assertEqual(account.space_get.call_count, 2)
+            self.assertEqual(space.model['maxCPUCapacity'], 4)
+
+    def test_install_from_snapshot(self):
+        """
+        Test install of an existing vdc found in the inventory snapshot
+        """
+        snapshots.set(self.ovc['info']['name'], Snapshot({
+            'version': 1,
+            'created': int(time.time()),
+            'accounts': [{'id': 1, 'name': self.acc['info']['name'], 'acl': []}],
+            'cloudspaces': [{'id': 2, 'accountId': 1, 'name': 'test', 'location': 'be-gen-demo',
+                             'acl': [{'userGroupId': 'user@provider', 'right': 'R'}]}],
+            'machines': [],
+            'disks': [],
+        }))
+        instance = self.type('test', None, {'account': self.acc['service'], 'name': 'test', 'create': False})
+
+        with mock.patch.object(instance, '_account') as account, \
+                patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance.install()
+            account.space_get.assert_not_called()
+
+        self.assertEqual(instance.data['cloudspaceID'], 2)
+        self.assertEqual(instance.data['users'], [{'name': 'user@provider', 'accesstype': 'R'}])
+        instance.state.check('actions', 'install', 'ok')
+
+    def test_install_waits_for_deployment(self):
+        name = 'test'
+        data = {
+            'account': 'account-service-name',
+            'name': name
+        }
+        instance = self.type(name, None, data)
+        instance._ovc = MagicMock()
+
+        with mock.patch.object(instance, '_account') as account, \
+                mock.patch.object(waiter, 'cloudspace_status') as cloudspace_status:
+            space = account.space_get.return_value
+            space.model = {
+                'id': 'space-id',
+                'acl': [],
+                'status': 'DEPLOYING'
+            }
+            instance.install()
+
+        cloudspace_status.assert_called_once_with(instance._ovc, 'space-id', 'DEPLOYED', timeout=60)
+        instance.state.check('actions', 'install', 'ok')
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_uninstall_success(self, ovc):
         """
@@ -244,6 +387,97 @@ class TestVDC(TestCase):
                 'maxCPUCapacity': 4
             })
 
+    def test_update_unchanged(self):
+        """
+        Test updating vdc limits to the values of the cloudspace
+        """
+        instance = self.type('test', None, {})
+        instance.state.set('actions', 'install', 'ok')
+
+        with mock.patch.object(instance, '_account') as account:
+            space = account.space_get.return_value
+            space.model = {'maxMemoryCapacity': 1, 'maxCPUCapacity': 4}
+
+            self.assertEqual(instance.update(), {})
+            self.assertEqual(instance.update(maxMemoryCapacity=1), {})
+            self.assertEqual(instance.update(maxMemoryCapacity=1, maxCPUCapacity=2), {'maxCPUCapacity': 2})
+
+            space.save.assert_called_once_with()
+            self.assertEqual(instance.data['maxCPUCapacity'], 2)
+            self.assertEqual(instance.data['maxVDiskCapacity'], -1)
+
+    def test_disks_limit_io(self):
+        """
+        Test applying IO limits to the disks of the vdc
+        """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+        policy = {'totalIopsSec': 500}
+
+        def disk_proxy(name, vdc, disk_type, changed=True, error=None):
+            info = {'vdc': vdc, 'diskType': disk_type, 'deviceName': name}
+            return self.set_up_child_proxy_mock(name, info, 'update', policy, result=changed, error=error)
+
+        proxies = {
+            'disk1': disk_proxy('disk1', 'test', 'D'),
+            'disk2': disk_proxy('disk2', 'test', 'D', changed=False),
+            'disk3': disk_proxy('disk3', 'test', 'D', error='disk is detached'),
+            'boot': disk_proxy('boot', 'test', 'B'),
+            'other': disk_proxy('other', 'other_vdc', 'D'),
+        }
+
+        with patch.object(instance, 'api') as api:
+            api.services.find.return_value = list(proxies.values())
+            api.services.get.side_effect = lambda template_uid, name: proxies[name]
+            result = instance.disks_limit_io(policy, selector={'type': 'D'})
+
+            self.assertEqual(result, {
+                'disk1': {'state': 'ok', 'changed': True},
+                'disk2': {'state': 'ok', 'changed': False},
+                'disk3': {'state': 'error', 'error': 'disk is detached'},
+            })
+
+            result = instance.disks_limit_io(policy, selector={'services': ['disk1'], 'name': 'disk*'})
+            self.assertEqual(list(result), ['disk1'])
+
+            with self.assertRaisesRegex(RuntimeError, 'cannot be set at the same time'):
+                instance.disks_limit_io({'totalIopsSec': 500, 'readIopsSec': 100})
+
+    def test_nodes_power(self):
+        """
+        Test running a power action on the nodes of the vdc
+        """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+
+        def node_proxy(name, vdc, error=None):
+            return self.set_up_child_proxy_mock(name, {'vdc': vdc, 'name': name}, 'stop', error=error)
+
+        proxies = {
+            'vm1': node_proxy('vm1', 'test'),
+            'vm2': node_proxy('vm2', 'test', error='VM is locked'),
+            'db1': node_proxy('db1', 'test'),
+            'other': node_proxy('other', 'other_vdc'),
+        }
+
+        def get_service(template_uid, name):
+            if template_uid == self.type.NODE_TEMPLATE:
+                return proxies[name]
+            return self.get_service(template_uid, name)
+
+        with patch.object(instance, 'api') as api:
+            api.services.find.return_value = list(proxies.values())
+            api.services.get.side_effect = get_service
+            result = instance.nodes_power('stop', selector={'name': 'vm*'})
+
+            self.assertEqual(result, {
+                'vm1': {'state': 'ok'},
+                'vm2': {'state': 'error', 'error': 'VM is locked'},
+            })
+
+            with self.assertRaisesRegex(ValueError, 'power action must be one of'):
+                instance.nodes_power('delete')
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_portforward_create_require_arguments(self, ovc):
         """ Test call without arguments """
@@ -279,6 +513,31 @@ class TestVDC(TestCase):
                 machineId=machine_id,
             )
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_portforward_create_conflict(self, ovc):
+        """
+        Test creating portforward on a public port used by another VM
+        """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance._space = MagicMock(ipaddr_pub='10.00.00.00', id=100)
+            portforwarding = instance.ovc.api.cloudapi.portforwarding
+            portforwarding.list.return_value = [
+                {'publicPort': '22', 'localPort': '22', 'protocol': 'tcp', 'machineId': 1, 'id': 1}]
+
+            with self.assertRaisesRegex(RuntimeError, 'public port 22/tcp is already forwarded'):
+                instance.portforward_create(node_service='test_node', ports=[{'source': 22, 'destination': 22}])
+
+            # the listing is reused
+            with self.assertRaises(RuntimeError):
+                instance.portforward_create(node_service='test_node', ports=[{'source': 22, 'destination': 22}])
+
+        portforwarding.create.assert_not_called()
+        self.assertEqual(portforwarding.list.call_count, 1)
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_portforward_delete(self, ovc):
         """
@@ -298,6 +557,8 @@ class TestVDC(TestCase):
         list_of_ports = [{
             'publicPort': port['source'],
             'localPort': port['destination'],
+            'protocol': 'tcp',
+            'machineId': machine_id,
             'id': port_id
         }]
 
@@ -317,6 +578,49 @@ class TestVDC(TestCase):
                 machineId=machine_id,
             )
 
+    @mock.patch.object(j.clients, '_openvcloud')
+    def test_portforwards_set(self, ovc):
+        """
+        Test reconciling portforwards of a node
+        """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+
+        machine_id = self.node['info']['id']
+        space_id = 100
+        ipaddr_pub = '10.00.00.00'
+        existent = [
+            {'publicPort': '22', 'localPort': '22', 'protocol': 'tcp', 'machineId': machine_id, 'id': 1},
+            {'publicPort': '80', 'localPort': '8080', 'protocol': 'tcp', 'machineId': machine_id, 'id': 2},
+            {'publicPort': '443', 'localPort': '443', 'protocol': 'tcp', 'machineId': 2, 'id': 3},
+        ]
+        ports = [
+            {'source': 22, 'destination': 22},
+            {'source': 80, 'destination': 80},
+            {'source': 53, 'destination': 53, 'protocol': 'udp'},
+        ]
+
+        with patch.object(instance, 'api') as api:
+            api.services.get.side_effect = self.get_service
+            instance._space = MagicMock(ipaddr_pub=ipaddr_pub, id=space_id)
+            portforwarding = instance.ovc.api.cloudapi.portforwarding
+            portforwarding.list.return_value = existent
+            result = instance.portforwards_set(node_service='test_node', ports=ports)
+
+        portforwarding.list.assert_called_once_with(cloudspaceId=space_id)
+        portforwarding.delete.assert_called_once_with(
+            id=2, cloudspaceId=space_id, protocol='tcp', localPort='8080',
+            publicPort='80', publicIp=ipaddr_pub, machineId=machine_id)
+        self.assertEqual(portforwarding.create.call_count, 2)
+        portforwarding.create.assert_any_call(
+            cloudspaceId=space_id, protocol='udp', localPort='53',
+            publicPort='53', publicIp=ipaddr_pub, machineId=machine_id)
+        self.assertEqual(result, {
+            'created': [{'source': '53', 'destination': '53', 'protocol': 'udp'},
+                        {'source': '80', 'destination': '80', 'protocol': 'tcp'}],
+            'deleted': [{'source': '80', 'destination': '8080', 'protocol': 'tcp'}],
+        })
+
     @mock.patch.object(j.clients, '_openvcloud')
     def test_user_authorize_success(self, ovc):
         """
@@ -459,3 +763,33 @@ class TestVDC(TestCase):
         instance.space.unauthorize_user.assert_called_once_with(
             username=user['info']['name'])
 
+
+    def test_nodes_create(self):
+        """
+        Test creating a batch of nodes
+        """
+        instance = self.type('test', None, self.vdc['info'])
+        instance.state.set('actions', 'install', 'ok')
+        nodes = [
+            {'name': 'vm1', 'sshKey': 'key'},
+            {'name': 'vm2', 'sshKey': 'key', 'service': 'node2'},
+        ]
+
+        def find_or_create(template_uid, service_name, data):
+            self.assertEqual(template_uid, self.type.NODE_TEMPLATE)
+            self.assertEqual(data['vdc'], instance.name)
+            self.assertNotIn('service', data)
+            proxy = self.set_up_proxy_mock(name=service_name)
+            if service_name == 'node2':
+                proxy.schedule_action().wait.side_effect = RuntimeError('no capacity')
+            return proxy
+
+        with patch.object(instance, 'api') as api:
+            api.services.find_or_create.side_effect = find_or_create
+            result = instance.nodes_create(nodes)
+
+        self.assertEqual(result, {
+            'vm1': {'state': 'ok'},
+            'node2': {'state': 'error', 'error': 'no capacity'},
+        })
+        self.assertEqual(api.services.find_or_create.call_count, 2)
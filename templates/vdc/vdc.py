@@ -1,9 +1,27 @@
-import time
-from js9 import j
+import os
+import sys
+from fnmatch import fnmatch
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
-from zerorobot.template.decorator import retry
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from ovc_utils.resolver import resolver, fetch_info, VDC_TEMPLATE
+from ovc_utils.retry import retry
+from ovc_utils.cache import TTLValue
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.concurrency import bounded_map, parallel, report
+from ovc_utils.inventory import PortforwardIndex
+from ovc_utils.monitor import Monitor, listings, users as acl_users
+from ovc_utils.converge import converged, record, save_changes
+from ovc_utils.snapshot import snapshots
+from ovc_utils import waiter, iolimits
+from ovc_utils.metrics import instrument
+
+@instrument
 class Vdc(TemplateBase):
 
     version = '0.0.1'
@@ -15,8 +33,24 @@ class Vdc(TemplateBase):
     NODE_TEMPLATE = 'github.com/openvcloud/0-templates/node/0.0.1'
     DISK_TEMPLATE = 'github.com/openvcloud/0-templates/disk/0.0.1'
 
+    # seconds the list of authorized users is served from cache by get_info
+    USERS_TTL = 60
+    # seconds the port forwards of the cloudspace are used before listing them again
+    PORTFORWARDS_TTL = 60
+
+    # actions of the node template run by nodes_power
+    POWER_ACTIONS = ('start', 'stop', 'restart', 'pause', 'resume', 'reset')
+
+    LIMITS = ('maxMemoryCapacity', 'maxCPUCapacity', 'maxVDiskCapacity', 'maxNumPublicIP',
+              'maxNetworkPeerTransfer')
+    # data applied by install, install is skipped if it didn't change since
+    INSTALL_KEYS = ('name', 'account', 'create', 'externalNetworkID') + LIMITS
+
     def __init__(self, name, guid=None, data=None):
         super().__init__(name=name, guid=guid, data=data)
+        self._users = TTLValue(self.USERS_TTL)
+        self._portforwards = PortforwardIndex(self.PORTFORWARDS_TTL)
+        self._monitor = Monitor()
 
         self._ovc = None
         self._account = None
@@ -43,7 +77,7 @@ class Vdc(TemplateBase):
         return {
             'name' : self.data['name'],
             'account' : self.data['account'],
-            'users' : self._get_users(),
+            'users' : self.get_users(refresh=False),
         }
 
     @property
@@ -51,32 +85,19 @@ class Vdc(TemplateBase):
         """
         An ovc connection instance
         """
-        if not self._ovc:
-            # get name of ovc service
-            proxy = self.api.services.get(
-                template_uid=self.ACCOUNT_TEMPLATE, name=self.data['account'])
-            acc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-
-            # get name of ovc connection instance
-            proxy = self.api.services.get(
-                template_uid=self.OVC_TEMPLATE, name=acc_info['openvcloud'])
-            ovc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-            self._ovc = j.clients.openvcloud.get(ovc_info['name'])
-
-        return self._ovc
+        config = resolver.account(self.api, self.data['account'])
+        return ovc_pool.connect(self, config['ovc'], ('_account', '_space'))
 
     @property
     def account(self):
         """ An account getter """
 
+        ovc = self.ovc
         if self._account is not None:
             return self._account
 
-        # get actual account name
-        proxy = self.api.services.get(
-            template_uid=self.ACCOUNT_TEMPLATE, name=self.data['account'])
-        acc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        self._account = self.ovc.account_get(acc_info['name'], create=False)
+        config = resolver.account(self.api, self.data['account'])
+        self._account = ovc.account_get(config['account'], create=False)
 
         return self._account
 
@@ -84,7 +105,7 @@ class Vdc(TemplateBase):
     def space(self):
         """ A space getter """
 
-        if self._space:
+        if ovc_pool.cached(self, '_space'):
             return self._space
 
         self._space = self.account.space_get(name=self.data['name'], create=False)
@@ -100,25 +121,69 @@ class Vdc(TemplateBase):
         for user in self.space.model['acl']:
             users.append({'name' : user['userGroupId'], 'accesstype' : user['right']})
         self.data['users'] = users
-        return self.data['users']
+        self._users.set(users)
+        return users
+
+    def get_users(self, refresh=True):
+        """
+        Return users authorized on the vdc
+
+        :param refresh: if False, the list fetched less than USERS_TTL seconds ago is returned
+        """
+        self.state.check('actions', 'install', 'ok')
+        users = self._users.get()
+        if refresh or users is None:
+            users = self._get_users()
+        return users
+
+    def monitor(self):
+        """
+        Detect changes of the cloudspace made outside of this service.
+        Users and the disabled flag are updated in the service data, changed limits are reported as drift.
+        If the cloudspace doesn't exist anymore, the service is not installed anymore.
+        """
+        self.state.check('actions', 'install', 'ok')
 
-    @retry((BaseException),
-            tries=5, delay=3, backoff=2, logger=None)
+        space = listings.cloudspace(self.ovc, self.data['cloudspaceID'])
+        if space is None:
+            self._monitor.reset()
+            self._space = None
+            self.state.delete('actions', 'install')
+            return {'exists': False}
+
+        def fields(space):
+            mirrored = {'disabled': space['status'] == 'DISABLED'}
+            if 'acl' in space:
+                mirrored['users'] = acl_users(space['acl'])
+            desired = {key: space[key] for key in self.LIMITS if key in space}
+            return mirrored, desired
+
+        result = self._monitor.observe(self.data, space, fields)
+        if 'users' in result['updated']:
+            self._users.set(self.data['users'])
+        result['exists'] = True
+        return result
+
+    @retry(tries=5, delay=3, backoff=2)
     def install(self):
         """
         Install vdc. Will be created if doesn't exist
+        If the vdc is installed and its data didn't change since, nothing is done.
         """
 
         try:
             self.state.check('actions', 'install', 'ok')
-            return
+            if converged(self.data, self.INSTALL_KEYS):
+                return
         except StateCheckError:
             pass
 
         if not self.data['create']:
-            space = self.space
-            self._get_users(refresh=False)
-            self.data['cloudspaceID'] = space.model['id']
+            if not self._adopt():
+                space = self.space
+                self._get_users(refresh=False)
+                self.data['cloudspaceID'] = space.model['id']
+            record(self.data, self.INSTALL_KEYS)
             self.state.set('actions', 'install', 'ok')
             return
 
@@ -144,25 +209,34 @@ class Vdc(TemplateBase):
         self._get_users(refresh=False)
 
         # update capacity incase cloudspace already existed update it
-        space.model['maxMemoryCapacity'] = self.data.get('maxMemoryCapacity', -1)
-        space.model['maxVDiskCapacity'] = self.data.get('maxVDiskCapacity', -1)
-        space.model['maxNumPublicIP'] = self.data.get('maxNumPublicIP', -1)
-        space.model['maxCPUCapacity'] = self.data.get('maxCPUCapacity', -1)
-        space.model['maxNetworkPeerTransfer'] = self.data.get('maxNetworkPeerTransfer', -1)
-        space.save()
-
-        status = space.model['status']
-        timeout_limit = time.time() + 60
-        while time.time() < timeout_limit:
-            if status == 'DEPLOYED':
-                break
-            time.sleep(5)
-            status = self.ovc.api.cloudapi.cloudspaces.get(cloudspaceId=self.data['cloudspaceID'])['status']
-        else:
-            raise j.exceptions.Timeout("VDC not yet deployed")
+        save_changes(space, {key: self.data.get(key, -1) for key in self.LIMITS})
+
+        if space.model['status'] != 'DEPLOYED':
+            waiter.cloudspace_status(self.ovc, self.data['cloudspaceID'], 'DEPLOYED', timeout=60)
 
+        record(self.data, self.INSTALL_KEYS)
         self.state.set('actions', 'install', 'ok')
 
+    def _adopt(self):
+        """
+        Fill id and users of the cloudspace in from the inventory snapshot of the ovc
+
+        :return: False if there is no snapshot or the cloudspace isn't in it
+        """
+        if not snapshots:
+            return False
+
+        config = resolver.account(self.api, self.data['account'])
+        snapshot = snapshots.get(config['ovc'])
+        cloudspace = snapshot.cloudspace(config['account'], self.data['name']) if snapshot else None
+        if not cloudspace:
+            return False
+
+        self.data['cloudspaceID'] = cloudspace['id']
+        self.data['users'] = acl_users(cloudspace['acl'])
+        self._users.set(self.data['users'])
+        return True
+
     def uninstall(self):
         """
         Delete VDC
@@ -176,7 +250,9 @@ class Vdc(TemplateBase):
                 self.space.delete()
                 break
 
+        self._portforwards.clear()
         self.state.delete('actions', 'install')
+        resolver.invalidate(self.name)
 
     def enable(self):
         """ Enable VDC """
@@ -213,6 +289,184 @@ class Vdc(TemplateBase):
         space.disable('The space should be disabled.')
         self.data['disabled'] = True
 
+    def _seed_resolver(self):
+        """
+        Cache the info of this vdc for the nodes and disks its actions wait for
+
+        They resolve their vdc with get_info on this service, which would only run
+        once the action waiting for them is done.
+        """
+        resolver.seed(VDC_TEMPLATE, self.name, {'name': self.data['name'], 'account': self.data['account']})
+
+    def nodes_create(self, nodes, concurrency=10):
+        """
+        Create and install a batch of nodes in the vdc
+
+        :param nodes: list of node service data, see node template schema.
+                      Key `service` sets the name of the node service,
+                      defaults to the name of the VM
+        :param concurrency: number of nodes installed at the same time
+        :return: dict of node service name -> {'state': 'ok'} or {'state': 'error', 'error': message}
+        """
+        self.state.check('actions', 'install', 'ok')
+        self._seed_resolver()
+
+        def install(node):
+            data = dict(node)
+            service_name = data.pop('service', None) or data['name']
+            data['vdc'] = self.name
+            proxy = self.api.services.find_or_create(
+                template_uid=self.NODE_TEMPLATE,
+                service_name=service_name,
+                data=data,
+            )
+            proxy.schedule_action(action='install').wait(die=True)
+
+        names = [node.get('service') or node.get('name') for node in nodes]
+        return report(names, bounded_map(install, nodes, concurrency))
+
+    def _select(self, template_uid, selector, concurrency, match):
+        """
+        Return names of the installed services of @template_uid of this vdc
+        listed in `services` of @selector, or all of them, for which @match(info) is true
+        """
+        if selector.get('services'):
+            proxies = [self.api.services.get(template_uid=template_uid, name=name)
+                       for name in selector['services']]
+        else:
+            proxies = self.api.services.find(template_uid=template_uid)
+
+        infos = bounded_map(
+            lambda proxy: proxy.schedule_action(action='get_info').wait(die=True).result,
+            proxies, concurrency)
+
+        # services that are not installed are skipped
+        return [proxy.name for proxy, (info, err) in zip(proxies, infos)
+                if err is None and info['vdc'] == self.name and match(info)]
+
+    def _select_disks(self, selector, concurrency):
+        """
+        Return names of the installed disk services of this vdc matching @selector
+        """
+        def match(info):
+            if selector.get('type') and info['diskType'] != selector['type']:
+                return False
+            return fnmatch(info['deviceName'], selector.get('name') or '*')
+
+        return self._select(self.DISK_TEMPLATE, selector, concurrency, match)
+
+    def _select_nodes(self, selector, concurrency):
+        """
+        Return names of the installed node services of this vdc matching @selector
+        """
+        return self._select(self.NODE_TEMPLATE, selector, concurrency,
+                            lambda info: fnmatch(info['name'], selector.get('name') or '*'))
+
+    def disks_limit_io(self, policy, selector=None, concurrency=10):
+        """
+        Apply IO limits to the disks of the vdc
+
+        :param policy: IO limits to set, named as in the disk schema, e.g. {'totalIopsSec': 500}
+        :param selector: dict selecting the disks, all installed disk services of the vdc by default:
+                         `services`: list of disk service names,
+                         `type`: disk type B or D,
+                         `name`: shell-style pattern of the disk name
+        :param concurrency: number of disks updated at the same time
+        :return: dict of disk service name -> {'state': 'ok', 'changed': bool}
+                 or {'state': 'error', 'error': message}.
+                 Disks already at the given limits are not changed.
+        """
+        self.state.check('actions', 'install', 'ok')
+        iolimits.validate(policy)
+        self._seed_resolver()
+
+        disks = self._select_disks(selector or {}, concurrency)
+
+        def limit_io(name):
+            proxy = self.api.services.get(template_uid=self.DISK_TEMPLATE, name=name)
+            return proxy.schedule_action(action='update', args=policy).wait(die=True).result
+
+        return report(disks, bounded_map(limit_io, disks, concurrency), changed=True)
+
+    def nodes_power(self, action, selector=None, concurrency=10):
+        """
+        Run power @action on the nodes of the vdc
+
+        :param action: one of start, stop, restart, pause, resume or reset
+        :param selector: dict selecting the nodes, all installed node services of the vdc by default:
+                         `services`: list of node service names,
+                         `name`: shell-style pattern of the VM name
+        :param concurrency: number of nodes running the action at the same time.
+                            Their calls to the ovc stay within the request budget of the
+                            robot (see `ratelimit.scheduler`) and are sent before those of bulk actions
+        :return: dict of node service name -> {'state': 'ok'} or {'state': 'error', 'error': message}
+        """
+        self.state.check('actions', 'install', 'ok')
+        if action not in self.POWER_ACTIONS:
+            raise ValueError('power action must be one of %s' % ', '.join(self.POWER_ACTIONS))
+        self._seed_resolver()
+
+        nodes = self._select_nodes(selector or {}, concurrency)
+
+        def power(name):
+            proxy = self.api.services.get(template_uid=self.NODE_TEMPLATE, name=name)
+            proxy.schedule_action(action=action).wait(die=True)
+
+        return report(nodes, bounded_map(power, nodes, concurrency))
+
+    def _node_machine_id(self, node_service):
+        """
+        Return id of the VM managed by @node_service,
+        port forwards of the cloudspace are loaded meanwhile
+        """
+        node_info, _ = parallel(
+            lambda: fetch_info(self.api, self.NODE_TEMPLATE, node_service),
+            lambda: self._portforwards.forwards(self.ovc, self.space.id),
+        )
+        return node_info['id']
+
+    def _check_portforwards(self, machine_id, forwards):
+        """
+        Raise if a public port of @forwards is already forwarded elsewhere in the cloudspace
+
+        :param forwards: list of (public port, local port, protocol)
+        """
+        for public_port, local_port, protocol in forwards:
+            conflict = self._portforwards.conflict(
+                self.ovc, self.space.id, public_port, protocol, machine_id, local_port)
+            if conflict is not None:
+                raise RuntimeError('public port {port}/{protocol} is already forwarded to port {local} of VM {vm}'.format(
+                    port=public_port, protocol=protocol, local=conflict['localPort'], vm=conflict['machineId']))
+
+    def _portforward_create(self, machine_id, public_port, local_port, protocol):
+        forward_id = self.ovc.api.cloudapi.portforwarding.create(
+            cloudspaceId=self.space.id,
+            protocol=protocol,
+            localPort=local_port,
+            publicPort=public_port,
+            publicIp=self.space.ipaddr_pub,
+            machineId=machine_id,
+        )
+        self._portforwards.add({
+            'id': forward_id,
+            'publicPort': public_port,
+            'localPort': local_port,
+            'protocol': protocol,
+            'machineId': machine_id,
+        })
+
+    def _portforward_delete(self, forward):
+        self.ovc.api.cloudapi.portforwarding.delete(
+            id=forward['id'],
+            cloudspaceId=self.space.id,
+            protocol=forward['protocol'],
+            localPort=forward['localPort'],
+            publicPort=forward['publicPort'],
+            publicIp=self.space.ipaddr_pub,
+            machineId=forward['machineId'],
+        )
+        self._portforwards.remove(forward['publicPort'], forward['protocol'])
+
     def portforward_create(self, node_service, ports, protocol='tcp'):
         """
         Create port forwards
@@ -222,19 +476,17 @@ class Vdc(TemplateBase):
         """
         self.state.check('actions', 'install', 'ok')
 
-        proxy = self.api.services.get(
-            template_uid=self.NODE_TEMPLATE, name=node_service)
-        node_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        machine_id = self._node_machine_id(node_service)
+        forwards = [(port['source'], port['destination'], protocol) for port in ports]
+        self._check_portforwards(machine_id, forwards)
+
+        existent = self._portforwards.forwards(self.ovc, self.space.id)
         # add portforwards
-        for port in ports:
-            self.ovc.api.cloudapi.portforwarding.create(
-                cloudspaceId=self.space.id,
-                protocol=protocol,
-                localPort=port['destination'],
-                publicPort=port['source'],
-                publicIp=self.space.ipaddr_pub,
-                machineId=node_info['id'],
-            )
+        for public_port, local_port, forward_protocol in forwards:
+            if (str(public_port), forward_protocol) in existent:
+                # already forwarded to this destination
+                continue
+            self._portforward_create(machine_id, public_port, local_port, forward_protocol)
 
     def portforward_delete(self, node_service, ports, protocol='tcp'):
         """
@@ -246,27 +498,55 @@ class Vdc(TemplateBase):
         """
         self.state.check('actions', 'install', 'ok')
 
-        proxy = self.api.services.get(
-            template_uid=self.NODE_TEMPLATE, name=node_service)
-        node_info = proxy.schedule_action(action='get_info').wait(die=True).result
-        machine_id = node_info['id']
-        existent_ports = [(port['publicPort'], port['localPort'], port['id'])
-                            for port in self.ovc.api.cloudapi.portforwarding.list(
-                                            cloudspaceId=self.space.id, machineId=machine_id,
-                                                )]
+        machine_id = self._node_machine_id(node_service)
+        existent = self._portforwards.forwards(self.ovc, self.space.id)
         # remove portfrowards
-        for publicPort, localPort, id in existent_ports:
-            for port in ports:
-                if str(port['source']) == publicPort and str(port['destination']) == localPort:
-                    self.ovc.api.cloudapi.portforwarding.delete(
-                        id=id,
-                        cloudspaceId=self.space.id,
-                        protocol=protocol,
-                        localPort=port['destination'],
-                        publicPort=port['source'],
-                        publicIp=self.space.ipaddr_pub,
-                        machineId=machine_id,
-                    )
+        for port in ports:
+            forward = existent.get((str(port['source']), protocol))
+            if (forward is not None and forward['machineId'] == machine_id
+                    and forward['localPort'] == str(port['destination'])):
+                self._portforward_delete(forward)
+
+    def portforwards_set(self, node_service, ports, protocol='tcp', concurrency=10):
+        """
+        Make the port forwards of a node match @ports.
+        Forwards of the node that are not in @ports are deleted, missing ones are created.
+        Calling the action again with the same @ports doesn't change anything.
+
+        :param node_service: name of the service managing the vm
+        :param ports: list of portforwards given in form {'source': str, 'destination': str},
+                      optionally with a `protocol`
+        :param protocol: protocol of the ports that don't specify one
+        :param concurrency: number of port forwards created or deleted at the same time
+        :return: dict with lists of the 'created' and 'deleted' port forwards
+        """
+        self.state.check('actions', 'install', 'ok')
+
+        machine_id = self._node_machine_id(node_service)
+        wanted = {(str(port['source']), str(port['destination']), port.get('protocol', protocol))
+                  for port in ports}
+        existent = {(forward['publicPort'], forward['localPort'], forward['protocol']): forward
+                    for forward in self._portforwards.machine(self.ovc, self.space.id, machine_id)}
+        to_delete = sorted(set(existent) - wanted)
+        to_create = sorted(wanted - set(existent))
+
+        # ports forwarded to other VMs can't be taken over, fail before changing anything
+        deleted_ports = {(public_port, forward_protocol) for public_port, _, forward_protocol in to_delete}
+        self._check_portforwards(machine_id, [forward for forward in to_create
+                                              if (forward[0], forward[2]) not in deleted_ports])
+
+        # deletes go first to free public ports that are forwarded to another local port
+        for func, forwards in [(lambda forward: self._portforward_delete(existent[forward]), to_delete),
+                               (lambda forward: self._portforward_create(machine_id, *forward), to_create)]:
+            for _, err in bounded_map(func, forwards, concurrency):
+                if err is not None:
+                    raise err
+
+        def as_ports(forwards):
+            return [{'source': public_port, 'destination': local_port, 'protocol': forward_protocol}
+                    for public_port, local_port, forward_protocol in forwards]
+
+        return {'created': as_ports(to_create), 'deleted': as_ports(to_delete)}
 
     def user_authorize(self, vdcuser, accesstype='R'):
         """
@@ -280,12 +560,11 @@ class Vdc(TemplateBase):
             raise RuntimeError('"%s" is readonly cloudspace' % self.data['name'])
         
         # fetch list of authorized users to self.data['users']
-        users = self._get_users()
-
-        # derive service name from username
-        proxy = self.api.services.get(
-            template_uid=self.VDCUSER_TEMPLATE, name=vdcuser)
-        user_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        # and derive service name from username at once
+        users, user_info = parallel(
+            self._get_users,
+            lambda: fetch_info(self.api, self.VDCUSER_TEMPLATE, vdcuser),
+        )
         name = user_info['name']
 
         for existent_user in users:
@@ -297,6 +576,7 @@ class Vdc(TemplateBase):
                 break
             if self.space.update_access(username=name, right=accesstype):
                 existent_user['accesstype'] = accesstype
+                self._users.set(self.data['users'])
                 break
             # fail to update access type
             raise RuntimeError('failed to update accesstype of user "%s"' % name)
@@ -309,6 +589,7 @@ class Vdc(TemplateBase):
                     "accesstype": accesstype
                     }
                 self.data['users'].append(new_user)
+                self._users.set(self.data['users'])
             else:
                 raise RuntimeError('failed to add user "%s"' % name)
 
@@ -325,19 +606,18 @@ class Vdc(TemplateBase):
 
         self.state.check('actions', 'install', 'ok')
         
-        # fetch user name from the vdcuser service
-        proxy = self.api.services.get(
-            template_uid=self.VDCUSER_TEMPLATE, name=vdcuser)
-        user_info = proxy.schedule_action(action='get_info').wait(die=True).result
+        # fetch user name from the vdcuser service and user access on the cloudspace at once
+        user_info, users = parallel(
+            lambda: fetch_info(self.api, self.VDCUSER_TEMPLATE, vdcuser),
+            self._get_users,
+        )
         username = user_info['name']
 
-        # get user access on the cloudspace
-        users = self._get_users()
-
         for user in users:
             if username == user['name']:
                 if self.space.unauthorize_user(username=user['name']):
                     self.data['users'].remove(user)
+                    self._users.set(self.data['users'])
                     break
                 raise RuntimeError('failed to remove user "%s"' % username)
 
@@ -351,6 +631,7 @@ class Vdc(TemplateBase):
         :param maxNumPublicIP: The limit on the number of public IPs that can be used by the account.
         :param maxVDiskCapacity: The limit on the disk capacity that can be used by the account.
         :param maxNetworkPeerTransfer: Cloudspace limits, max sent/received network transfer peering(GB).
+        :return: dict of the limits that differed on the cloudspace and were saved
         """
 
         self.state.check('actions', 'install', 'ok')
@@ -358,22 +639,16 @@ class Vdc(TemplateBase):
             raise RuntimeError('"%s" is readonly cloudspace' % self.data['name'])
         # work around not supporting the **kwargs in actions call
         kwargs = locals()
-        kwargs.pop('self')
+        desired = {key: kwargs[key] for key in self.LIMITS if kwargs[key] is not None}
 
-        self.state.check('actions', 'install', 'ok')
         space = self.account.space_get(
             name=self.data['name'],
             create=False
         )
 
-        self.data.update(kwargs)
-
-        for key in ['maxMemoryCapacity', 'maxVDiskCapacity', 'maxNumPublicIP',
-                    'maxCPUCapacity', 'maxNetworkPeerTransfer']:
-            value = kwargs[key]
-            if value is not None:
-                updated = True
-                space.model[key] = self.data[key]
+        self.data.update(desired)
+        resolver.invalidate(self.name)
 
-        if updated:
-            space.save()
+        changes = save_changes(space, desired)
+        record(self.data, self.INSTALL_KEYS)
+        return changes
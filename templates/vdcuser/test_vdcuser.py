@@ -8,11 +8,15 @@ from js9 import j
 
 from zerorobot import config, template_collection
 from zerorobot.template.state import StateCheckError
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
 
 
 class TestVdcUser(TestCase):
     def setUp(self):
         config.DATA_DIR = '/tmp'
+        resolver.clear()
+        ovc_pool.clear()
         self.type = template_collection._load_template(
             "https://github.com/openvcloud/0-templates",
             os.path.dirname(__file__)
@@ -1,8 +1,19 @@
-from js9 import j
+import os
+import sys
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
 
+from ovc_utils.resolver import resolver
+from ovc_utils.clients import pool as ovc_pool
+from ovc_utils.metrics import instrument
+
+
+@instrument
 class Vdcuser(TemplateBase):
 
     version = '0.0.1'
@@ -10,10 +21,6 @@ class Vdcuser(TemplateBase):
 
     OVC_TEMPLATE = 'github.com/openvcloud/0-templates/openvcloud/0.0.1'
 
-    def __init__(self, name, guid=None, data=None):
-        super().__init__(name=name, guid=guid, data=data)
-        self._ovc = None
-
     def validate(self):
         """
         Validate service data received during creation
@@ -28,14 +35,8 @@ class Vdcuser(TemplateBase):
         """
         Get ovc client
         """
-        if not self._ovc:
-            # get ovc instance name
-            proxy = self.api.services.get(
-                template_uid=self.OVC_TEMPLATE, name=self.data['openvcloud'])
-            ovc_info = proxy.schedule_action(action='get_info').wait(die=True).result
-            self._ovc = j.clients.openvcloud.get(ovc_info['name'])
-
-        return self._ovc
+        ovc_name = resolver.ovc(self.api, self.data['openvcloud'])
+        return ovc_pool.get(ovc_name)
 
     def get_info(self):
         """ Return vdcuser info """
@@ -1,9 +1,19 @@
+import os
+import sys
 from js9 import j
 from zerorobot.template.base import TemplateBase
 from zerorobot.template.state import StateCheckError
-import gevent
 
+# 0-robot only loads the template directories, the shared helpers are in ovc_utils at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
 
+from ovc_utils.waiter import wait_for
+from ovc_utils.metrics import instrument
+
+
+@instrument
 class Zrobot(TemplateBase):
 
     version = '0.0.1'
@@ -107,12 +117,11 @@ class Zrobot(TemplateBase):
             }
         )
 
-        for i in range(10):
-            if j.sal.nettools.tcpPortConnectionTest(node.addr, self.data['port']):
-                break
-            gevent.sleep(3)
-        else:
-            raise Exception('can not connect to robot "%s"' % self.name)
+        wait_for(
+            lambda: j.sal.nettools.tcpPortConnectionTest(node.addr, self.data['port']),
+            timeout=30,
+            message='can not connect to robot "%s"' % self.name,
+        )
 
         j.clients.zrobot.get(
             self.name,